@@ -0,0 +1,29 @@
+"""Add master_data change counter
+
+Revision ID: e5b7d9f1a3c6
+Revises: d9b3f5e7a1c4
+Create Date: 2026-10-17 21:05:12.448310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b7d9f1a3c6'
+down_revision: Union[str, None] = 'd9b3f5e7a1c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+change_counters = sa.table('change_counters', sa.column('name', sa.String), sa.column('last_value', sa.Integer))
+
+
+def upgrade() -> None:
+    # 主病名・シート名・テンプレートの編集回数（マスタのキャッシュが他の端末での編集を検出する）
+    op.execute(change_counters.insert().values(name='master_data', last_value=0))
+
+
+def downgrade() -> None:
+    op.execute(change_counters.delete().where(change_counters.c.name == 'master_data'))
@@ -4,7 +4,7 @@ import flet as ft
 
 from app import __date__
 from app import __version__
-from services.data_export_service import export_to_csv, import_from_csv
+from services.data_export_service import export_changes_to_csv, export_to_csv, import_from_csv
 
 
 class DialogManager:
@@ -64,10 +64,15 @@ class DialogManager:
             self._export_to_csv_ui(e, export_folder)
             close_dialog(e)
 
+        def csv_export_changes(e):
+            self._export_changes_to_csv_ui(e, export_folder)
+            close_dialog(e)
+
         content = ft.Container(
             content=ft.Column([
                 ft.Text(f"LDTPapp\nバージョン: {__version__}\n最終更新日: {__date__}"),
                 ft.ElevatedButton("CSV出力", on_click=csv_export),
+                ft.ElevatedButton("CSV出力（前回からの変更分）", on_click=csv_export_changes),
                 ft.ElevatedButton("CSV取込", on_click=lambda _: self.file_picker.pick_files()),
             ]),
             height=self.page.window.height * 0.3,
@@ -93,12 +98,12 @@ class DialogManager:
 
     def _import_csv(self, file_path):
         """CSVファイルからデータをインポート"""
-        error = import_from_csv(file_path)
-        if error:
-            duration = 3000 if "インポート中に" in error else 1000
-            self.show_info_message(error, duration=duration)
+        report = import_from_csv(file_path)
+        if report.fatal and not report.imported:
+            duration = 3000 if "インポート中に" in report.fatal else 1000
+            self.show_info_message(report.fatal, duration=duration)
         else:
-            self.show_info_message("CSVファイルからデータがインポートされました")
+            self.show_info_message(report.summary(), duration=1000 if report.ok else 3000)
             if self.update_history_callback:
                 patient_id = self.fields.get('patient_id')
                 if patient_id and patient_id.value:
@@ -111,4 +116,20 @@ class DialogManager:
             self.show_info_message(f"エクスポート中にエラーが発生しました: {error}")
         else:
             self.show_info_message(f"データがCSVファイル '{csv_filename}' にエクスポートされました")
-            os.startfile(export_folder)
+            self._open_export_folder(export_folder)
+
+    def _export_changes_to_csv_ui(self, e, export_folder):
+        """前回の差分出力から変更されたデータだけをCSVファイルにエクスポート"""
+        result = export_changes_to_csv(export_folder)
+        if result.error:
+            self.show_info_message(f"エクスポート中にエラーが発生しました: {result.error}")
+        elif result.csv_filename is None:
+            self.show_info_message("前回のエクスポートから変更されたデータはありません")
+        else:
+            self.show_info_message(
+                f"変更された{result.row_count}件がCSVファイル '{result.csv_filename}' にエクスポートされました")
+            self._open_export_folder(export_folder)
+
+    def _open_export_folder(self, export_folder):
+        """出力先のフォルダをエクスプローラーで開く"""
+        os.startfile(export_folder)
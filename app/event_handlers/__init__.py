@@ -3,6 +3,9 @@ from typing import Any, Callable, Dict, Optional
 import flet as ft
 import pandas as pd
 
+from services.patient_service import PatientRoster
+from services.plan_job_queue import PlanJobQueue
+from services.ui_task_runner import UITaskRunner
 from .data_operations import DataOperationsMixin
 from .form_operations import FormOperationsMixin
 from .template_operations import TemplateOperationsMixin
@@ -24,7 +27,10 @@ class EventHandlers(
         page: ft.Page,
         fields: Dict[str, Any],
         df_patients: Optional[pd.DataFrame],
-        dialog_manager: Any
+        dialog_manager: Any,
+        plan_job_queue: Optional[PlanJobQueue] = None,
+        patient_roster: Optional[PatientRoster] = None,
+        task_runner: Optional[UITaskRunner] = None
     ) -> None:
         """
         初期化
@@ -34,11 +40,18 @@ class EventHandlers(
             fields: フォームフィールドの辞書
             df_patients: 患者CSVのDataFrame
             dialog_manager: DialogManagerインスタンス
+            plan_job_queue: 計画書生成キュー（省略時は新規作成）
+            patient_roster: 患者CSVの索引（省略時はdf_patientsから作成）
+            task_runner: DB・ファイル処理の実行先（省略時は新規作成）
         """
         self.page: ft.Page = page
         self.fields: Dict[str, Any] = fields
         self.df_patients: Optional[pd.DataFrame] = df_patients
+        self.patient_roster: PatientRoster = patient_roster or PatientRoster.from_dataframe(df_patients)
         self.dialog_manager: Any = dialog_manager
+        self.plan_job_queue: PlanJobQueue = plan_job_queue or PlanJobQueue()
+        self.task_runner: UITaskRunner = task_runner or UITaskRunner()
+        self.file_observer: Optional[Any] = None
         self.selected_row: Optional[Dict[str, Any]] = None
         self.route_manager: Optional[Any] = None
         self.update_history: Optional[Callable[[Optional[str]], None]] = None
@@ -3,8 +3,6 @@ from typing import Any
 
 from database import get_session_factory
 from models import PatientInfo
-from services.patient_service import load_patient_data
-from services.treatment_plan_service import generate_plan
 from utils.date_utils import calculate_issue_date_age
 
 Session = get_session_factory()
@@ -17,142 +15,178 @@ class DataOperationsMixin:
     fields: dict[str, Any]
     dialog_manager: Any
     selected_row: dict[str, Any] | None
+    patient_roster: Any
+    _form_values: Any
     _update_patient_info_from_form: Any
     _populate_form_from_patient_info: Any
     update_history: Any
+    plan_job_queue: Any
+    task_runner: Any
+    _on_plan_generated: Any
+    _show_task_error: Any
 
     def save_data(self, e: Any) -> None:
-        """データ保存ハンドラ"""
-        session = Session()
-
-        if self.selected_row is not None and 'id' in self.selected_row:
-            patient_info = session.query(PatientInfo).filter(
-                PatientInfo.id == self.selected_row['id']).first()
-
-            if patient_info:
-                if not self.dialog_manager.check_required_fields():
-                    return
-
-                self._update_patient_info_from_form(patient_info, include_basic_info=True)
+        """データ保存ハンドラ（保存はワーカースレッドで実行）"""
+        if self.selected_row is None or 'id' not in self.selected_row:
+            return
+        if not self.dialog_manager.check_required_fields():
+            return
+        row_id = self.selected_row['id']
+        # フォームの値はUIスレッドで読み、ワーカースレッドには写しを渡す
+        values = self._form_values()
+
+        def save() -> bool:
+            session = Session()
+            try:
+                patient_info = session.query(PatientInfo).filter(PatientInfo.id == row_id).first()
+                if not patient_info:
+                    return False
+                self._update_patient_info_from_form(patient_info, values, include_basic_info=True)
                 session.commit()
+                return True
+            finally:
+                session.close()
 
+        def show_result(saved: bool) -> None:
+            if saved:
                 self.dialog_manager.show_info_message("データが保存されました")
+            self.page.update()
 
-        session.close()
-        self.page.update()
+        self.task_runner.submit(save, show_result, self._show_task_error)
 
     def copy_data(self, e: Any) -> None:
-        """データコピーハンドラ"""
-        patient_id = self.fields['patient_id']
-        session = Session()
-        patient_info = session.query(PatientInfo). \
-            filter(PatientInfo.patient_id == patient_id.value). \
-            order_by(PatientInfo.id.desc()).first()
-
-        if patient_info:
-            error_message, df_patients = load_patient_data()
-            if error_message or df_patients is None:
+        """データコピーハンドラ（コピーはワーカースレッドで実行）"""
+        patient_id_value = self.fields['patient_id'].value
+
+        def copy() -> Any:
+            session = Session()
+            try:
+                patient_info = session.query(PatientInfo). \
+                    filter(PatientInfo.patient_id == patient_id_value). \
+                    order_by(PatientInfo.id.desc()).first()
+                if not patient_info:
+                    return None
+
+                # 索引はCSVが更新されていれば読み直す
+                patient_csv_info = self.patient_roster.get(patient_id_value)
+                if patient_csv_info is None:
+                    return None
+
+                patient_info_copy = PatientInfo(
+                    patient_id=patient_info.patient_id,
+                    patient_name=patient_info.patient_name,
+                    kana=patient_info.kana,
+                    gender=patient_info.gender,
+                    birthdate=patient_info.birthdate,
+                    issue_date=datetime.now().date(),
+                    issue_date_age=calculate_issue_date_age(patient_info.birthdate, datetime.now().date()),
+                    doctor_id=patient_csv_info.doctor_id,
+                    doctor_name=patient_csv_info.doctor_name,
+                    department=patient_csv_info.department,
+                    department_id=patient_csv_info.department_id,
+                    main_diagnosis=patient_info.main_diagnosis,
+                    sheet_name=patient_info.sheet_name,
+                    creation_count=patient_info.creation_count + 1,
+                    target_weight=patient_info.target_weight,
+                    target_bp=patient_info.target_bp,
+                    target_hba1c=patient_info.target_hba1c,
+                    goal1=patient_info.goal1,
+                    goal2=patient_info.goal2,
+                    target_achievement=patient_info.target_achievement,
+                    diet1=patient_info.diet1,
+                    diet2=patient_info.diet2,
+                    diet3=patient_info.diet3,
+                    diet4=patient_info.diet4,
+                    diet_comment=patient_info.diet_comment,
+                    exercise_prescription=patient_info.exercise_prescription,
+                    exercise_time=patient_info.exercise_time,
+                    exercise_frequency=patient_info.exercise_frequency,
+                    exercise_intensity=patient_info.exercise_intensity,
+                    daily_activity=patient_info.daily_activity,
+                    exercise_comment=patient_info.exercise_comment,
+                    nonsmoker=patient_info.nonsmoker,
+                    smoking_cessation=patient_info.smoking_cessation,
+                    other1=patient_info.other1,
+                    other2=patient_info.other2,
+                    ophthalmology=patient_info.ophthalmology,
+                    dental=patient_info.dental,
+                    cancer_screening=patient_info.cancer_screening
+                )
+                session.add(patient_info_copy)
+                session.commit()
+                return patient_info_copy.id
+            finally:
                 session.close()
-                return
 
-            patient_csv_info = df_patients[df_patients.iloc[:, 2] == int(patient_id.value)]
-            if patient_csv_info.empty:
-                session.close()
-                return
-
-            patient_csv_info = patient_csv_info.iloc[0]
-
-            patient_info_copy = PatientInfo(
-                patient_id=patient_info.patient_id,
-                patient_name=patient_info.patient_name,
-                kana=patient_info.kana,
-                gender=patient_info.gender,
-                birthdate=patient_info.birthdate,
-                issue_date=datetime.now().date(),
-                issue_date_age=calculate_issue_date_age(patient_info.birthdate, datetime.now().date()),
-                doctor_id=int(patient_csv_info.iloc[9]),
-                doctor_name=patient_csv_info.iloc[10],
-                department=patient_csv_info.iloc[14],
-                department_id=int(patient_csv_info.iloc[13]),
-                main_diagnosis=patient_info.main_diagnosis,
-                sheet_name=patient_info.sheet_name,
-                creation_count=patient_info.creation_count + 1,
-                target_weight=patient_info.target_weight,
-                target_bp=patient_info.target_bp,
-                target_hba1c=patient_info.target_hba1c,
-                goal1=patient_info.goal1,
-                goal2=patient_info.goal2,
-                target_achievement=patient_info.target_achievement,
-                diet1=patient_info.diet1,
-                diet2=patient_info.diet2,
-                diet3=patient_info.diet3,
-                diet4=patient_info.diet4,
-                diet_comment=patient_info.diet_comment,
-                exercise_prescription=patient_info.exercise_prescription,
-                exercise_time=patient_info.exercise_time,
-                exercise_frequency=patient_info.exercise_frequency,
-                exercise_intensity=patient_info.exercise_intensity,
-                daily_activity=patient_info.daily_activity,
-                exercise_comment=patient_info.exercise_comment,
-                nonsmoker=patient_info.nonsmoker,
-                smoking_cessation=patient_info.smoking_cessation,
-                other1=patient_info.other1,
-                other2=patient_info.other2,
-                ophthalmology=patient_info.ophthalmology,
-                dental=patient_info.dental,
-                cancer_screening=patient_info.cancer_screening
-            )
-            session.add(patient_info_copy)
-            session.commit()
-
-            self.dialog_manager.show_info_message("データがコピーされました")
-            self.select_copied_data(patient_info_copy.id)
-
-        session.close()
+        def show_result(copied_id: Any) -> None:
+            if copied_id is not None:
+                self.dialog_manager.show_info_message("データがコピーされました")
+                self.select_copied_data(copied_id)
+
+        self.task_runner.submit(copy, show_result, self._show_task_error)
 
     def select_copied_data(self, copied_id: Any) -> None:
         """コピーしたデータを選択"""
-        session = Session()
-        patient_info = session.query(PatientInfo).filter(PatientInfo.id == copied_id).first()
+        def load() -> Any:
+            session = Session()
+            try:
+                return session.query(PatientInfo).filter(PatientInfo.id == copied_id).first()
+            finally:
+                session.close()
 
-        if patient_info:
-            self.selected_row = {'id': patient_info.id}
-            self._populate_form_from_patient_info(patient_info, session)
-            self.update_history(patient_info.patient_id)
+        def show(patient_info: Any) -> None:
+            if patient_info:
+                self.selected_row = {'id': patient_info.id}
+                self._populate_form_from_patient_info(patient_info)
+                self.update_history(patient_info.patient_id)
+            self.page.update()
 
-        session.close()
-        self.page.update()
+        self.task_runner.submit(load, show, self._show_task_error, key='form')
 
     def delete_data(self, e: Any) -> None:
-        """データ削除ハンドラ"""
+        """データ削除ハンドラ（削除はワーカースレッドで実行）"""
         if self.selected_row is None:
             self.dialog_manager.show_error_message("削除するデータが選択されていません")
             return
+        row_id = self.selected_row['id']
+
+        def delete() -> Any:
+            session = Session()
+            try:
+                patient_info = session.query(PatientInfo).filter(PatientInfo.id == row_id).first()
+                if not patient_info:
+                    return None
+                patient_id_val = patient_info.patient_id
+                session.delete(patient_info)
+                session.commit()
+                return patient_id_val
+            finally:
+                session.close()
 
-        session = Session()
-        patient_info = session.query(PatientInfo).filter(
-            PatientInfo.id == self.selected_row['id']).first()
-
-        if patient_info:
-            patient_id_val = patient_info.patient_id
-            session.delete(patient_info)
-            session.commit()
-            self.selected_row = None
-            self.update_history(patient_id_val)
+        def show_result(patient_id_val: Any) -> None:
+            if patient_id_val is not None:
+                self.selected_row = None
+                self.update_history(patient_id_val)
+            self.page.go("/")
 
-        session.close()
-        self.page.go("/")
+        self.task_runner.submit(delete, show_result, self._show_task_error)
 
     def print_plan(self, e: Any) -> None:
-        """印刷ハンドラ"""
-        session = Session()
-        if self.selected_row is not None:
-            patient_info = session.query(PatientInfo).filter(
-                PatientInfo.id == self.selected_row['id']).first()
-
-            if patient_info:
-                self._update_patient_info_from_form(patient_info)
-                session.commit()
-                generate_plan(patient_info, "LDTPform")
+        """印刷ハンドラ（保存はワーカースレッドで実行し、計画書はバックグラウンドで生成）"""
+        if self.selected_row is None:
+            return
+        row_id = self.selected_row['id']
+        values = self._form_values()
+
+        def save_and_print() -> None:
+            session = Session()
+            try:
+                patient_info = session.query(PatientInfo).filter(PatientInfo.id == row_id).first()
+                if patient_info:
+                    self._update_patient_info_from_form(patient_info, values)
+                    session.commit()
+                    self.plan_job_queue.submit(patient_info, self._on_plan_generated)
+            finally:
+                session.close()
 
-        session.close()
+        self.task_runner.submit(save_and_print, on_error=self._show_task_error)
@@ -1,14 +1,10 @@
 from datetime import datetime
 from typing import Any
 
-from database import get_session_factory
-from models import MainDisease
-from services.patient_service import load_main_diseases, load_sheet_names
+from services.master_data_cache import get_master_data
 from utils.date_utils import calculate_issue_date_age
 from utils.file_utils import format_date
 
-Session = get_session_factory()
-
 
 class FormOperationsMixin:
     """フォーム操作を提供するMixin"""
@@ -16,8 +12,10 @@ class FormOperationsMixin:
     page: Any
     fields: dict[str, Any]
     df_patients: Any
+    patient_roster: Any
+    update_history: Any
 
-    def _populate_form_from_patient_info(self, patient_info: Any, session: Any) -> None:
+    def _populate_form_from_patient_info(self, patient_info: Any) -> None:
         """患者情報から登録フォームを設定"""
         fields = self.fields
 
@@ -26,15 +24,13 @@ class FormOperationsMixin:
             "%Y/%m/%d") if patient_info.issue_date else ""
 
         # 主病名の更新
-        fields['main_diagnosis'].options = load_main_diseases()
+        master_data = get_master_data()
+        fields['main_diagnosis'].options = master_data.main_disease_options()
         fields['main_diagnosis'].value = patient_info.main_diagnosis
 
-        # シート名の更新
-        main_disease = session.query(MainDisease).filter_by(name=patient_info.main_diagnosis).first()
-        if main_disease:
-            fields['sheet_name_dropdown'].options = load_sheet_names(main_disease.id)
-        else:
-            fields['sheet_name_dropdown'].options = load_sheet_names()
+        # シート名の更新（主病名が登録されていなければ全シート名）
+        fields['sheet_name_dropdown'].options = master_data.sheet_name_options(
+            master_data.disease_id(patient_info.main_diagnosis))
         fields['sheet_name_dropdown'].value = patient_info.sheet_name
 
         # 各フィールドの更新
@@ -64,69 +60,70 @@ class FormOperationsMixin:
         fields['dental'].value = patient_info.dental
         fields['cancer_screening'].value = patient_info.cancer_screening
 
-    def _update_patient_info_from_form(self, patient_info: Any, include_basic_info: bool = False) -> None:
-        """登録フォームから患者情報を更新"""
-        fields = self.fields
+    def _form_values(self) -> dict[str, Any]:
+        """登録フォームの入力値の写し（UIスレッドで取得し、ワーカースレッドにはこの写しを渡す）"""
+        return {name: control.value for name, control in self.fields.items() if hasattr(control, 'value')}
 
+    def _update_patient_info_from_form(self, patient_info: Any, values: dict[str, Any],
+                                       include_basic_info: bool = False) -> None:
+        """登録フォームの入力値（_form_valuesの写し）から患者情報を更新"""
         if include_basic_info:
-            patient_info.patient_id = int(fields['patient_id'].value)
-            patient_info.patient_name = fields['name_value'].value
-            patient_info.kana = fields['kana_value'].value
-            patient_info.gender = fields['gender_value'].value
-            patient_info.birthdate = datetime.strptime(fields['birthdate_value'].value, "%Y/%m/%d").date()
-            patient_info.doctor_id = int(fields['doctor_id_value'].value)
-            patient_info.doctor_name = fields['doctor_name_value'].value
-            patient_info.department = fields['department_value'].value
-            patient_info.department_id = int(fields['department_id_value'].value)
-
-        patient_info.main_diagnosis = fields['main_diagnosis'].value
-        patient_info.sheet_name = fields['sheet_name_dropdown'].value
-        patient_info.creation_count = int(fields['creation_count'].value)
-        patient_info.issue_date = datetime.strptime(fields['issue_date_value'].value, "%Y/%m/%d").date()
+            patient_info.patient_id = int(values['patient_id'])
+            patient_info.patient_name = values['name_value']
+            patient_info.kana = values['kana_value']
+            patient_info.gender = values['gender_value']
+            patient_info.birthdate = datetime.strptime(values['birthdate_value'], "%Y/%m/%d").date()
+            patient_info.doctor_id = int(values['doctor_id_value'])
+            patient_info.doctor_name = values['doctor_name_value']
+            patient_info.department = values['department_value']
+            patient_info.department_id = int(values['department_id_value'])
+
+        patient_info.main_diagnosis = values['main_diagnosis']
+        patient_info.sheet_name = values['sheet_name_dropdown']
+        patient_info.creation_count = int(values['creation_count'])
+        patient_info.issue_date = datetime.strptime(values['issue_date_value'], "%Y/%m/%d").date()
         patient_info.issue_date_age = calculate_issue_date_age(patient_info.birthdate, patient_info.issue_date)
-        patient_info.target_weight = float(fields['target_weight'].value) if fields['target_weight'].value else None
-        patient_info.target_bp = fields['target_bp'].value
-        patient_info.target_hba1c = fields['target_hba1c'].value
-        patient_info.goal1 = fields['goal1'].value
-        patient_info.goal2 = fields['goal2'].value
-        patient_info.target_achievement = fields['target_achievement'].value
-        patient_info.diet1 = fields['diet1'].value
-        patient_info.diet2 = fields['diet2'].value
-        patient_info.diet3 = fields['diet3'].value
-        patient_info.diet4 = fields['diet4'].value
-        patient_info.diet_comment = fields['diet_comment'].value
-        patient_info.exercise_prescription = fields['exercise_prescription'].value
-        patient_info.exercise_time = fields['exercise_time'].value
-        patient_info.exercise_frequency = fields['exercise_frequency'].value
-        patient_info.exercise_intensity = fields['exercise_intensity'].value
-        patient_info.daily_activity = fields['daily_activity'].value
-        patient_info.exercise_comment = fields['exercise_comment'].value
-        patient_info.nonsmoker = fields['nonsmoker'].value
-        patient_info.smoking_cessation = fields['smoking_cessation'].value
-        patient_info.other1 = fields['other1'].value
-        patient_info.other2 = fields['other2'].value
-        patient_info.ophthalmology = fields['ophthalmology'].value
-        patient_info.dental = fields['dental'].value
-        patient_info.cancer_screening = fields['cancer_screening'].value
+        patient_info.target_weight = float(values['target_weight']) if values['target_weight'] else None
+        patient_info.target_bp = values['target_bp']
+        patient_info.target_hba1c = values['target_hba1c']
+        patient_info.goal1 = values['goal1']
+        patient_info.goal2 = values['goal2']
+        patient_info.target_achievement = values['target_achievement']
+        patient_info.diet1 = values['diet1']
+        patient_info.diet2 = values['diet2']
+        patient_info.diet3 = values['diet3']
+        patient_info.diet4 = values['diet4']
+        patient_info.diet_comment = values['diet_comment']
+        patient_info.exercise_prescription = values['exercise_prescription']
+        patient_info.exercise_time = values['exercise_time']
+        patient_info.exercise_frequency = values['exercise_frequency']
+        patient_info.exercise_intensity = values['exercise_intensity']
+        patient_info.daily_activity = values['daily_activity']
+        patient_info.exercise_comment = values['exercise_comment']
+        patient_info.nonsmoker = values['nonsmoker']
+        patient_info.smoking_cessation = values['smoking_cessation']
+        patient_info.other1 = values['other1']
+        patient_info.other2 = values['other2']
+        patient_info.ophthalmology = values['ophthalmology']
+        patient_info.dental = values['dental']
+        patient_info.cancer_screening = values['cancer_screening']
 
     def load_patient_info(self, patient_id_arg: int) -> None:
         """患者情報を読み込む"""
         fields = self.fields
-        patient_info = self.df_patients[self.df_patients.iloc[:, 2] == patient_id_arg]
+        patient_info = self.patient_roster.get(patient_id_arg)
 
-        if not patient_info.empty:
-            patient_info = patient_info.iloc[0]
+        if patient_info is not None:
             fields['patient_id'].value = str(patient_id_arg)
             fields['issue_date_value'].value = datetime.now().date().strftime("%Y/%m/%d")
-            fields['name_value'].value = patient_info.iloc[3]
-            fields['kana_value'].value = patient_info.iloc[4]
-            fields['gender_value'].value = "男性" if patient_info.iloc[5] == 1 else "女性"
-            birthdate = patient_info.iloc[6]
-            fields['birthdate_value'].value = format_date(birthdate)
-            fields['doctor_id_value'].value = str(patient_info.iloc[9])
-            fields['doctor_name_value'].value = patient_info.iloc[10]
-            fields['department_value'].value = patient_info.iloc[14]
-            fields['department_id_value'].value = str(patient_info.iloc[13])
+            fields['name_value'].value = patient_info.name
+            fields['kana_value'].value = patient_info.kana
+            fields['gender_value'].value = patient_info.gender
+            fields['birthdate_value'].value = format_date(patient_info.birthdate)
+            fields['doctor_id_value'].value = str(patient_info.doctor_id)
+            fields['doctor_name_value'].value = patient_info.doctor_name
+            fields['department_value'].value = patient_info.department
+            fields['department_id_value'].value = str(patient_info.department_id)
         else:
             # patient_infoが空の場合は空文字列を設定
             fields['issue_date_value'].value = ""
@@ -139,3 +136,18 @@ class FormOperationsMixin:
             fields['department_value'].value = ""
 
         self.page.update()
+
+    def reload_patient_roster(self) -> None:
+        """患者CSVの更新を反映し、表示中の患者情報を更新する（ファイル監視のスレッドから呼ばれる）"""
+        change = self.patient_roster.reload()
+        if self.patient_roster.error_message:
+            return
+
+        current_id = str(self.fields['patient_id'].value or "")
+        if change.first_changed and change.first_patient_id is not None and self.page.route == "/":
+            # 電子カルテで次の患者が開かれたので、起動時と同じく先頭の患者を表示する
+            self.load_patient_info(change.first_patient_id)
+            if self.update_history:
+                self.update_history(str(change.first_patient_id))
+        elif current_id.isdigit() and int(current_id) in change.patient_ids:
+            self.load_patient_info(int(current_id))
@@ -2,6 +2,7 @@ from typing import Any
 
 from database import get_session_factory
 from models import Template
+from services.master_data_cache import get_master_data, get_master_data_cache
 
 Session = get_session_factory()
 
@@ -12,6 +13,8 @@ class TemplateOperationsMixin:
     page: Any
     fields: dict[str, Any]
     dialog_manager: Any
+    task_runner: Any
+    _show_task_error: Any
 
     def apply_template(self, e: Any) -> None:
         """テンプレート適用ハンドラ"""
@@ -23,17 +26,15 @@ class TemplateOperationsMixin:
         selected_sheet_name = sheet_name_dropdown.value
 
         if selected_main_disease and selected_sheet_name:
-            session = Session()
-            template = session.query(Template).filter_by(
-                main_disease=selected_main_disease,
-                sheet_name=selected_sheet_name
-            ).first()
+            def find_template() -> Any:
+                return get_master_data().template(selected_main_disease, selected_sheet_name)
 
-            if template:
-                self._apply_template_to_fields(template)
-                self.page.update()
+            def show(template: Any) -> None:
+                if template:
+                    self._apply_template_to_fields(template)
+                    self.page.update()
 
-            session.close()
+            self.task_runner.submit(find_template, show, self._show_task_error, key='template')
 
     def _apply_template_to_fields(self, template: Any) -> None:
         """テンプレートをフィールドに適用"""
@@ -81,6 +82,7 @@ class TemplateOperationsMixin:
         self._update_template_from_fields(template)
         session.commit()
         session.close()
+        get_master_data_cache().invalidate()
 
         self.dialog_manager.show_info_message("テンプレートが保存されました")
 
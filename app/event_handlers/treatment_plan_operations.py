@@ -1,9 +1,9 @@
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Optional
 
 from database import get_session_factory
 from models import PatientInfo
-from services.treatment_plan_service import generate_plan
+from services.patient_service import as_patient_roster
 from utils.date_utils import calculate_issue_date_age
 
 Session = get_session_factory()
@@ -15,40 +15,43 @@ class TreatmentPlanOperationsMixin:
     fields: dict[str, Any]
     dialog_manager: Any
     df_patients: Any
+    patient_roster: Any
     update_history: Any
     route_manager: Any
+    plan_job_queue: Any
+    task_runner: Any
+    _form_values: Callable[[], dict[str, Any]]
+    _show_task_error: Any
 
     def create_new_plan_and_print(self, e: Any) -> None:
-        """新規登録して印刷ハンドラ"""
+        """新規登録して印刷ハンドラ（保存はワーカースレッドで実行し、計画書はバックグラウンドで生成）"""
         if not self.dialog_manager.check_required_fields():
             return
 
-        fields = self.fields
-        p_id = fields['patient_id'].value
-        doctor_id = fields['doctor_id_value'].value
-        doctor_name = fields['doctor_name_value'].value
-        department_id = fields['department_id_value'].value
-        department = fields['department_value'].value
+        # フォームの値はUIスレッドで読み、ワーカースレッドには写しを渡す
+        values = self._form_values()
+        p_id = values['patient_id']
 
-        try:
+        def save() -> None:
             patient_info = self.create_treatment_plan_object(
-                int(p_id), int(doctor_id), doctor_name, department, int(department_id), self.df_patients)
-            
+                int(p_id), int(values['doctor_id_value']), values['doctor_name_value'], values['department_value'],
+                int(values['department_id_value']), self.patient_roster, values)
+
             # データベースに保存
             session = Session()
-            session.add(patient_info)
-            session.commit()
-            
-            # 計画書を生成（セッションを閉じる前に実行）
-            generate_plan(patient_info, "LDTPform")
-            
-            # セッションを閉じる
-            session.close()
-            
+            try:
+                session.add(patient_info)
+                session.commit()
+                # 計画書はバックグラウンドで生成（スナップショットを取るためセッションを閉じる前に登録）
+                self.plan_job_queue.submit(patient_info, self._on_plan_generated)
+            finally:
+                session.close()
+
+        def show_result(_: Any) -> None:
             self.update_history(int(p_id))
-            self.dialog_manager.show_info_message("データを保存して計画書を作成しました")
-        except ValueError as ve:
-            self.dialog_manager.show_error_message(str(ve))
+            self.dialog_manager.show_info_message("データを保存しました。計画書を作成しています")
+
+        self.task_runner.submit(save, show_result, self._show_plan_error)
 
         if self.route_manager:
             self.route_manager.open_route(e)
@@ -66,28 +69,29 @@ class TreatmentPlanOperationsMixin:
         department = fields['department_value'].value
 
         self.save_treatment_plan(int(p_id), int(doctor_id), doctor_name,
-                                department, int(department_id), self.df_patients)
+                                department, int(department_id), self.patient_roster)
 
         if self.route_manager:
             self.route_manager.open_route(e)
 
-    def create_treatment_plan_object(self, p_id: int, doctor_id: int, doctor_name: str, department: str, department_id: int, patients_df: Any) -> PatientInfo:
-        """生活習慣病計画書オブジェクトを作成"""
-        patient_info_csv = patients_df.loc[patients_df.iloc[:, 2] == p_id]
-        if patient_info_csv.empty:
+    def create_treatment_plan_object(self, p_id: int, doctor_id: int, doctor_name: str, department: str, department_id: int, patients_df: Any,
+                                     values: Optional[dict[str, Any]] = None) -> PatientInfo:
+        """生活習慣病計画書オブジェクトを作成（valuesはフォームの入力値の写し。省略時はフォームから読む）"""
+        if values is None:
+            values = self._form_values()
+        patient_info = as_patient_roster(patients_df).get(p_id)
+        if patient_info is None:
             raise ValueError(f"患者ID {p_id} が見つかりません。")
 
-        patient_info = patient_info_csv.iloc[0]
-        birthdate = patient_info.iloc[6]
-        issue_date = datetime.strptime(self.fields['issue_date_value'].value, "%Y/%m/%d").date()
+        birthdate = patient_info.birthdate
+        issue_date = datetime.strptime(values['issue_date_value'], "%Y/%m/%d").date()
         issue_date_age = calculate_issue_date_age(birthdate, issue_date)
 
-        fields = self.fields
         return PatientInfo(
             patient_id=p_id,
-            patient_name=patient_info.iloc[3],
-            kana=patient_info.iloc[4],
-            gender="男性" if patient_info.iloc[5] == 1 else "女性",
+            patient_name=patient_info.name,
+            kana=patient_info.kana,
+            gender=patient_info.gender,
             birthdate=birthdate,
             issue_date=issue_date,
             issue_date_age=issue_date_age,
@@ -95,33 +99,33 @@ class TreatmentPlanOperationsMixin:
             doctor_name=doctor_name,
             department=department,
             department_id=department_id,
-            main_diagnosis=fields['main_diagnosis'].value,
-            sheet_name=fields['sheet_name_dropdown'].value,
-            creation_count=int(fields['creation_count'].value),
-            target_weight=float(fields['target_weight'].value) if fields['target_weight'].value else None,
-            target_bp=fields['target_bp'].value,
-            target_hba1c=fields['target_hba1c'].value,
-            goal1=fields['goal1'].value,
-            goal2=fields['goal2'].value,
-            target_achievement=fields['target_achievement'].value,
-            diet1=fields['diet1'].value,
-            diet2=fields['diet2'].value,
-            diet3=fields['diet3'].value,
-            diet4=fields['diet4'].value,
-            diet_comment=fields['diet_comment'].value,
-            exercise_prescription=fields['exercise_prescription'].value,
-            exercise_time=fields['exercise_time'].value,
-            exercise_frequency=fields['exercise_frequency'].value,
-            exercise_intensity=fields['exercise_intensity'].value,
-            daily_activity=fields['daily_activity'].value,
-            exercise_comment=fields['exercise_comment'].value,
-            nonsmoker=fields['nonsmoker'].value,
-            smoking_cessation=fields['smoking_cessation'].value,
-            other1=fields['other1'].value,
-            other2=fields['other2'].value,
-            ophthalmology=fields['ophthalmology'].value,
-            dental=fields['dental'].value,
-            cancer_screening=fields['cancer_screening'].value
+            main_diagnosis=values['main_diagnosis'],
+            sheet_name=values['sheet_name_dropdown'],
+            creation_count=int(values['creation_count']),
+            target_weight=float(values['target_weight']) if values['target_weight'] else None,
+            target_bp=values['target_bp'],
+            target_hba1c=values['target_hba1c'],
+            goal1=values['goal1'],
+            goal2=values['goal2'],
+            target_achievement=values['target_achievement'],
+            diet1=values['diet1'],
+            diet2=values['diet2'],
+            diet3=values['diet3'],
+            diet4=values['diet4'],
+            diet_comment=values['diet_comment'],
+            exercise_prescription=values['exercise_prescription'],
+            exercise_time=values['exercise_time'],
+            exercise_frequency=values['exercise_frequency'],
+            exercise_intensity=values['exercise_intensity'],
+            daily_activity=values['daily_activity'],
+            exercise_comment=values['exercise_comment'],
+            nonsmoker=values['nonsmoker'],
+            smoking_cessation=values['smoking_cessation'],
+            other1=values['other1'],
+            other2=values['other2'],
+            ophthalmology=values['ophthalmology'],
+            dental=values['dental'],
+            cancer_screening=values['cancer_screening']
         )
 
     def create_treatment_plan(self, p_id: int, doctor_id: int, doctor_name: str, department: str, department_id: int, patients_df: Any) -> None:
@@ -129,23 +133,42 @@ class TreatmentPlanOperationsMixin:
         try:
             patient_info = self.create_treatment_plan_object(
                 p_id, doctor_id, doctor_name, department, department_id, patients_df)
-            generate_plan(patient_info, "LDTPform")
+            self.plan_job_queue.submit(patient_info, self._on_plan_generated)
         except ValueError as ve:
             self.dialog_manager.show_error_message(str(ve))
 
+    def _on_plan_generated(self, job: Any) -> None:
+        """計画書生成ジョブの完了通知"""
+        if job.succeeded:
+            self.dialog_manager.show_info_message("計画書を作成しました")
+        else:
+            self.dialog_manager.show_error_message(f"計画書の作成に失敗しました: {job.error}")
+
     def save_treatment_plan(self, p_id: int, doctor_id: int, doctor_name: str, department: str, department_id: int, patients_df: Any) -> None:
-        """計画書を保存"""
-        try:
+        """計画書を保存（保存はワーカースレッドで実行）"""
+        values = self._form_values()
+
+        def save() -> None:
             patient_info = self.create_treatment_plan_object(
-                p_id, doctor_id, doctor_name, department, department_id, patients_df)
+                p_id, doctor_id, doctor_name, department, department_id, patients_df, values)
 
             # データベースに保存
             session = Session()
-            session.add(patient_info)
-            session.commit()
-            session.close()
+            try:
+                session.add(patient_info)
+                session.commit()
+            finally:
+                session.close()
 
+        def show_result(_: Any) -> None:
             self.dialog_manager.show_info_message("データが保存されました")
             self.update_history(p_id)
-        except ValueError as ve:
-            self.dialog_manager.show_error_message(str(ve))
+
+        self.task_runner.submit(save, show_result, self._show_plan_error)
+
+    def _show_plan_error(self, error: Exception) -> None:
+        """計画書の保存のエラーを表示（患者が見つからないなど入力の誤りはそのメッセージを表示）"""
+        if isinstance(error, ValueError):
+            self.dialog_manager.show_error_message(str(error))
+        else:
+            self._show_task_error(error)
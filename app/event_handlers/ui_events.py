@@ -1,8 +1,8 @@
 from typing import Any
 
 from database import get_session_factory
-from models import MainDisease, PatientInfo
-from services.patient_service import load_sheet_names
+from models import PatientInfo
+from services.master_data_cache import get_master_data
 
 Session = get_session_factory()
 
@@ -17,12 +17,15 @@ class UIEventsMixin:
     load_patient_info: Any
     update_history: Any
     apply_template: Any
+    task_runner: Any
     _populate_form_from_patient_info: Any
 
     def on_patient_id_change(self, e: Any) -> None:
         """患者ID変更時のハンドラ"""
         patient_id = self.fields['patient_id']
         p_id = patient_id.value.strip()
+        # 前の患者の読み込み結果が後から届いても画面に反映しない
+        self.task_runner.invalidate()
         if p_id:
             self.load_patient_info(int(p_id))
         self.update_history(p_id)
@@ -50,17 +53,19 @@ class UIEventsMixin:
         selected_main_disease = main_diagnosis.value
         self.apply_template(e)
 
-        with Session() as session:
+        def show_sheet_names(master_data: Any) -> None:
             if selected_main_disease:
-                main_disease = session.query(MainDisease).filter_by(
-                    name=selected_main_disease).first()
-                sheet_name_options = load_sheet_names(main_disease.id) if main_disease else []
+                main_disease_id = master_data.disease_id(selected_main_disease)
+                sheet_name_options = master_data.sheet_name_options(main_disease_id) if main_disease_id else []
             else:
-                sheet_name_options = load_sheet_names()
+                sheet_name_options = master_data.sheet_name_options()
 
-        sheet_name_dropdown.options = sheet_name_options
-        sheet_name_dropdown.value = ""
-        self.page.update()
+            sheet_name_dropdown.options = sheet_name_options
+            sheet_name_dropdown.value = ""
+            self.page.update()
+
+        # マスタの変更確認・再読み込みはDBを参照するのでワーカースレッドで行う
+        self.task_runner.submit(get_master_data, show_sheet_names, self._show_task_error, key='sheet_names')
 
     def on_sheet_name_change(self, e: Any) -> None:
         """シート名変更時のハンドラ"""
@@ -86,14 +91,25 @@ class UIEventsMixin:
         if e.data == "true":
             row_index = history.rows.index(e.control)
             self.selected_row = history.rows[row_index].data
-            session = Session()
-            if self.selected_row is not None:
-                patient_info = session.query(PatientInfo).filter(
-                    PatientInfo.id == self.selected_row['id']).first()
-
+            row_id = self.selected_row['id'] if self.selected_row is not None else None
+
+            def load() -> Any:
+                if row_id is None:
+                    return None
+                session = Session()
+                try:
+                    return session.query(PatientInfo).filter(PatientInfo.id == row_id).first()
+                finally:
+                    session.close()
+
+            def show(patient_info: Any) -> None:
                 if patient_info:
-                    self._populate_form_from_patient_info(patient_info, session)
+                    self._populate_form_from_patient_info(patient_info)
+                self.page.update()
+                self.page.go("/edit")
 
-            session.close()
-            self.page.update()
-            self.page.go("/edit")
+            self.task_runner.submit(load, show, self._show_task_error, key='form')
+
+    def _show_task_error(self, error: Exception) -> None:
+        """ワーカースレッドで実行した処理のエラーを表示"""
+        self.dialog_manager.show_error_message(f"処理中にエラーが発生しました: {error}")
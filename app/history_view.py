@@ -0,0 +1,165 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from app.ui_builder import HISTORY_COLUMNS, create_data_row, create_data_rows, update_data_row
+from services.patient_service import HistoryPage, fetch_patient_history_page
+from services.ui_task_runner import UITaskRunner
+from utils import config_manager
+
+# 最下部からこのピクセル数以内までスクロールしたら次のページを読み込む
+LOAD_MORE_THRESHOLD = 100
+
+# 追加・更新・削除された行がこの割合を超えたら、行を使い回さずに作り直す
+REBUILD_RATIO = 0.5
+
+
+@dataclass
+class HistoryDiff:
+    """表示中の履歴と新しい取得結果の差分（計画書のIDの一覧）"""
+
+    inserted: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+    rebuilt: bool = False  # 差分を当てずに全行を作り直した
+
+    @property
+    def changed(self) -> int:
+        return len(self.inserted) + len(self.updated) + len(self.deleted)
+
+
+def diff_history(current: dict[str, dict], items: list[dict]) -> HistoryDiff:
+    """表示中の行（IDから履歴データ）とitemsを比べ、追加・表示内容の変わった・なくなった行のIDを返す"""
+    diff = HistoryDiff()
+    new_ids = set()
+    for item in items:
+        new_ids.add(item["id"])
+        old = current.get(item["id"])
+        if old is None:
+            diff.inserted.append(item["id"])
+        elif any(old[key] != item[key] for key in HISTORY_COLUMNS):
+            diff.updated.append(item["id"])
+    diff.deleted = [row_id for row_id in current if row_id not in new_ids]
+    return diff
+
+
+class HistoryView:
+    """患者履歴の表を1ページずつ表示するクラス（最下部までスクロールしたら次のページを追加する）
+
+    同じ患者の履歴を読み直したときは計画書のIDで行を照合し、追加・更新・削除された行だけを書き換える。
+    Fletは子コントロールをオブジェクトで照合するので、使い回した行は送り直されない
+    """
+
+    def __init__(self, table, on_row_selected: Callable[[Any], None],
+                 fetch_page: Callable[..., HistoryPage] = fetch_patient_history_page,
+                 page_size: Optional[int] = None, task_runner: Optional[UITaskRunner] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None):
+        """
+        初期化
+
+        Args:
+            table: 履歴を表示するDataTable
+            on_row_selected: 行選択時のコールバック関数
+            fetch_page: 履歴の1ページを取得する関数
+            page_size: 1ページの件数（Noneは[DataTable] page_size）
+            task_runner: 次のページの取得の実行先（省略時は新規作成）
+            on_error: 次のページを取得できなかったときのコールバック関数
+        """
+        self.table = table
+        self.on_row_selected = on_row_selected
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.task_runner = task_runner or UITaskRunner()
+        self.on_error = on_error
+        self.patient_id: Optional[Any] = None
+        self.next_before_id: Optional[int] = None
+        self.last_diff = HistoryDiff()
+        # Fletのイベントは別スレッドで届くので、連続したスクロールで同じページを二重に読み込まない
+        self._lock = threading.Lock()
+        self._loading = False
+        self._generation = 0  # showで表示し直すたびに増やし、それより前に登録した取得の結果を捨てる
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_before_id is not None
+
+    def _page_size(self) -> int:
+        return self.page_size or config_manager.get_settings().data_table.page_size
+
+    def reload(self, patient_id=None) -> HistoryDiff:
+        """患者の履歴を読み直す（同じ患者なら表示中の件数分を読み直して差分だけを当てる）"""
+        return self.show(patient_id, self.fetch(patient_id))
+
+    def fetch(self, patient_id=None) -> HistoryPage:
+        """reloadで表示する履歴を取得（DBを参照するだけで表は変えないので、ワーカースレッドから呼べる）"""
+        page_size = self._page_size()
+        if str(patient_id) == str(self.patient_id):
+            page_size = max(len(self.table.rows), page_size)
+        return self.fetch_page(patient_id, page_size=page_size)
+
+    def show(self, patient_id, page: HistoryPage) -> HistoryDiff:
+        """fetchで取得した履歴を表に反映"""
+        with self._lock:
+            self._generation += 1
+            self._loading = False
+            self.patient_id = patient_id
+            self.next_before_id = page.next_before_id
+        self.last_diff = self._apply(page.rows)
+        return self.last_diff
+
+    def _apply(self, items: list[dict]) -> HistoryDiff:
+        rows = {row.data["id"]: row for row in self.table.rows}
+        diff = diff_history({row_id: row.data for row_id, row in rows.items()}, items)
+        if diff.changed > max(len(rows), len(items)) * REBUILD_RATIO:
+            diff.rebuilt = True
+            self.table.rows = create_data_rows(items, self.on_row_selected)
+            return diff
+        if not diff.changed:
+            return diff
+
+        items_by_id = {item["id"]: item for item in items}
+        for row_id in diff.updated:
+            update_data_row(rows[row_id], items_by_id[row_id])
+        self.table.rows = [
+            rows[item["id"]] if item["id"] in rows else create_data_row(item, self.on_row_selected)
+            for item in items
+        ]
+        return diff
+
+    def load_more(self) -> bool:
+        """次のページの取得をワーカースレッドに登録（登録した場合にTrue）
+
+        取得中に別の患者に切り替わったり履歴を読み直したりした場合は、取得したページを追加しない
+        """
+        with self._lock:
+            if self.next_before_id is None or self._loading:
+                return False
+            self._loading = True
+            patient_id, before_id, generation = self.patient_id, self.next_before_id, self._generation
+        page_size = self._page_size()
+
+        def append(page: HistoryPage) -> None:
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._loading = False
+                self.next_before_id = page.next_before_id
+            self.table.rows.extend(create_data_rows(page.rows, self.on_row_selected))
+            self.table.update()
+
+        def show_error(e: Exception) -> None:
+            with self._lock:
+                if generation == self._generation:
+                    self._loading = False
+            if self.on_error is not None:
+                self.on_error(e)
+
+        self.task_runner.submit(
+            lambda: self.fetch_page(patient_id, before_id=before_id, page_size=page_size),
+            append, show_error, key='history_more')
+        return True
+
+    def on_scroll(self, e) -> None:
+        """履歴の列のスクロールイベントのハンドラ"""
+        if e.pixels >= e.max_scroll_extent - LOAD_MORE_THRESHOLD:
+            self.load_more()
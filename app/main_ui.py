@@ -1,16 +1,19 @@
 import flet as ft
 from database import get_session_factory
-from services.patient_service import load_patient_data, load_main_diseases, load_sheet_names
+from services.master_data_cache import get_master_data
+from services.patient_service import get_patient_roster
+from services.ui_task_runner import UITaskRunner
 from widgets import DropdownItems, create_form_fields, create_theme_aware_button_style
 from app.dialogs import DialogManager
 from app.event_handlers import EventHandlers
+from app.history_view import HistoryView
 from app.routes import RouteManager
 from app.ui_builder import (
-    fetch_data, create_data_rows, build_history_table,
+    fetch_data, build_history_table,
     build_buttons, build_create_buttons, build_edit_buttons,
     build_template_buttons, build_guidance_items, build_guidance_items_template
 )
-from utils.config_manager import load_config
+from utils.config_manager import get_settings
 
 Session = get_session_factory()
 
@@ -18,18 +21,18 @@ Session = get_session_factory()
 def create_ui(page: ft.Page):
     """メインUIを作成"""
     # 設定読み込み
-    config = load_config()
-    input_height = config.getint("UI", "input_height", fallback=60)
-    text_height = config.getint("UI", "text_height", fallback=60)
-    font_size = config.getint("UI", "font_size", fallback=13)
-    heading_font_size = config.getint("UI", "heading_font_size", fallback=16)
-    table_width = config.getint("DataTable", "width", fallback=1200)
-    export_folder = config.get("FilePaths", "export_folder")
-    manual_pdf_path = config.get("FilePaths", "manual_pdf", fallback="")
+    settings = get_settings()
+    input_height = settings.ui.input_height
+    text_height = settings.ui.text_height
+    font_size = settings.ui.font_size
+    heading_font_size = settings.ui.heading_font_size
+    table_width = settings.data_table.width
+    export_folder = settings.file_paths.export_folder
+    manual_pdf_path = settings.file_paths.manual_pdf
 
     page.title = "生活習慣病療養計画書アプリ"
-    page.window.width = config.getint("settings", "window_width", fallback=1200)
-    page.window.height = config.getint("settings", "window_height", fallback=900)
+    page.window.width = settings.window.window_width
+    page.window.height = settings.window.window_height
     page.scroll = ft.ScrollMode.AUTO
     page.theme_mode = ft.ThemeMode.SYSTEM
 
@@ -44,12 +47,9 @@ def create_ui(page: ft.Page):
             page.update()
 
     # 患者データ読み込み
-    error_message, df_patients = load_patient_data()
-    initial_patient_id = ""
-    if error_message or df_patients is None:
-        error_message, df_patients = "", None
-    elif not df_patients.empty:
-        initial_patient_id = str(df_patients.iloc[0, 2])
+    patient_roster = get_patient_roster()
+    first_patient = patient_roster.first()
+    initial_patient_id = str(first_patient.patient_id) if first_patient is not None else ""
 
     # ドロップダウンアイテムの作成
     dropdown_items = DropdownItems()
@@ -71,8 +71,9 @@ def create_ui(page: ft.Page):
     department_id_value = ft.TextField(label="診療科ID", read_only=True, width=100, height=input_height)
     department_value = ft.TextField(label="診療科", read_only=True, width=150, height=input_height)
 
-    # 主病名・シート名フィールドの作成
-    main_disease_options = load_main_diseases()
+    # 主病名・シート名フィールドの作成（マスタは起動時に一度だけ読み込む）
+    master_data = get_master_data()
+    main_disease_options = master_data.main_disease_options()
     main_diagnosis = ft.Dropdown(
         label="主病名",
         options=main_disease_options,
@@ -83,7 +84,7 @@ def create_ui(page: ft.Page):
         border_width=2,
     )
 
-    sheet_name_options = load_sheet_names()
+    sheet_name_options = master_data.sheet_name_options()
     sheet_name_dropdown = ft.Dropdown(
         label="シート名",
         options=sheet_name_options,
@@ -183,8 +184,17 @@ def create_ui(page: ft.Page):
     # ダイアログマネージャーの初期化
     dialog_manager = DialogManager(page, fields)
 
+    # 処理中表示（DB・ファイル処理の実行中だけ画面の上端に表示）
+    busy_indicator = ft.ProgressBar(visible=False, top=0, left=0, right=0, bar_height=3)
+    page.overlay.append(busy_indicator)
+
+    def show_busy(busy):
+        busy_indicator.visible = busy
+        page.update()
+
     # イベントハンドラの初期化
-    event_handlers = EventHandlers(page, fields, df_patients, dialog_manager)
+    event_handlers = EventHandlers(page, fields, None, dialog_manager, patient_roster=patient_roster,
+                                   task_runner=UITaskRunner(on_busy_change=show_busy))
 
     # イベントハンドラの設定
     patient_id.on_change = event_handlers.on_patient_id_change
@@ -205,11 +215,15 @@ def create_ui(page: ft.Page):
         issue_date_picker.open = True
         page.update()
 
-    # 履歴の初期化
+    # 履歴の初期化（1ページ目だけを読み込み、残りはスクロールに合わせて追加する）
     def update_history(filter_patient_id=None):
-        data = fetch_data(filter_patient_id)
-        history.rows = create_data_rows(data, event_handlers.on_row_selected)
-        page.update()
+        def show(history_page):
+            history_view.show(filter_patient_id, history_page)
+            page.update()
+
+        # 続けて呼ばれた場合は最後の患者の履歴だけを表示する
+        event_handlers.task_runner.submit(
+            lambda: history_view.fetch(filter_patient_id), show, event_handlers._show_task_error, key='history')
 
     # EventHandlersにupdate_historyを設定
     event_handlers.update_history = update_history
@@ -218,11 +232,12 @@ def create_ui(page: ft.Page):
     # DialogManagerにupdate_history_callbackを設定
     dialog_manager.update_history_callback = update_history
 
-    data = fetch_data()
     history = build_history_table(table_width)
-    history.rows = create_data_rows(data, event_handlers.on_row_selected)
+    history_view = HistoryView(history, event_handlers.on_row_selected, task_runner=event_handlers.task_runner,
+                               on_error=event_handlers._show_task_error)
 
-    history_column = ft.Column([history], scroll=ft.ScrollMode.AUTO, width=table_width, height=400)
+    history_column = ft.Column([history], scroll=ft.ScrollMode.AUTO, width=table_width, height=400,
+                               on_scroll=history_view.on_scroll, on_scroll_interval=100)
     history_scrollable = ft.Container(
         content=history_column,
         width=table_width,
@@ -326,3 +341,5 @@ def create_ui(page: ft.Page):
     page.on_route_change = route_manager.route_change
     page.on_view_pop = route_manager.view_pop
     page.go(page.route)
+
+    return event_handlers
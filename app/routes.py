@@ -4,6 +4,8 @@ from datetime import datetime
 import flet as ft
 from flet import View
 
+from services.file_monitor_service import stop_file_monitoring
+
 
 class RouteManager:
     """ルーティングを管理するクラス"""
@@ -303,5 +305,8 @@ class RouteManager:
             self.page.update()
 
     def on_close(self, e):
-        """ウィンドウを閉じる"""
+        """ウィンドウを閉じる（実行中の保存と作成中の計画書を待ち、ファイル監視を止めてから閉じる）"""
+        self.event_handlers.task_runner.shutdown()
+        self.event_handlers.plan_job_queue.shutdown()
+        stop_file_monitoring(self.event_handlers.file_observer)
         self.page.window.close()
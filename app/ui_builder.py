@@ -15,6 +15,42 @@ def fetch_data(filter_patient_id=None):
     return fetch_patient_history(filter_patient_id)
 
 
+# 履歴の表の列に表示する項目（左から順）
+HISTORY_COLUMNS = ("issue_date", "department", "doctor_name", "main_diagnosis", "sheet_name", "count")
+
+
+def create_data_row(item, on_row_selected):
+    """
+    データ行を1行作成
+
+    Args:
+        item: 患者履歴データ
+        on_row_selected: 行選択時のコールバック関数
+
+    Returns:
+        DataRow
+    """
+    return ft.DataRow(
+        cells=[ft.DataCell(ft.Text(item[key])) for key in HISTORY_COLUMNS],
+        on_select_changed=on_row_selected,
+        data=item
+    )
+
+
+def update_data_row(row, item):
+    """
+    データ行の表示を書き換える（変わったセルのTextの値だけを更新）
+
+    Args:
+        row: create_data_rowで作成したDataRow
+        item: 新しい患者履歴データ
+    """
+    for cell, key in zip(row.cells, HISTORY_COLUMNS):
+        if cell.content.value != item[key]:
+            cell.content.value = item[key]
+    row.data = item
+
+
 def create_data_rows(data, on_row_selected):
     """
     データ行を作成
@@ -26,22 +62,7 @@ def create_data_rows(data, on_row_selected):
     Returns:
         DataRowのリスト
     """
-    rows = []
-    for item in data:
-        row = ft.DataRow(
-            cells=[
-                ft.DataCell(ft.Text(item["issue_date"])),
-                ft.DataCell(ft.Text(item["department"])),
-                ft.DataCell(ft.Text(item["doctor_name"])),
-                ft.DataCell(ft.Text(item["main_diagnosis"])),
-                ft.DataCell(ft.Text(item["sheet_name"])),
-                ft.DataCell(ft.Text(item["count"])),
-            ],
-            on_select_changed=on_row_selected,
-            data=item
-        )
-        rows.append(row)
-    return rows
+    return [create_data_row(item, on_row_selected) for item in data]
 
 
 def build_history_table(table_width):
@@ -1,3 +1,3 @@
-from .connection import get_base, get_engine, get_session, get_session_factory
+from .connection import create_engine_for, get_base, get_engine, get_pool_stats, get_session, get_session_factory
 
-__all__ = ['get_engine', 'get_session_factory', 'get_base', 'get_session']
+__all__ = ['create_engine_for', 'get_engine', 'get_pool_stats', 'get_session_factory', 'get_base', 'get_session']
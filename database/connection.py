@@ -1,29 +1,122 @@
+import threading
+import time
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from utils import config_manager
+from utils.config_manager import DatabaseSettings
 
 
-# 設定の読み込み
-config = config_manager.load_config()
-db_url = config.get('Database', 'db_url')
-
 # SQLAlchemyの設定
 _engine = None
 _Session = None
 _Base = None
 
 
+class TimedQueuePool(QueuePool):
+    """接続の払い出しにかかった時間（空きを待つ時間と新規接続の時間）を記録するQueuePool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        connection = super()._do_get()
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def _sqlite_pragmas(settings: DatabaseSettings) -> list[str]:
+    return [
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout}",
+        f"PRAGMA cache_size={settings.sqlite_cache_size}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        f"PRAGMA temp_store={settings.sqlite_temp_store}",
+    ]
+
+
+def create_engine_for(settings: DatabaseSettings) -> Engine:
+    """接続先の種類に合わせてエンジンを作成
+
+    SQLiteは接続ごとにPRAGMA（WAL・synchronous・busy_timeoutなど）を設定し、
+    MySQLなどサーバー型は接続プールの大きさ・再接続間隔・疎通確認を設定から指定する
+    """
+    url = make_url(settings.db_url)
+    if url.get_backend_name() == "sqlite":
+        # インメモリDBは接続ごとに別のDBになるため、SQLAlchemy既定のプールのままにする
+        kwargs = {} if _is_memory_sqlite(url) else {"poolclass": TimedQueuePool}
+        engine = create_engine(url, **kwargs)
+        pragmas = _sqlite_pragmas(settings)
+
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+        return engine
+
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+    )
+
+
 def get_engine():
     """データベースエンジンを取得"""
     global _engine
     if _engine is None:
-        _engine = create_engine(db_url, pool_pre_ping=True, pool_size=10)
+        _engine = create_engine_for(config_manager.get_settings().database)
     return _engine
 
 
+def get_pool_stats(engine=None) -> dict:
+    """接続プールの状態（払い出し中・オーバーフロー数・払い出しの待ち時間）"""
+    pool = (engine or get_engine()).pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            stats.update({
+                "checkouts": pool.checkouts,
+                "wait_seconds": pool.wait_seconds,
+                "max_wait_seconds": pool.max_wait_seconds,
+            })
+    return stats
+
+
 def get_session_factory():
     """セッションファクトリを取得"""
     global _Session
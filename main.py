@@ -11,12 +11,13 @@ def main(page: ft.Page):
     initialize_database()
     seed_initial_data()
 
-    # ファイル監視開始
-    start_file_monitoring(page)
     check_file_exists(page)
 
     # UIを作成
-    create_ui(page)
+    event_handlers = create_ui(page)
+
+    # ファイル監視開始（患者CSVが更新されたら表示中の患者情報を更新）
+    event_handlers.file_observer = start_file_monitoring(page, on_changed=event_handlers.reload_patient_roster)
 
 
 if __name__ == "__main__":
@@ -2,9 +2,13 @@ from database import get_base
 
 Base = get_base()
 
+from .change_counter import ChangeCounter
+from .document_sequence import DocumentSequence
+from .export_watermark import ExportWatermark
+from .imported_file import ImportedFile
 from .main_disease import MainDisease
 from .patient_info import PatientInfo
 from .sheet_name import SheetName
 from .template import Template
 
-__all__ = ['Base', 'PatientInfo', 'MainDisease', 'SheetName', 'Template']
+__all__ = ['Base', 'PatientInfo', 'MainDisease', 'SheetName', 'Template', 'DocumentSequence', 'ImportedFile', 'ExportWatermark', 'ChangeCounter']
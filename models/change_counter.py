@@ -0,0 +1,52 @@
+from sqlalchemy import DDL, Column, Integer, String, event, insert, select, update
+
+from database import get_base
+
+Base = get_base()
+
+# patient_infoの変更番号のカウンタ名
+PATIENT_INFO_CHANGES = "patient_info"
+# 主病名・シート名・テンプレートの追加・更新・削除の回数のカウンタ名
+MASTER_DATA_CHANGES = "master_data"
+
+
+class ChangeCounter(Base):
+    __tablename__ = "change_counters"
+    name = Column(String(50), primary_key=True)  # カウンタ名
+    last_value = Column(Integer, nullable=False, default=0)  # 最後に払い出した変更番号
+
+
+# 最初の払い出しが同時に行われても行の作成で競合しないよう、表の作成時に行を用意する
+event.listen(ChangeCounter.__table__, 'after_create', DDL(
+    "INSERT INTO change_counters (name, last_value) "
+    f"VALUES ('{PATIENT_INFO_CHANGES}', 0), ('{MASTER_DATA_CHANGES}', 0)"))
+
+
+def allocate_change_seq(connection, count: int = 1, name: str = PATIENT_INFO_CHANGES) -> int:
+    """変更番号をcount個払い出し、最後の番号を返す
+
+    カウンタの行を更新して取ったロックはコミットまで保持されるので、変更番号の順にコミットされる。
+    コミット済みのカウンタの値以下の変更番号の行は、すべてコミット済み
+    """
+    table = ChangeCounter.__table__
+    result = connection.execute(
+        update(table).where(table.c.name == name).values(last_value=table.c.last_value + count))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(name=name, last_value=count))
+        return count
+    return connection.execute(select(table.c.last_value).where(table.c.name == name)).scalar_one()
+
+
+def committed_change_seq(connection, name: str = PATIENT_INFO_CHANGES) -> int:
+    """コミット済みの最後の変更番号"""
+    table = ChangeCounter.__table__
+    return connection.execute(select(table.c.last_value).where(table.c.name == name)).scalar() or 0
+
+
+def count_changes(model, name: str) -> None:
+    """modelの行をORMで追加・更新・削除するたびにカウンタnameを進める"""
+    def increment(mapper, connection, target) -> None:
+        allocate_change_seq(connection, name=name)
+
+    for identifier in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, identifier, increment)
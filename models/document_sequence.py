@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String
+
+from database import get_base
+
+Base = get_base()
+
+
+class DocumentSequence(Base):
+    __tablename__ = "document_sequences"
+    prefix = Column(String(30), primary_key=True)  # 文書番号の連番以外の部分
+    last_value = Column(Integer, nullable=False)  # 最後に払い出した連番
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, DateTime, Integer, String
+
+from database import get_base
+
+Base = get_base()
+
+
+class ExportWatermark(Base):
+    __tablename__ = "export_watermarks"
+    name = Column(String(50), primary_key=True)  # 出力先ごとの名前
+    change_seq = Column(Integer, nullable=False)  # 出力済みの変更番号（この値以下の変更は出力済み）
+    exported_at = Column(DateTime, nullable=False)  # 最後に出力に成功した日時
+    row_count = Column(Integer, nullable=False, default=0)  # 最後に出力した行数
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, DateTime, Integer, String
+
+from database import get_base
+
+Base = get_base()
+
+
+class ImportedFile(Base):
+    __tablename__ = "imported_files"
+    fingerprint = Column(String(64), primary_key=True)  # ファイル内容のSHA-256
+    file_name = Column(String(255), nullable=False)
+    imported_at = Column(DateTime, nullable=False)
+    inserted = Column(Integer, nullable=False, default=0)  # 追加した行数
+    updated = Column(Integer, nullable=False, default=0)  # 内容が変わっていたので更新した行数
+    skipped = Column(Integer, nullable=False, default=0)  # 既存の行と同じだった行数
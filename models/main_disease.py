@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
 
 from database import get_base
+from models.change_counter import MASTER_DATA_CHANGES, count_changes
 
 Base = get_base()
 
@@ -9,3 +10,11 @@ class MainDisease(Base):
     __tablename__ = "main_diseases"
     id = Column(Integer, primary_key=True)
     name = Column(String)  # 主病名
+
+    __table_args__ = (
+        Index('ix_main_diseases_name', 'name'),
+    )
+
+
+# マスタのキャッシュが他の端末での編集を検出できるようにする
+count_changes(MainDisease, MASTER_DATA_CHANGES)
@@ -1,9 +1,25 @@
-from sqlalchemy import Boolean, Column, Date, Float, Integer, String
+import hashlib
+from datetime import datetime
+from typing import Any, Mapping
+
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, Index, Integer, String, event
 
 from database import get_base
+from models.change_counter import allocate_change_seq
 
 Base = get_base()
 
+# 端末をまたいで同じ計画書を指す列（CSV取込で既存の行と照合する）
+NATURAL_KEY_COLUMNS = ('patient_id', 'issue_date', 'main_diagnosis', 'sheet_name', 'creation_count')
+# アプリが管理する列（CSVの入出力には含めない）
+TRACKING_COLUMNS = ('natural_key', 'updated_at', 'change_seq')
+
+
+def natural_key_hash(values: Mapping[str, Any]) -> str:
+    """自然キーの列の値のSHA-256（Noneと空文字、数値と数字の文字列は同じ値として扱う）"""
+    parts = ['' if values.get(name) is None else str(values.get(name)) for name in NATURAL_KEY_COLUMNS]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
 
 class PatientInfo(Base):
     __tablename__ = 'patient_info'
@@ -46,3 +62,22 @@ class PatientInfo(Base):
     ophthalmology = Column(Boolean)
     dental = Column(Boolean)
     cancer_screening = Column(Boolean)
+    natural_key = Column(String(64))  # natural_key_hash()の値
+    updated_at = Column(DateTime)  # 登録・更新日時
+    change_seq = Column(Integer)  # 登録・更新のたびに払い出す変更番号（差分のCSV出力に使う）
+
+    __table_args__ = (
+        # 患者IDごとの履歴一覧（新しい順）を表から読まずに索引だけで返す
+        Index('ix_patient_info_history', 'patient_id', 'id', 'issue_date', 'department', 'doctor_name',
+              'main_diagnosis', 'sheet_name', 'creation_count'),
+        Index('ix_patient_info_natural_key', 'natural_key'),
+        Index('ix_patient_info_change_seq', 'change_seq'),
+    )
+
+
+@event.listens_for(PatientInfo, 'before_insert')
+@event.listens_for(PatientInfo, 'before_update')
+def _set_tracking_columns(mapper, connection, target: PatientInfo) -> None:
+    target.natural_key = natural_key_hash({name: getattr(target, name) for name in NATURAL_KEY_COLUMNS})
+    target.updated_at = datetime.now()
+    target.change_seq = allocate_change_seq(connection)
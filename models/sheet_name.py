@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
 
 from database import get_base
+from models.change_counter import MASTER_DATA_CHANGES, count_changes
 
 Base = get_base()
 
@@ -10,3 +11,12 @@ class SheetName(Base):
     id = Column(Integer, primary_key=True)
     main_disease_id = Column(Integer)
     name = Column(String)  # シート名
+
+    __table_args__ = (
+        # 主病名ごとのシート名一覧を索引だけで返す
+        Index('ix_sheet_names_main_disease_id_name', 'main_disease_id', 'name'),
+    )
+
+
+# マスタのキャッシュが他の端末での編集を検出できるようにする
+count_changes(SheetName, MASTER_DATA_CHANGES)
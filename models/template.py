@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
 
 from database import get_base
+from models.change_counter import MASTER_DATA_CHANGES, count_changes
 
 Base = get_base()
 
@@ -25,3 +26,11 @@ class Template(Base):
     daily_activity = Column(String)
     other1 = Column(String)
     other2 = Column(String)
+
+    __table_args__ = (
+        Index('ix_templates_main_disease_sheet_name', 'main_disease', 'sheet_name'),
+    )
+
+
+# マスタのキャッシュが他の端末での編集を検出できるようにする
+count_changes(Template, MASTER_DATA_CHANGES)
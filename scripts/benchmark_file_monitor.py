@@ -0,0 +1,88 @@
+"""ファイル監視方式（watchdog / stat確認）の待機中のCPU時間と更新の検出遅延を比較する
+
+使い方:
+    python -m scripts.benchmark_file_monitor --idle 10 --changes 5
+    python -m scripts.benchmark_file_monitor --path \\\\server\\share\\pat.csv
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from watchdog.events import FileSystemEventHandler
+
+from services.file_monitor_service import create_observer, stop_file_monitoring
+from utils import config_manager
+
+
+class ChangeRecorder(FileSystemEventHandler):
+    """対象ファイルの更新を検出した時刻を記録する"""
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = os.path.abspath(file_path)
+        self.detected = threading.Event()
+
+    def on_modified(self, event) -> None:
+        if os.path.abspath(event.src_path) == self.file_path:
+            self.detected.set()
+
+
+def measure(backend: str, file_path: str, idle_seconds: float, changes: int,
+            timeout: float) -> tuple[float, list[Optional[float]]]:
+    """待機中のプロセスCPU時間と、書き込みから検出までの遅延（検出できなければNone）"""
+    recorder = ChangeRecorder(file_path)
+    observer = create_observer(backend, file_path)
+    observer.schedule(recorder, path=os.path.dirname(os.path.abspath(file_path)), recursive=False)
+    observer.start()
+    try:
+        # 待機中に確認間隔が延びきった状態からの検出遅延を測る
+        cpu_start = time.process_time()
+        time.sleep(idle_seconds)
+        idle_cpu = time.process_time() - cpu_start
+
+        latencies: list[Optional[float]] = []
+        for index in range(changes):
+            recorder.detected.clear()
+            with open(file_path, "a", encoding="shift_jis") as f:
+                f.write(f"{index}\n")
+            written = time.perf_counter()
+            latencies.append(time.perf_counter() - written if recorder.detected.wait(timeout) else None)
+            time.sleep(idle_seconds / max(changes, 1))
+        return idle_cpu, latencies
+    finally:
+        stop_file_monitoring(observer)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ファイル監視方式のベンチマーク")
+    parser.add_argument("--path", help="監視するファイル（省略時は一時フォルダに作成。追記されるので注意）")
+    parser.add_argument("--idle", type=float, default=10.0, help="待機中のCPU時間を測る秒数")
+    parser.add_argument("--changes", type=int, default=5, help="検出遅延を測る書き込み回数")
+    parser.add_argument("--backends", default="watchdog,polling", help="比較する方式（カンマ区切り）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = args.path or os.path.join(work_dir, "pat.csv")
+        if not args.path:
+            with open(file_path, "w", encoding="shift_jis") as f:
+                f.write("1001\n")
+        timeout = max(args.idle, config_manager.get_settings().file_monitor.poll_interval) * 4
+
+        for backend in args.backends.split(","):
+            idle_cpu, latencies = measure(backend, file_path, args.idle, args.changes, timeout)
+            detected = [latency for latency in latencies if latency is not None]
+            print(f"{backend}")
+            print(f"  待機中のCPU時間 {idle_cpu * 1000:8.1f}ms / {args.idle:.0f}秒")
+            if detected:
+                print(f"  検出遅延 平均 {sum(detected) / len(detected) * 1000:8.1f}ms  "
+                      f"最大 {max(detected) * 1000:8.1f}ms  検出 {len(detected)}/{len(latencies)}回")
+            else:
+                print(f"  検出できませんでした（0/{len(latencies)}回）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
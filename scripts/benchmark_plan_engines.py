@@ -0,0 +1,113 @@
+"""計画書生成エンジン（openpyxl / xml_patch）の処理時間と出力の同等性を比較する
+
+使い方:
+    python -m scripts.benchmark_plan_engines --count 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from copy import copy
+from datetime import date
+
+from openpyxl import load_workbook
+
+from models import PatientInfo
+from services.treatment_plan_service import (
+    COMMON_SHEET_CELL_MAP,
+    PLAN_ENGINES,
+    PLAN_SHEETS,
+    _build_barcode_options,
+    render_barcode,
+)
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'template', 'LDTPform.xlsm')
+
+
+def build_sample_plan(creation_count: int = 2) -> PatientInfo:
+    return PatientInfo(
+        patient_id=12345, patient_name="山田太郎", kana="ヤマダタロウ", gender="男性",
+        birthdate=date(1980, 5, 15), issue_date=date(2025, 1, 10), issue_date_age=44,
+        doctor_id=1001, doctor_name="田中医師", department="内科", department_id=10,
+        main_diagnosis="糖尿病", creation_count=creation_count, target_weight=65.5,
+        sheet_name="1_HbA1c７％", target_bp="130/80", target_hba1c="7",
+        goal1="HbA1ｃ７％/体重を当初の－３Kgとする", goal2="5000歩の歩行/間食の制限/糖質の制限",
+        target_achievement="概ね達成", diet1="食事量を適正にする", diet2="食物繊維の摂取量を増やす",
+        diet3="ゆっくり食べる", diet4="間食を減らす", diet_comment="<夕食> & 間食",
+        exercise_prescription="ウォーキング", exercise_time="30分", exercise_frequency="週に5日",
+        exercise_intensity="少し汗をかく程度", daily_activity="5000歩", exercise_comment="",
+        nonsmoker=True, smoking_cessation=False, other1="睡眠の確保1日7時間", other2=None,
+        ophthalmology=True, dental=False, cancer_screening=True,
+    )
+
+
+def compare_outputs(path_a: str, path_b: str) -> list[str]:
+    """2つの計画書ファイルの差異を列挙（セル値・書式、画像数、選択シート）"""
+    differences = []
+    book_a = load_workbook(path_a)
+    book_b = load_workbook(path_b)
+
+    for cell, attr in COMMON_SHEET_CELL_MAP:
+        value_a = book_a['共通情報'][cell].value
+        value_b = book_b['共通情報'][cell].value
+        if (value_a if value_a != "" else None) != (value_b if value_b != "" else None):
+            differences.append(f"共通情報!{cell}({attr}): {value_a!r} != {value_b!r}")
+
+    for sheet_name in PLAN_SHEETS:
+        sheet_a, sheet_b = book_a[sheet_name], book_b[sheet_name]
+        if len(sheet_a._images) != len(sheet_b._images):
+            differences.append(f"{sheet_name}: 画像数 {len(sheet_a._images)} != {len(sheet_b._images)}")
+        for row in sheet_a.iter_rows():
+            for cell_a in row:
+                cell_b = sheet_b[cell_a.coordinate]
+                if cell_a.value != cell_b.value or copy(cell_a.font) != copy(cell_b.font):
+                    differences.append(f"{sheet_name}!{cell_a.coordinate}: セル内容が異なります")
+
+    if book_a.active.title != book_b.active.title:
+        differences.append(f"選択シート: {book_a.active.title} != {book_b.active.title}")
+    return differences
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="計画書生成エンジンのベンチマーク")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="テンプレートxlsmのパス")
+    parser.add_argument("--count", type=int, default=30, help="エンジンごとの生成回数")
+    args = parser.parse_args()
+
+    barcode_png = render_barcode("000012345392210100100120250110120000", _build_barcode_options())
+    outputs: dict[str, dict[int, str]] = {}
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for engine_name, write_plan in PLAN_ENGINES.items():
+            outputs[engine_name] = {}
+            timings = []
+            for index in range(args.count):
+                plan = build_sample_plan(creation_count=1 + index % 2)
+                file_path = os.path.join(output_dir, f"{engine_name}_{index}.xlsm")
+                start = time.perf_counter()
+                write_plan(args.template, file_path, plan, barcode_png)
+                timings.append(time.perf_counter() - start)
+                outputs[engine_name].setdefault(plan.creation_count, file_path)
+
+            size = os.path.getsize(outputs[engine_name][1])
+            print(f"{engine_name:10s} 平均 {statistics.mean(timings) * 1000:7.1f}ms  "
+                  f"中央値 {statistics.median(timings) * 1000:7.1f}ms  "
+                  f"初回 {timings[0] * 1000:7.1f}ms  サイズ {size:,}bytes")
+
+        differences = []
+        for creation_count in (1, 2):
+            differences += compare_outputs(outputs["openpyxl"][creation_count], outputs["xml_patch"][creation_count])
+
+    if differences:
+        print("出力に差異があります:")
+        for difference in differences:
+            print(f"  {difference}")
+        return 1
+    print("出力は同等です")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
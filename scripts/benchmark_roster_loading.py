@@ -0,0 +1,133 @@
+"""患者CSVの読み込み方式（全列推論のDataFrame / 列選択・分割読み込みのPatientRecord索引 / コンパイル済みファイル）の処理時間とメモリを比較する
+
+使い方:
+    python -m scripts.benchmark_roster_loading --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+import pandas as pd
+
+from services.patient_service import PatientRoster
+
+FAMILY_NAMES = ["田中", "佐藤", "鈴木", "高橋", "伊藤", "渡辺", "山本", "中村"]
+GIVEN_NAMES = ["太郎", "花子", "一郎", "美咲", "健太", "陽子"]
+DEPARTMENTS = [(10, "内科"), (20, "外科"), (30, "循環器内科"), (40, "整形外科")]
+
+
+def write_synthetic_roster(path: str, rows: int, seed: int = 0) -> None:
+    """電子カルテの出力と同じ15列・Shift-JISの患者CSVを作成"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="shift_jis", newline="") as f:
+        for index in range(rows):
+            family, given = rng.choice(FAMILY_NAMES), rng.choice(GIVEN_NAMES)
+            department_id, department = rng.choice(DEPARTMENTS)
+            birthdate = f"{rng.randint(1930, 2005)}/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}"
+            f.write(
+                f"2025/01/10,ｶﾙﾃ,{100000 + index},{family}{given},ﾀﾅｶ ﾀﾛｳ,{rng.randint(1, 2)},{birthdate},"
+                f"{rng.randint(100, 999)}-{rng.randint(1000, 9999)},東京都新宿区西新宿{rng.randint(1, 9)}丁目,"
+                f"{rng.randint(1000, 1100)},{family}医師,備考,{rng.randint(1, 99)},{department_id},{department}\n"
+            )
+
+
+def load_inferred(path: str) -> pd.DataFrame:
+    """従来方式: 全列を型推論で一括読み込み"""
+    return pd.read_csv(path, encoding="shift_jis", header=None, parse_dates=[0, 6])
+
+
+def lookup_inferred(df: pd.DataFrame, patient_id: int) -> Any:
+    """従来方式: 患者IDで絞り込み、行のSeriesから位置で値を取り出す"""
+    rows = df[df.iloc[:, 2] == patient_id]
+    if rows.empty:
+        return None
+    row = rows.iloc[0]
+    return (row.iloc[3], row.iloc[4], row.iloc[5], row.iloc[6], row.iloc[9], row.iloc[10], row.iloc[13], row.iloc[14])
+
+
+def load_roster(path: str) -> PatientRoster:
+    """新方式: 列選択・型指定・分割読み込みで索引を作成"""
+    roster = PatientRoster(path)
+    roster.refresh()
+    return roster
+
+
+def lookup_roster(roster: PatientRoster, patient_id: int) -> Any:
+    """新方式: 索引からPatientRecordを取得し、属性で値を取り出す"""
+    record = roster.get(patient_id)
+    if record is None:
+        return None
+    return (record.name, record.kana, record.gender, record.birthdate, record.doctor_id, record.doctor_name,
+            record.department_id, record.department)
+
+
+def load_compiled(path: str) -> PatientRoster:
+    """コンパイル済みファイルをmmapで開く（コンパイル済みの状態から計測）"""
+    roster = PatientRoster(path, f"{path}.bin")
+    roster.refresh()
+    return roster
+
+
+def record_size(loaded: Any, patient_id: int) -> int:
+    """患者1人分の取得結果のサイズ（Seriesは値も含む）"""
+    if isinstance(loaded, pd.DataFrame):
+        return int(loaded[loaded.iloc[:, 2] == patient_id].iloc[0].memory_usage(deep=True))
+    return sys.getsizeof(loaded.get(patient_id))
+
+
+def measure(loader: Callable[[str], Any], lookup: Callable[[Any, int], Any], path: str,
+            patient_ids: list[int]) -> tuple[float, int, int, float, int]:
+    """読み込み時間・ピークメモリ・保持メモリ・検索時間・1人分のサイズ（tracemallocは処理時間に影響するので別々に計測）"""
+    start = time.perf_counter()
+    loaded = loader(path)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for patient_id in patient_ids:
+        lookup(loaded, patient_id)
+    lookup_elapsed = time.perf_counter() - start
+    size = record_size(loaded, patient_ids[0])
+    del loaded
+
+    tracemalloc.start()
+    loaded = loader(path)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return elapsed, peak, retained, lookup_elapsed, size
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="患者CSV読み込みのベンチマーク")
+    parser.add_argument("--rows", type=int, default=100000, help="作成する行数")
+    parser.add_argument("--lookups", type=int, default=1000, help="患者IDで検索する回数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "pat.csv")
+        write_synthetic_roster(path, args.rows)
+        print(f"{args.rows:,}行 {os.path.getsize(path):,}bytes")
+
+        # 2つ目以降のプロセスの起動と同じ状態にする
+        load_compiled(path)
+
+        rng = random.Random(1)
+        patient_ids = [100000 + rng.randrange(args.rows) for _ in range(args.lookups)]
+        for name, loader, lookup in (("全列推論", load_inferred, lookup_inferred),
+                                     ("列選択・分割", load_roster, lookup_roster),
+                                     ("コンパイル済み", load_compiled, lookup_roster)):
+            elapsed, peak, retained, lookup_elapsed, size = measure(loader, lookup, path, patient_ids)
+            print(f"{name}")
+            print(f"  読み込み {elapsed * 1000:8.1f}ms  ピークメモリ {peak / 1024 / 1024:6.1f}MB  "
+                  f"保持メモリ 1人あたり {retained / args.rows:5.0f}bytes")
+            print(f"  検索と項目取得{args.lookups}回 {lookup_elapsed * 1000:8.1f}ms  取得結果1件 {size:,}bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,11 @@
-from .data_export_service import export_to_csv, import_from_csv
-from .file_monitor_service import check_file_exists, start_file_monitoring
+from .batch_plan_service import generate_plans
+from .data_export_service import export_changes_to_csv, export_to_csv, import_from_csv
+from .file_monitor_service import check_file_exists, start_file_monitoring, stop_file_monitoring
+from .master_data_cache import get_master_data
 from .patient_service import (
     fetch_patient_history,
+    fetch_patient_history_page,
+    get_patient_roster,
     load_main_diseases,
     load_patient_data,
     load_sheet_names,
@@ -10,13 +14,19 @@ from .treatment_plan_service import generate_plan, populate_common_sheet
 
 __all__ = [
     'generate_plan',
+    'generate_plans',
     'populate_common_sheet',
     'load_patient_data',
+    'get_patient_roster',
     'load_main_diseases',
     'load_sheet_names',
+    'get_master_data',
     'fetch_patient_history',
+    'fetch_patient_history_page',
     'start_file_monitoring',
+    'stop_file_monitoring',
     'check_file_exists',
     'export_to_csv',
+    'export_changes_to_csv',
     'import_from_csv',
 ]
@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Iterable, Optional, Sequence
+
+from database import get_session
+from models import PatientInfo
+from services.treatment_plan_service import COMMON_SHEET_CELL_MAP, build_plan_file
+from utils import config_manager
+
+
+@dataclass
+class PlanResult:
+    """計画書1件分の生成結果"""
+    plan_id: Optional[int]
+    file_path: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchReport:
+    """一括生成の結果"""
+    results: list[PlanResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def succeeded(self) -> list[PlanResult]:
+        return [result for result in self.results if result.succeeded]
+
+    @property
+    def failed(self) -> list[PlanResult]:
+        return [result for result in self.results if not result.succeeded]
+
+    @property
+    def plans_per_second(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return len(self.succeeded) / self.elapsed
+
+
+def snapshot_plan(patient_info: Any) -> SimpleNamespace:
+    """セッションから切り離して別プロセスへ渡せる計画書データを作成"""
+    values = {attr: getattr(patient_info, attr) for _, attr in COMMON_SHEET_CELL_MAP}
+    values['id'] = getattr(patient_info, 'id', None)
+    return SimpleNamespace(**values)
+
+
+def _generate_one(plan: SimpleNamespace, output_dir: str) -> PlanResult:
+    try:
+        file_path = build_plan_file(plan, output_dir)
+        return PlanResult(plan_id=plan.id, file_path=file_path)
+    except Exception as e:
+        return PlanResult(plan_id=plan.id, error=str(e))
+
+
+def generate_plans(plans: Iterable[Any], output_dir: str, workers: int = 1) -> BatchReport:
+    """計画書を一括生成（ファイルは開かない）"""
+    snapshots = [plan if isinstance(plan, SimpleNamespace) else snapshot_plan(plan) for plan in plans]
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [_generate_one(plan, output_dir) for plan in snapshots]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_generate_one, snapshots, [output_dir] * len(snapshots)))
+
+    return BatchReport(results=results, elapsed=time.perf_counter() - start)
+
+
+def load_plans(plan_ids: Optional[Sequence[int]] = None) -> list[SimpleNamespace]:
+    """patient_infoから計画書データを読み込む（未指定なら全件）"""
+    with get_session() as session:
+        query = session.query(PatientInfo)
+        if plan_ids:
+            query = query.filter(PatientInfo.id.in_(plan_ids))
+        return [snapshot_plan(info) for info in query.order_by(PatientInfo.id.asc())]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """計画書一括生成のコマンドライン入口"""
+    settings = config_manager.get_settings()
+
+    parser = argparse.ArgumentParser(description="生活習慣病療養計画書を一括生成します")
+    parser.add_argument("plan_ids", nargs="*", type=int, help="patient_infoのID（省略時は全件）")
+    parser.add_argument("--output-dir", default=settings.paths.output_path, help="出力先フォルダ")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並列プロセス数")
+    args = parser.parse_args(argv)
+
+    plans = load_plans(args.plan_ids)
+    report = generate_plans(plans, args.output_dir, workers=args.workers)
+
+    for result in report.results:
+        if result.succeeded:
+            print(f"OK   {result.plan_id}: {result.file_path}")
+        else:
+            print(f"NG   {result.plan_id}: {result.error}")
+
+    print(f"成功 {len(report.succeeded)}件 / 失敗 {len(report.failed)}件 "
+          f"({report.elapsed:.2f}秒, {report.plans_per_second:.1f}件/秒)")
+    return 0 if not report.failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,71 +1,399 @@
 import csv
+import hashlib
 import os
 import re
-from datetime import datetime
-from typing import Any, Optional, Tuple
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Callable, NamedTuple, Optional, Tuple
 
-from sqlalchemy import Boolean, Date, Float, Integer
+from sqlalchemy import Boolean, Date, Float, Integer, bindparam, insert, select, update
 
 from database import get_session
-from models import PatientInfo
+from models import ExportWatermark, ImportedFile, PatientInfo
+from models.change_counter import allocate_change_seq, committed_change_seq
+from models.patient_info import TRACKING_COLUMNS, natural_key_hash
+from utils import config_manager
 
 
-def _convert_value(column, raw: str) -> Any:
-    """CSV文字列をカラム型に応じてPython値に変換"""
-    if raw == '' or raw is None:
-        # Boolean は空文字を False ではなく None として扱う
-        return None
+@dataclass
+class ImportRowError:
+    """取り込めなかった行（line_noはCSVの行番号、ヘッダーが1行目）"""
+    line_no: int
+    message: str
+    column: Optional[str] = None
+    value: Optional[str] = None
 
+
+@dataclass
+class ImportReport:
+    """CSV取込の結果"""
+    file_path: str
+    inserted: int = 0   # 追加した行数
+    updated: int = 0    # 同じ計画書の内容が変わっていたので更新した行数
+    skipped: int = 0    # 既存の行と同じだったので取り込まなかった行数
+    batches: int = 0
+    elapsed: float = 0.0
+    errors: list[ImportRowError] = field(default_factory=list)
+    fatal: Optional[str] = None  # 取込を中断したエラー
+    fingerprint: Optional[str] = None
+    already_imported_at: Optional[datetime] = None  # 同じ内容のファイルを取り込んだ日時
+
+    @property
+    def imported(self) -> int:
+        return self.inserted + self.updated
+
+    @property
+    def rows_per_second(self) -> float:
+        processed = self.inserted + self.updated + self.skipped
+        return processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.fatal is None and not self.errors
+
+    def summary(self) -> str:
+        """画面に表示するメッセージ"""
+        if self.fatal is not None:
+            return f"{self.fatal}（{self.imported}件は取込済み）" if self.imported else self.fatal
+        if self.already_imported_at is not None:
+            return f"このファイルは{self.already_imported_at:%Y/%m/%d %H:%M}にインポート済みです"
+        message = (f"CSVファイルからインポートしました（追加{self.inserted}件・更新{self.updated}件・"
+                   f"変更なし{self.skipped}件、{self.rows_per_second:,.0f}件/秒）")
+        if self.errors:
+            first = self.errors[0]
+            message += f"。{len(self.errors)}行は取り込めませんでした（{first.line_no}行目: {first.message}）"
+        return message
+
+
+class _CellError(ValueError):
+    """1セルの変換エラー"""
+
+    def __init__(self, column: str, value: str) -> None:
+        super().__init__(f"{column}の値を変換できません: {value}")
+        self.column = column
+        self.value = value
+
+
+def _compile_converter(column) -> Callable[[str], Any]:
+    """カラム型に応じたCSV文字列の変換関数を作成（空文字は型によらずNone）"""
     column_type = column.type
+    convert: Callable[[str], Any]
     if isinstance(column_type, Boolean):
-        return raw == 'True'
-    if isinstance(column_type, Date):
-        return datetime.strptime(raw, '%Y-%m-%d').date()
-    if isinstance(column_type, Integer):
-        return int(raw)
-    if isinstance(column_type, Float):
-        return float(raw)
-    return raw
-
-
-def export_to_csv(export_folder: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-    """CSV出力"""
+        convert = lambda raw: raw == 'True'
+    elif isinstance(column_type, Date):
+        convert = date.fromisoformat
+    elif isinstance(column_type, Integer):
+        convert = int
+    elif isinstance(column_type, Float):
+        convert = float
+    else:
+        return lambda raw: raw or None
+
+    return lambda raw: convert(raw) if raw else None
+
+
+def _compile_row_converter(header: list[str]) -> Callable[[list[str]], dict[str, Any]]:
+    """ヘッダーの並びに合わせて1行をINSERT用の辞書に変換する関数を作成（CSVにない列はNone）"""
+    plan = [
+        (column.name, header.index(column.name) if column.name in header else None, _compile_converter(column))
+        for column in PatientInfo.__table__.columns if column.name != 'id' and column.name not in TRACKING_COLUMNS
+    ]
+
+    def convert_row(row: list[str]) -> dict[str, Any]:
+        values = {}
+        for name, index, convert in plan:
+            raw = row[index] if index is not None and index < len(row) else ''
+            try:
+                values[name] = convert(raw)
+            except ValueError as e:
+                raise _CellError(name, raw) from e
+        return values
+
+    return convert_row
+
+
+@dataclass(frozen=True)
+class ExportFilter:
+    """CSV出力の絞り込み条件（Noneの条件は使わない。発行日は両端を含む）"""
+    issue_date_from: Optional[date] = None
+    issue_date_to: Optional[date] = None
+    department_id: Optional[int] = None
+    doctor_id: Optional[int] = None
+    main_diagnosis: Optional[str] = None
+
+    def apply(self, statement):
+        table = PatientInfo.__table__
+        if self.issue_date_from is not None:
+            statement = statement.where(table.c.issue_date >= self.issue_date_from)
+        if self.issue_date_to is not None:
+            statement = statement.where(table.c.issue_date <= self.issue_date_to)
+        if self.department_id is not None:
+            statement = statement.where(table.c.department_id == self.department_id)
+        if self.doctor_id is not None:
+            statement = statement.where(table.c.doctor_id == self.doctor_id)
+        if self.main_diagnosis is not None:
+            statement = statement.where(table.c.main_diagnosis == self.main_diagnosis)
+        return statement
+
+
+def _export_columns():
+    return [column for column in PatientInfo.__table__.columns if column.name not in TRACKING_COLUMNS]
+
+
+def _write_csv(session, statement, csv_path: str, chunk_size: int) -> int:
+    """statementの結果をchunk_size行ずつ受け取りながらCSVに書き込み、書き込んだ行数を返す"""
+    columns = _export_columns()
+    # yield_perはstream_resultsも有効にする（MySQLではサーバー側カーソルで受け取る）
+    result = session.execute(statement.execution_options(yield_per=chunk_size))
+
+    row_count = 0
+    with open(csv_path, 'w', newline='', encoding='shift_jis', errors='ignore') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow([column.name for column in columns])
+        for rows in result.partitions():
+            writer.writerows(rows)
+            row_count += len(rows)
+    return row_count
+
+
+def export_to_csv(export_folder: str, filters: Optional[ExportFilter] = None,
+                  chunk_size: Optional[int] = None) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """CSV出力（行をchunk_size行ずつ受け取りながら書き込み、表全体をメモリに載せない）"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     csv_filename = f"patient_info_export_{timestamp}.csv"
     csv_path = os.path.join(export_folder, csv_filename)
     os.makedirs(export_folder, exist_ok=True)
 
+    chunk_size = chunk_size or config_manager.get_settings().csv_export.chunk_size
+    statement = select(*_export_columns()).order_by(PatientInfo.__table__.c.id)
+    if filters is not None:
+        statement = filters.apply(statement)
+
     try:
         with get_session() as session:
-            patient_data = session.query(PatientInfo).all()
-            columns = PatientInfo.__table__.columns
-
-            with open(csv_path, 'w', newline='', encoding='shift_jis', errors='ignore') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow([column.name for column in columns])
-                for patient in patient_data:
-                    writer.writerow([getattr(patient, column.name) for column in columns])
-
+            _write_csv(session, statement, csv_path, chunk_size)
         return csv_filename, csv_path, None
     except Exception as e:
         return None, None, str(e)
 
 
-def import_from_csv(file_path: str) -> Optional[str]:
-    """CSV取込"""
+@dataclass
+class ChangeExportResult:
+    """差分のCSV出力の結果"""
+    csv_filename: Optional[str] = None
+    csv_path: Optional[str] = None
+    row_count: int = 0
+    since: Optional[int] = None      # 前回出力した変更番号（Noneは初回で全件出力）
+    watermark: Optional[int] = None  # 今回出力した変更番号の上限
+    error: Optional[str] = None
+
+
+def export_changes_to_csv(export_folder: str, filters: Optional[ExportFilter] = None,
+                          chunk_size: Optional[int] = None, name: str = 'default') -> ChangeExportResult:
+    """前回の差分出力から追加・更新された行だけをCSV出力し、出力に成功したら基準の変更番号（ウォーターマーク）を進める
+
+    今回の上限はコミット済みの変更番号のカウンタの値とする。変更番号はコミットの順に払い出されるので、
+    上限以下の行はすべてコミット済みで、出力中やコミット前の変更は上限より大きい番号になって次回に回る。
+    基準は出力先の名前と絞り込み条件の組ごとに持つ。変更がなければファイルは作らない
+    """
+    result = ChangeExportResult()
+    chunk_size = chunk_size or config_manager.get_settings().csv_export.chunk_size
+    table = PatientInfo.__table__
+    watermark_name = _watermark_name(name, filters)
+
+    try:
+        with get_session() as session:
+            result.since = session.execute(
+                select(ExportWatermark.change_seq).where(ExportWatermark.name == watermark_name)).scalar()
+            watermark = committed_change_seq(session.connection())
+            if watermark <= (result.since or 0):
+                return result
+            result.watermark = watermark
+
+            statement = select(*_export_columns()).where(table.c.change_seq <= watermark)
+            if result.since is not None:
+                statement = statement.where(table.c.change_seq > result.since)
+            if filters is not None:
+                statement = filters.apply(statement)
+            statement = statement.order_by(table.c.id)
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            csv_filename = f"patient_info_changes_{timestamp}.csv"
+            csv_path = os.path.join(export_folder, csv_filename)
+            os.makedirs(export_folder, exist_ok=True)
+            result.row_count = _write_csv(session, statement, csv_path, chunk_size)
+            if result.row_count:
+                result.csv_filename, result.csv_path = csv_filename, csv_path
+            else:
+                # 絞り込み条件に合う変更がなかった
+                os.remove(csv_path)
+
+            values = {'change_seq': watermark, 'exported_at': datetime.now(), 'row_count': result.row_count}
+            if result.since is None:
+                session.execute(insert(ExportWatermark).values(name=watermark_name, **values))
+            else:
+                session.execute(update(ExportWatermark).where(ExportWatermark.name == watermark_name).values(values))
+            session.commit()
+    except Exception as e:
+        result.error = str(e)
+    return result
+
+
+def _watermark_name(name: str, filters: Optional[ExportFilter]) -> str:
+    """絞り込み条件ごとの基準の名前（条件が違えば出力済みの範囲も違う）"""
+    if filters is None or filters == ExportFilter():
+        return name
+    digest = hashlib.sha256(repr(filters).encode('utf-8')).hexdigest()[:16]
+    return f"{name}:{digest}"
+
+
+def file_fingerprint(file_path: str) -> str:
+    """ファイル内容のSHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def import_from_csv(file_path: str, batch_size: Optional[int] = None) -> ImportReport:
+    """CSV取込（1行ずつ読み、batch_size行ごとに既存の行と照合して追加・更新しコミットする）
+
+    取込済みと同じ内容のファイルは何もしない。行は自然キー（患者ID・発行日・主病名・シート名・作成回数）で
+    既存の行と照合し、新しい行は追加、内容が変わった行は更新、同じ行は飛ばすので、同じ行を何度取り込んでも重複しない。
+    ファイル内に同じ計画書で内容の異なる行がある場合は、バッチの区切りによらず後の行を使い、先の行をerrorsへ記録する。
+    変換できない行は取り込まずに行番号とともにerrorsへ記録し、残りの行の取込を続ける。
+    ファイルやデータベースのエラーはfatalに記録して中断する（コミット済みのバッチは残る）
+    """
+    report = ImportReport(file_path)
     file_name = os.path.basename(file_path)
     if not re.match(r'^patient_info_.*\.csv$', file_name):
-        return "インポートエラー:このファイルはインポートできません"
+        report.fatal = "インポートエラー:このファイルはインポートできません"
+        return report
 
+    batch_size = batch_size or config_manager.get_settings().csv_import.batch_size
+    started = time.perf_counter()
     try:
-        columns = [c for c in PatientInfo.__table__.columns if c.name != 'id']
-        with open(file_path, encoding='shift_jis') as csvfile:
-            csv_reader = csv.DictReader(csvfile)
-            with get_session() as session:
+        report.fingerprint = file_fingerprint(file_path)
+        with open(file_path, encoding='shift_jis', newline='') as csvfile, get_session() as session:
+            imported_at = session.execute(
+                select(ImportedFile.imported_at).where(ImportedFile.fingerprint == report.fingerprint)).scalar()
+            if imported_at is not None:
+                report.already_imported_at = imported_at
+                return report
+
+            csv_reader = csv.reader(csvfile)
+            header = next(csv_reader, None)
+            if header is not None:
+                convert_row = _compile_row_converter(header)
+
+                batch: list[tuple[int, dict[str, Any]]] = []
+                seen: dict[str, _SeenRow] = {}
+                line_no = csv_reader.line_num + 1
                 for row in csv_reader:
-                    values = {col.name: _convert_value(col, row.get(col.name, '')) for col in columns}
-                    session.add(PatientInfo(**values))
-                session.commit()
-        return None
+                    if row:
+                        try:
+                            batch.append((line_no, convert_row(row)))
+                        except _CellError as e:
+                            report.errors.append(ImportRowError(line_no, e.args[0], e.column, e.value))
+                    if len(batch) >= batch_size:
+                        _merge_batch(session, batch, report, seen)
+                        batch = []
+                    line_no = csv_reader.line_num + 1
+                if batch:
+                    _merge_batch(session, batch, report, seen)
+
+            session.add(ImportedFile(fingerprint=report.fingerprint, file_name=file_name,
+                                     imported_at=datetime.now(), inserted=report.inserted,
+                                     updated=report.updated, skipped=report.skipped))
+            session.commit()
     except Exception as e:
-        return f"インポート中にエラーが発生しました: {str(e)}"
+        report.fatal = f"インポート中にエラーが発生しました: {str(e)}"
+    finally:
+        report.elapsed = time.perf_counter() - started
+    return report
+
+
+def _same_value(current: Any, incoming: Any) -> bool:
+    # CSVでは空文字とNoneを区別できない
+    return (None if current == '' else current) == (None if incoming == '' else incoming)
+
+
+class _SeenRow(NamedTuple):
+    """取込中のファイルで自然キーごとに最後に使った行"""
+    line_no: int
+    digest: bytes  # 行の内容のSHA-256
+    batch_no: int
+
+
+def _row_digest(values: dict[str, Any]) -> bytes:
+    normalized = [(name, None if value == '' else value) for name, value in sorted(values.items())]
+    return hashlib.sha256(repr(normalized).encode('utf-8')).digest()
+
+
+def _merge_batch(session, batch: list[tuple[int, dict[str, Any]]], report: ImportReport,
+                 seen: dict[str, _SeenRow]) -> None:
+    """1バッチ分を自然キーで既存の行と照合し、追加・更新をexecutemanyで実行してコミット
+
+    seenはファイル内で先に出てきた行。同じ計画書で内容の異なる行は後の行を使い、先の行をerrorsへ記録する。
+    先の行が前のバッチで反映済みなら後の行で上書きするが、件数は先の行の分だけを数える
+    （バッチの大きさによらず同じ行・同じ件数になる）
+    """
+    table = PatientInfo.__table__
+    batch_no = report.batches
+    incoming: dict[str, dict[str, Any]] = {}
+    uncounted: set[str] = set()
+    for line_no, values in batch:
+        key = natural_key_hash(values)
+        digest = _row_digest(values)
+        previous = seen.get(key)
+        if previous is not None and previous.digest == digest:
+            # ファイル内の同じ内容の行
+            report.skipped += 1
+            continue
+        if previous is not None:
+            report.errors.append(ImportRowError(
+                previous.line_no, f"{line_no}行目と同じ計画書で内容が異なるため、{line_no}行目の内容で取り込みました"))
+            if previous.batch_no != batch_no:
+                uncounted.add(key)
+        seen[key] = _SeenRow(line_no, digest, batch_no)
+        incoming[key] = {**values, 'natural_key': key}
+
+    # 既存の行は1回のIN検索でまとめて引く（同じキーが複数あれば最も古い行と照合）
+    existing: dict[str, Any] = {}
+    for row in session.execute(
+            select(table).where(table.c.natural_key.in_(list(incoming))).order_by(table.c.id)).mappings():
+        existing.setdefault(row['natural_key'], row)
+
+    inserts: list[dict[str, Any]] = []
+    updates: list[dict[str, Any]] = []
+    for key, values in incoming.items():
+        current = existing.get(key)
+        if current is None:
+            inserts.append(values)
+        elif all(_same_value(current[name], value) for name, value in values.items()):
+            if key not in uncounted:
+                report.skipped += 1
+        else:
+            updates.append({**values, 'row_id': current['id']})
+
+    try:
+        # Coreのexecutemanyはモデルのイベントを通らないので、更新日時と変更番号はここで付ける
+        changed = inserts + updates
+        if changed:
+            now = datetime.now()
+            first_seq = allocate_change_seq(session.connection(), len(changed)) - len(changed) + 1
+            for offset, values in enumerate(changed):
+                values.update(updated_at=now, change_seq=first_seq + offset)
+        if inserts:
+            session.execute(insert(table), inserts)
+        if updates:
+            session.execute(update(table).where(table.c.id == bindparam('row_id')), updates)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    report.inserted += len(inserts)
+    report.updated += sum(1 for values in updates if values['natural_key'] not in uncounted)
+    report.batches += 1
@@ -0,0 +1,71 @@
+import threading
+from typing import Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from database import get_engine
+from models import DocumentSequence
+
+# 旧方式の時刻（HHMMSS、最大235959）と重ならない範囲から連番を払い出す
+SEQUENCE_START = 240000
+SEQUENCE_END = 999999
+SEQUENCE_DIGITS = 6
+
+
+class DocumentCodeAllocator:
+    """文書番号の末尾6桁をデータベースの連番で払い出す（スレッド・プロセス・端末間で重複しない）"""
+
+    def __init__(self, engine: Optional[Engine] = None, max_retries: int = 3) -> None:
+        self._engine = engine
+        self._max_retries = max_retries
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def allocate(self, prefix: str) -> str:
+        """接頭辞ごとの次の連番を付けた文書番号を返す"""
+        engine = self._get_engine()
+        table = DocumentSequence.__table__
+
+        for _ in range(self._max_retries):
+            try:
+                with engine.begin() as connection:
+                    # 先に更新して行ロックを取ってから読むので、同時に払い出しても値は重複しない
+                    result = connection.execute(
+                        update(table)
+                        .where(table.c.prefix == prefix)
+                        .values(last_value=table.c.last_value + 1))
+                    if result.rowcount == 0:
+                        connection.execute(insert(table).values(prefix=prefix, last_value=SEQUENCE_START))
+                        value = SEQUENCE_START
+                    else:
+                        value = connection.execute(
+                            select(table.c.last_value).where(table.c.prefix == prefix)).scalar_one()
+            except IntegrityError:
+                # 他の端末が同じ接頭辞の行を同時に作成したので更新からやり直す
+                continue
+
+            if value > SEQUENCE_END:
+                raise ValueError(f"文書番号の連番が上限に達しました: {prefix}")
+            return f"{prefix}{value:0{SEQUENCE_DIGITS}d}"
+
+        raise ValueError(f"文書番号を払い出せませんでした: {prefix}")
+
+    def _get_engine(self) -> Engine:
+        with self._lock:
+            if self._engine is None:
+                self._engine = get_engine()
+            if not self._table_ready:
+                # 一括生成CLIなど初期化処理を通らない経路でも使えるようにする
+                DocumentSequence.__table__.create(self._engine, checkfirst=True)
+                self._table_ready = True
+            return self._engine
+
+
+_allocator = DocumentCodeAllocator()
+
+
+def allocate_document_code(prefix: str) -> str:
+    """文書番号を払い出す"""
+    return _allocator.allocate(prefix)
@@ -1,33 +1,198 @@
 import os
+import threading
+import time
 
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
 from utils import config_manager
 
-config = config_manager.load_config()
-csv_file_path = config.get('FilePaths', 'patient_data')
+
+def patient_csv_path():
+    """監視する患者CSVのパス（設定の再読み込み後は新しいパス）"""
+    return config_manager.get_settings().file_paths.patient_data
 
 
 class MyHandler(FileSystemEventHandler):
-    def __init__(self, page):
+    def __init__(self, page, on_changed=None, debounce_seconds=None):
         self.page = page
+        self.on_changed = on_changed
+        if debounce_seconds is None:
+            debounce_seconds = config_manager.get_settings().file_monitor.debounce_seconds
+        self.debounce_seconds = debounce_seconds
+        self._timer = None
+        self._lock = threading.Lock()
 
     def on_deleted(self, event):
-        if event.src_path == csv_file_path:
+        if event.src_path == patient_csv_path():
             self.page.window.close()
 
+    def on_modified(self, event):
+        if event.src_path == patient_csv_path():
+            self._schedule_reload()
+
+    def on_created(self, event):
+        if event.src_path == patient_csv_path():
+            self._schedule_reload()
+
+    def on_moved(self, event):
+        # 一時ファイルに書き出してから置き換える場合
+        if getattr(event, 'dest_path', None) == patient_csv_path():
+            self._schedule_reload()
+
+    def _schedule_reload(self):
+        """書き込み中は何度もイベントが届くので、最後のイベントから一定時間後に1回だけ読み直す"""
+        if self.on_changed is None:
+            return
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce_seconds, self._reload)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _reload(self):
+        with self._lock:
+            self._timer = None
+        if self.on_changed is None:
+            return
+        try:
+            self.on_changed()
+        except Exception as e:
+            print(f"患者CSVを再読み込みできません: {e}")
+
+    def cancel(self):
+        """待機中の再読み込みを取り消す"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+class StatPollingObserver(threading.Thread):
+    """患者CSVのstat（更新日時・サイズ・inode）を定期的に比べる監視（ネットワーク共有向け）
+
+    変化がない間は確認間隔を最大max_intervalまで倍々に延ばし、変化を検出したら元の間隔に戻す。
+    削除とみなすのはファイルがない場合だけで、アクセス拒否やネットワークのエラーでは前回のstatのまま次の確認で再試行する。
+    watchdogのObserverと同じくschedule・start・stop・joinで扱える
+    """
+
+    def __init__(self, file_path, interval=None, max_interval=None):
+        super().__init__(name="StatPollingObserver", daemon=True)
+        settings = config_manager.get_settings().file_monitor
+        interval = settings.poll_interval if interval is None else interval
+        max_interval = settings.max_poll_interval if max_interval is None else max_interval
+        self.file_path = file_path
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.current_interval = interval
+        self._handlers = []
+        self._stopped = threading.Event()
+        self.polls = 0
+        self.changes = 0
+        self.errors = 0
+        self.cpu_seconds = 0.0
+        self.last_latency = None
+
+    def schedule(self, event_handler, path=None, recursive=False):
+        self._handlers.append(event_handler)
 
-def start_file_monitoring(page):
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        previous = self._read_stat(None)
+        while not self._stopped.wait(self.current_interval):
+            started = time.thread_time()
+            current = self._read_stat(previous)
+            self.polls += 1
+            if current != previous:
+                self._dispatch(previous, current)
+                previous = current
+                self.current_interval = self.interval
+            else:
+                self.current_interval = min(self.current_interval * 2, self.max_interval)
+            self.cpu_seconds += time.thread_time() - started
+
+    def stats(self):
+        """確認回数・検出回数・statのエラー回数・監視に使ったCPU時間・現在の確認間隔・直近の検出遅延（秒）"""
+        return {
+            'polls': self.polls,
+            'changes': self.changes,
+            'errors': self.errors,
+            'cpu_seconds': self.cpu_seconds,
+            'interval': self.current_interval,
+            'last_latency': self.last_latency,
+        }
+
+    def _read_stat(self, fallback):
+        """現在のstat（ファイルがなければNone、一時的なエラーならfallback）"""
+        try:
+            return self._stat()
+        except OSError as e:
+            self.errors += 1
+            print(f"患者CSVの状態を確認できません（次の確認で再試行します）: {e}")
+            return fallback
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _dispatch(self, previous, current):
+        if current is None:
+            event = FileDeletedEvent(self.file_path)
+        elif previous is None:
+            event = FileCreatedEvent(self.file_path)
+        else:
+            event = FileModifiedEvent(self.file_path)
+        if current is not None:
+            # 更新日時から検出までの時間（ファイルサーバーとの時刻のずれを含む）
+            self.last_latency = max(0.0, time.time() - current[0] / 1e9)
+        self.changes += 1
+        for handler in self._handlers:
+            handler.dispatch(event)
+
+
+def create_observer(backend=None, file_path=None):
+    """設定された方式の監視オブジェクトを作成"""
+    backend = backend or config_manager.get_settings().file_monitor.backend  # watchdog / polling
+    if backend == 'watchdog':
+        return Observer()
+    if backend == 'polling':
+        return StatPollingObserver(file_path or patient_csv_path())
+    raise ValueError(f"不明なファイル監視方式です: {backend}")
+
+
+def start_file_monitoring(page, on_changed=None, backend=None):
     """ファイル監視開始"""
-    event_handler = MyHandler(page)
-    observer = Observer()
+    event_handler = MyHandler(page, on_changed)
+    csv_file_path = patient_csv_path()
+    observer = create_observer(backend, csv_file_path)
     observer.schedule(event_handler, path=os.path.dirname(csv_file_path), recursive=False)
+    # 停止時に待機中の再読み込みを取り消せるよう、監視オブジェクトにハンドラを持たせる
+    setattr(observer, 'event_handler', event_handler)
     observer.start()
     return observer
 
 
+def stop_file_monitoring(observer, timeout=2.0):
+    """ファイル監視停止（待機中の再読み込みを取り消し、監視スレッドの終了を待つ）"""
+    if observer is None:
+        return
+    event_handler = getattr(observer, 'event_handler', None)
+    if event_handler is not None:
+        event_handler.cancel()
+    observer.stop()
+    observer.join(timeout)
+    if event_handler is not None:
+        # 停止までの間に届いたイベントで登録された再読み込みも取り消す
+        event_handler.cancel()
+
+
 def check_file_exists(page):
     """ファイル存在確認"""
-    if not os.path.exists(csv_file_path):
+    if not os.path.exists(patient_csv_path()):
         page.window.close()
@@ -0,0 +1,155 @@
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+import flet as ft
+from sqlalchemy import func, select
+
+from database import get_session
+from models import ChangeCounter, MainDisease, SheetName, Template
+from models.change_counter import MASTER_DATA_CHANGES
+
+# マスタの変更を検出するための各表の件数と最大ID（索引だけで求まる）と、アプリでの追加・更新・削除の回数
+_STAMP_QUERY = select(*(
+    expr
+    for model in (MainDisease, SheetName, Template)
+    for expr in (select(func.count()).select_from(model).scalar_subquery(),
+                 select(func.max(model.id)).scalar_subquery())
+), select(ChangeCounter.last_value).where(ChangeCounter.name == MASTER_DATA_CHANGES).scalar_subquery())
+
+
+class CachedTemplate(NamedTuple):
+    """テンプレートの値（セッションから切り離した読み取り専用の写し）"""
+    main_disease: str
+    sheet_name: str
+    target_bp: Optional[str]
+    target_hba1c: Optional[str]
+    goal1: Optional[str]
+    goal2: Optional[str]
+    diet1: Optional[str]
+    diet2: Optional[str]
+    diet3: Optional[str]
+    diet4: Optional[str]
+    exercise_prescription: Optional[str]
+    exercise_time: Optional[str]
+    exercise_frequency: Optional[str]
+    exercise_intensity: Optional[str]
+    daily_activity: Optional[str]
+    other1: Optional[str]
+    other2: Optional[str]
+
+
+@dataclass(frozen=True)
+class MasterData:
+    """主病名・シート名・テンプレートのマスタ（読み込み後は変更しない）"""
+    disease_ids: Mapping[str, int]
+    main_disease_names: tuple[str, ...]
+    sheet_names: Mapping[Optional[int], tuple[str, ...]]  # Noneは全シート名
+    templates: Mapping[tuple[str, str], CachedTemplate]
+    _main_disease_options: tuple[ft.dropdown.Option, ...]
+    _sheet_name_options: Mapping[Optional[int], tuple[ft.dropdown.Option, ...]]
+
+    def disease_id(self, name: Optional[str]) -> Optional[int]:
+        """主病名のID（登録されていなければNone）"""
+        return self.disease_ids.get(name) if name else None
+
+    def main_disease_options(self) -> list[ft.dropdown.Option]:
+        """主病名のドロップダウン選択肢（作成済みのOptionを共有する）"""
+        return list(self._main_disease_options)
+
+    def sheet_name_options(self, main_disease_id: Optional[int] = None) -> list[ft.dropdown.Option]:
+        """シート名のドロップダウン選択肢（main_disease_idを省略すると全シート名）"""
+        return list(self._sheet_name_options.get(main_disease_id, ()))
+
+    def template(self, main_disease: Optional[str], sheet_name: Optional[str]) -> Optional[CachedTemplate]:
+        """主病名とシート名に対応するテンプレート"""
+        if not main_disease or not sheet_name:
+            return None
+        return self.templates.get((main_disease, sheet_name))
+
+
+def load_master_data(session) -> MasterData:
+    """マスタ3表を読み込んで検索用の辞書と選択肢を作成"""
+    diseases = session.query(MainDisease.id, MainDisease.name).order_by(MainDisease.id).all()
+    sheets = session.query(SheetName.main_disease_id, SheetName.name).order_by(SheetName.id).all()
+    templates = session.query(Template).order_by(Template.id).all()
+
+    disease_ids: dict[str, int] = {}
+    for disease_id, name in diseases:
+        # 同じ主病名が複数ある場合は先頭の行を使う（従来の.first()と同じ）
+        disease_ids.setdefault(str(name), disease_id)
+
+    sheet_names: dict[Optional[int], list[str]] = {None: []}
+    for main_disease_id, name in sheets:
+        sheet_names[None].append(str(name))
+        sheet_names.setdefault(main_disease_id, []).append(str(name))
+
+    template_map: dict[tuple[str, str], CachedTemplate] = {}
+    for template in templates:
+        template_map.setdefault((template.main_disease, template.sheet_name), CachedTemplate(
+            *(getattr(template, field) for field in CachedTemplate._fields)))
+
+    main_disease_names = tuple(str(name) for _, name in diseases)
+    return MasterData(
+        disease_ids=MappingProxyType(disease_ids),
+        main_disease_names=main_disease_names,
+        sheet_names=MappingProxyType({key: tuple(names) for key, names in sheet_names.items()}),
+        templates=MappingProxyType(template_map),
+        _main_disease_options=tuple(ft.dropdown.Option(name) for name in main_disease_names),
+        _sheet_name_options=MappingProxyType({
+            key: tuple(ft.dropdown.Option(name) for name in names) for key, names in sheet_names.items()
+        }),
+    )
+
+
+class MasterDataCache:
+    """マスタを一度だけ読み込んで保持するキャッシュ
+
+    save_templateなどで書き換えた場合はinvalidate()で破棄する。他の端末での追加・更新・削除は
+    各表の件数・最大IDと変更回数のカウンタの変化で検出する（確認はcheck_interval秒に1回まで）
+    """
+
+    def __init__(self, check_interval: float = 1.0) -> None:
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data: Optional[MasterData] = None
+        self._stamp: Optional[tuple] = None
+        self._checked_at = 0.0
+        self.load_count = 0
+
+    def get(self) -> MasterData:
+        """マスタを取得（未読み込み・破棄後・変更検出時のみデータベースから読み込む）"""
+        with self._lock:
+            now = time.monotonic()
+            if self._data is not None and now - self._checked_at < self.check_interval:
+                return self._data
+
+            with get_session() as session:
+                stamp = tuple(session.execute(_STAMP_QUERY).one())
+                if self._data is None or stamp != self._stamp:
+                    self._data = load_master_data(session)
+                    self._stamp = stamp
+                    self.load_count += 1
+            self._checked_at = now
+            return self._data
+
+    def invalidate(self) -> None:
+        """キャッシュを破棄（次のget()で読み込み直す）"""
+        with self._lock:
+            self._data = None
+            self._stamp = None
+
+
+_master_data_cache = MasterDataCache()
+
+
+def get_master_data_cache() -> MasterDataCache:
+    """プロセス共通のマスタキャッシュを取得"""
+    return _master_data_cache
+
+
+def get_master_data() -> MasterData:
+    """プロセス共通のキャッシュからマスタを取得"""
+    return _master_data_cache.get()
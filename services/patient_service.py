@@ -1,32 +1,377 @@
-import configparser
-from typing import Optional
+import hashlib
+import io
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import IO, Any, Hashable, Iterator, Optional
 
 import flet as ft
+import numpy as np
 import pandas as pd
+from pydantic import ValidationError
 
 from database import get_session
 from models import MainDisease, PatientInfo, SheetName
 from utils import config_manager
 
 
+# 患者CSVのうちアプリが使う列（0始まり）・属性名・種類。それ以外の列は読み込まない
+ROSTER_SCHEMA: tuple[tuple[int, str, str], ...] = (
+    (0, "reception_date", "date"),   # 受付日
+    (2, "patient_id", "int"),        # 患者ID
+    (3, "name", "str"),              # 氏名
+    (4, "kana", "str"),              # カナ
+    (5, "gender_code", "int"),       # 性別（1: 男性）
+    (6, "birthdate", "date"),        # 生年月日
+    (9, "doctor_id", "int"),         # 医師ID
+    (10, "doctor_name", "str"),      # 医師名
+    (13, "department_id", "int"),    # 診療科ID
+    (14, "department", "str"),       # 診療科名
+)
+
+# 整数列は欠損を許すためfloat64で読み、日付列は文字列で読んで索引作成時に変換する
+_READ_DTYPES = {"int": "float64", "str": str, "date": str}
+ROSTER_DTYPES: dict[Hashable, Any] = {column: _READ_DTYPES[kind] for column, _, kind in ROSTER_SCHEMA}
+ROSTER_COLUMNS: list[int] = [column for column, _, _ in ROSTER_SCHEMA]
+ROSTER_DATE_COLUMNS: tuple[int, ...] = tuple(column for column, _, kind in ROSTER_SCHEMA if kind == "date")
+
+
+class PatientRecord:
+    """患者CSVの1行（ROSTER_SCHEMAの列のみ）"""
+
+    __slots__ = tuple(attr for _, attr, _ in ROSTER_SCHEMA)
+
+    def __init__(self, reception_date, patient_id, name, kana, gender_code, birthdate,
+                 doctor_id, doctor_name, department_id, department) -> None:
+        self.reception_date = reception_date
+        self.patient_id = patient_id
+        self.name = name
+        self.kana = kana
+        self.gender_code = gender_code
+        self.birthdate = birthdate
+        self.doctor_id = doctor_id
+        self.doctor_name = doctor_name
+        self.department_id = department_id
+        self.department = department
+
+    @property
+    def gender(self) -> str:
+        return "男性" if self.gender_code == 1 else "女性"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PatientRecord):
+            return NotImplemented
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"PatientRecord(patient_id={self.patient_id!r}, name={self.name!r})"
+
+
+
 def load_patient_data():
     """患者CSVデータ読み込み"""
     try:
-        config_csv = config_manager.load_config()
-        csv_file_path = config_csv.get('FilePaths', 'patient_data')
-
-        date_columns = [0, 6]  # 1列目と7列目を日付として読み込む
-        nrows = 3  # csvファイルで先頭3行のみ読み込む
+        csv_file_path = config_manager.get_settings().file_paths.patient_data
 
-        df = pd.read_csv(csv_file_path, encoding="shift_jis", header=None, parse_dates=date_columns, nrows=nrows)
+        df = _read_patient_csv(csv_file_path)
+        for column in ROSTER_DATE_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.to_datetime(df[column], errors="coerce")
         return "", df
 
-    except (configparser.NoSectionError, configparser.NoOptionError):
-        return "エラー: config.iniファイルに'FilePaths'セクションまたは'patient_data'キーが見つかりません。", None
+    except ValidationError as e:
+        return f"エラー: config.iniファイルの設定が不正です。{e}", None
     except Exception as e:
         return f"エラー: {str(e)}", None
 
 
+def read_patient_csv_chunks(csv_file_path: str | IO[bytes], max_rows: Optional[int] = None,
+                            chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """患者CSVを必要な列だけ型を指定して分割読み込み（列ラベルは元の列番号）"""
+    chunk_size = chunk_size or config_manager.get_settings().roster.chunk_size
+    with pd.read_csv(csv_file_path, encoding="shift_jis", header=None, usecols=ROSTER_COLUMNS,
+                     dtype=ROSTER_DTYPES, nrows=_max_rows(max_rows), chunksize=chunk_size) as reader:
+        yield from reader
+
+
+def _read_patient_csv(csv_file_path: str, max_rows: Optional[int] = None) -> pd.DataFrame:
+    return pd.read_csv(csv_file_path, encoding="shift_jis", header=None, usecols=ROSTER_COLUMNS,
+                       dtype=ROSTER_DTYPES, nrows=_max_rows(max_rows))
+
+
+def _max_rows(max_rows: Optional[int]) -> Optional[int]:
+    if max_rows is None:
+        max_rows = config_manager.get_settings().roster.max_rows
+    return max_rows or None  # 0は全件
+
+
+@dataclass
+class RosterChange:
+    """患者CSVの再読み込みで変わった内容"""
+
+    patient_ids: set[int] = field(default_factory=set)  # 追加・変更・削除された患者ID
+    first_patient_id: Optional[int] = None               # 読み込み後の先頭の患者ID
+    first_changed: bool = False                          # 前回の通知から先頭の患者が変わった
+    incremental: bool = False                            # 追記された行だけを解析した
+
+
+class PatientRoster:
+    """患者CSVを一度だけ解析し、患者IDからPatientRecordを引く索引（ファイルが更新されたら読み直す）
+
+    compiled_pathを指定すると、解析結果をバイナリファイルにコンパイルしてmmapで参照する。
+    同じ端末の他のプロセスはCSVを解析せずにそのファイルを開くだけで済む
+    """
+
+    def __init__(self, csv_file_path: Optional[str] = None, compiled_path: Optional[str] = None) -> None:
+        self.csv_file_path = csv_file_path
+        self.compiled_path = compiled_path
+        self._lock = threading.Lock()
+        self._index: dict[int, PatientRecord] = {}
+        self._store = None
+        self._first: Optional[PatientRecord] = None
+        self._stat_key: Optional[tuple[int, int]] = None
+        # 追記判定用に、前回解析した内容のサイズとハッシュを持つ
+        self._parsed_size = 0
+        self._parsed_digest: Optional[bytes] = None
+        self._pending_changes: set[int] = set()
+        self._pending_incremental = False
+        self._reported_first_id: Optional[int] = None
+        self.error_message = ""
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    @classmethod
+    def from_dataframe(cls, df: Optional[pd.DataFrame]) -> "PatientRoster":
+        """読み込み済みのDataFrameから索引を作成（ファイルの更新は監視しない）"""
+        roster = cls()
+        if df is not None:
+            roster._build_index([df])
+        return roster
+
+    def get(self, patient_id: Any) -> Optional[PatientRecord]:
+        """患者IDに対応するレコードを返す（見つからなければNone）"""
+        self.refresh()
+        try:
+            key = int(patient_id)
+        except (TypeError, ValueError):
+            key = None
+
+        with self._lock:
+            if key is None:
+                row = None
+            elif self._store is not None:
+                row = self._store.get(key)
+            else:
+                row = self._index.get(key)
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return row
+
+    def first(self) -> Optional[PatientRecord]:
+        """CSVの先頭のレコード"""
+        self.refresh()
+        return self._first
+
+    def reload(self) -> RosterChange:
+        """ファイルの変更を反映し、前回の通知から変わった内容を返す（ファイル監視から呼ぶ）"""
+        self.refresh()
+        with self._lock:
+            first_id = self._first.patient_id if self._first is not None else None
+            change = RosterChange(self._pending_changes, first_id,
+                                  first_id != self._reported_first_id, self._pending_incremental)
+            self._pending_changes, self._pending_incremental = set(), False
+            self._reported_first_id = first_id
+            return change
+
+    def refresh(self) -> str:
+        """ファイルの更新日時・サイズが変わっていれば読み直し、エラーメッセージを返す"""
+        csv_file_path = self.csv_file_path
+        if csv_file_path is None:
+            return self.error_message
+
+        with self._lock:
+            try:
+                stat = os.stat(csv_file_path)
+                stat_key = (stat.st_mtime_ns, stat.st_size)
+                if stat_key != self._stat_key:
+                    self._stat_key = self._load(csv_file_path, stat_key)
+                self.error_message = ""
+            except Exception as e:
+                self._set_store(None)
+                self._index, self._first, self._stat_key = {}, None, None
+                self._parsed_size, self._parsed_digest = 0, None
+                self.error_message = f"エラー: {str(e)}"
+            return self.error_message
+
+    def stats(self) -> dict[str, int]:
+        """ヒット・ミス・読み込み回数と登録患者数"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'loads': self.loads, 'size': len(self)}
+
+    def __len__(self) -> int:
+        return len(self._store) if self._store is not None else len(self._index)
+
+    def _load(self, csv_file_path: str, stat_key: tuple[int, int]) -> tuple[int, int]:
+        # 2回目以降の読み込みでは、画面の更新に使うため変わった患者IDを記録する
+        previous = self._entries() if self.loads else None
+        compiled_path = self.compiled_path
+        loaded_key = self._load_compiled(csv_file_path, compiled_path, stat_key) if compiled_path else None
+        if loaded_key is None:
+            loaded_key = self._load_csv(csv_file_path, stat_key)
+
+        if previous is None:
+            self._reported_first_id = self._first.patient_id if self._first is not None else None
+        else:
+            self._pending_changes |= _changed_patient_ids(previous, self._entries())
+        return loaded_key
+
+    def _load_compiled(self, csv_file_path: str, compiled_path: str,
+                       stat_key: tuple[int, int]) -> Optional[tuple[int, int]]:
+        from services.roster_store import open_compiled_roster, remove_old_rosters
+        try:
+            store = open_compiled_roster(csv_file_path, compiled_path, stat_key)
+        except (OSError, ValueError) as e:
+            # 書き込めない場所にある場合など
+            print(f"コンパイル済み患者ファイルを使用できません: {e}")
+            return None
+        # 自分が開いていた古い版を閉じてから、古い版のファイルを削除する
+        self._set_store(store)
+        remove_old_rosters(compiled_path, keep=store.path)
+        self._index, self._first = {}, store.record(0)
+        self._parsed_size, self._parsed_digest = 0, None
+        self.loads += 1
+        return store.source_key
+
+    def _load_csv(self, csv_file_path: str, stat_key: tuple[int, int]) -> tuple[int, int]:
+        with open(csv_file_path, "rb") as f:
+            data = f.read()
+        view = memoryview(data)
+        parsed_size = self._parsed_size
+        digest = hashlib.sha256(view[:parsed_size])
+
+        appended = (
+            self._store is None and not config_manager.get_settings().roster.max_rows
+            and 0 < parsed_size < len(data) and data[parsed_size - 1:parsed_size] == b"\n"
+            and digest.digest() == self._parsed_digest
+        )
+        if appended:
+            # 前回の内容の後ろに行が追加されただけなら、追加分だけを解析する
+            self._build_index(read_patient_csv_chunks(io.BytesIO(view[parsed_size:])), base=self._index)
+            self._pending_incremental = True
+        else:
+            # 分割して読み込み、DataFrame全体は保持しない
+            digest = hashlib.sha256()
+            self._build_index(read_patient_csv_chunks(io.BytesIO(data)))
+
+        digest.update(view[parsed_size if appended else 0:])
+        self._parsed_size, self._parsed_digest = len(data), digest.digest()
+        return stat_key
+
+    def _entries(self) -> dict[int, PatientRecord]:
+        if self._store is not None:
+            return dict(self._store.items())
+        return self._index
+
+    def _set_store(self, store: Any) -> None:
+        if self._store is not None:
+            self._store.close()
+        self._store = store
+
+    def _build_index(self, chunks: Any, base: Optional[dict[int, PatientRecord]] = None) -> None:
+        self._set_store(None)
+        index: dict[int, PatientRecord] = dict(base) if base else {}
+        first = self._first if base else None
+        for chunk in chunks:
+            for record in _frame_records(chunk):
+                if first is None:
+                    first = record
+                if record.patient_id is None:
+                    continue
+                # 同じ患者IDが複数行ある場合は先頭の行を使う
+                index.setdefault(record.patient_id, record)
+        self._index = index
+        self._first = first
+        self.loads += 1
+
+
+def _changed_patient_ids(before: dict[int, PatientRecord], after: dict[int, PatientRecord]) -> set[int]:
+    """追加・変更・削除された患者ID"""
+    changed = set(before.keys() ^ after.keys())
+    for patient_id in before.keys() & after.keys():
+        old, new = before[patient_id], after[patient_id]
+        if old is not new and old != new:
+            changed.add(patient_id)
+    return changed
+
+
+def _frame_records(df: pd.DataFrame) -> Iterator[PatientRecord]:
+    """DataFrameの各行をPatientRecordに変換（列ラベルは元の列番号、ない列・欠損値はNone）"""
+    if df.empty:
+        return iter(())
+    empty = [None] * len(df)
+    series_by_column = dict(df.items())
+    columns = [
+        _column_values(series_by_column[column], kind) if column in series_by_column else empty
+        for column, _, kind in ROSTER_SCHEMA
+    ]
+    return (PatientRecord(*values) for values in zip(*columns))
+
+
+def _column_values(series: pd.Series, kind: str) -> list:
+    if kind == "date":
+        return _date_values(series)
+    if kind == "int":
+        # 医師IDなど重複の多い値は同じintオブジェクトを共有させる
+        shared: dict[float, int] = {}
+        return [None if value != value else shared.setdefault(value, int(value)) for value in series.tolist()]
+    if series.hasnans:
+        return series.astype(object).where(series.notna(), None).tolist()
+    return series.tolist()
+
+
+def _date_values(series: pd.Series) -> list:
+    # 生年月日などは重複が多いので、異なる値だけを変換して展開する
+    codes, uniques = pd.factorize(series)
+    converted = pd.to_datetime(pd.Series(uniques, dtype=object), errors="coerce")
+    # datetime64[D]をobjectにするとdatetime.date（NaTはNone）になる
+    # 末尾のNoneは欠損値（codesが-1）の変換先
+    values = np.append(converted.to_numpy(dtype="datetime64[D]").astype(object), np.array([None], dtype=object))
+    return values[codes].tolist()
+
+
+_patient_roster: Optional[PatientRoster] = None
+_patient_roster_lock = threading.Lock()
+
+
+def get_patient_roster() -> PatientRoster:
+    """config.iniの患者CSVに対応する共通の索引を取得"""
+    global _patient_roster
+    with _patient_roster_lock:
+        try:
+            settings = config_manager.get_settings()
+        except ValidationError as e:
+            roster = PatientRoster()
+            roster.error_message = f"エラー: config.iniファイルの設定が不正です。{e}"
+            return roster
+        csv_file_path = settings.file_paths.patient_data
+        compiled_path = settings.roster.compiled_path or None  # 空はコンパイルしない
+        # 設定の再読み込みでパスが変わった場合は作り直す
+        if (_patient_roster is None or _patient_roster.csv_file_path != csv_file_path
+                or _patient_roster.compiled_path != compiled_path):
+            _patient_roster = PatientRoster(csv_file_path, compiled_path)
+        return _patient_roster
+
+
+def as_patient_roster(patients: Any) -> PatientRoster:
+    """PatientRosterまたはDataFrameを索引として扱う"""
+    if isinstance(patients, PatientRoster):
+        return patients
+    return PatientRoster.from_dataframe(patients)
+
+
 def load_main_diseases():
     """主病名マスタ読み込み"""
     with get_session() as session:
@@ -44,33 +389,66 @@ def load_sheet_names(main_disease=None):
         return [ft.dropdown.Option(str(sheet.name)) for sheet in sheet_names]
 
 
+@dataclass
+class HistoryPage:
+    """患者履歴の1ページ（新しい順）"""
+
+    rows: list[dict] = field(default_factory=list)
+    next_before_id: Optional[int] = None  # 次のページの取得に渡すID（Noneは最後のページ）
+
+
+def _history_query(session, filter_patient_id):
+    # ix_patient_info_historyだけで新しい順に返る（表の参照・並べ替えなし）
+    return session.query(
+        PatientInfo.id,
+        PatientInfo.issue_date,
+        PatientInfo.department,
+        PatientInfo.doctor_name,
+        PatientInfo.main_diagnosis,
+        PatientInfo.sheet_name,
+        PatientInfo.creation_count,
+    ).filter(PatientInfo.patient_id == filter_patient_id) \
+     .order_by(PatientInfo.patient_id.asc(), PatientInfo.id.desc())
+
+
+def _history_row(info) -> dict:
+    return {
+        "id": str(info.id),
+        "issue_date": info.issue_date.strftime("%Y/%m/%d") if info.issue_date else "",
+        "department": info.department,
+        "doctor_name": info.doctor_name,
+        "main_diagnosis": info.main_diagnosis,
+        "sheet_name": info.sheet_name,
+        "count": info.creation_count,
+    }
+
+
 def fetch_patient_history(filter_patient_id: Optional[int] = None) -> list[dict]:
     """患者履歴取得"""
     if not filter_patient_id:
         return []
 
     with get_session() as session:
-        records = session.query(
-            PatientInfo.id,
-            PatientInfo.issue_date,
-            PatientInfo.department,
-            PatientInfo.doctor_name,
-            PatientInfo.main_diagnosis,
-            PatientInfo.sheet_name,
-            PatientInfo.creation_count,
-        ).filter(PatientInfo.patient_id == filter_patient_id) \
-         .order_by(PatientInfo.patient_id.asc(), PatientInfo.id.desc()) \
-         .all()
-
-        return [
-            {
-                "id": str(info.id),
-                "issue_date": info.issue_date.strftime("%Y/%m/%d") if info.issue_date else "",
-                "department": info.department,
-                "doctor_name": info.doctor_name,
-                "main_diagnosis": info.main_diagnosis,
-                "sheet_name": info.sheet_name,
-                "count": info.creation_count,
-            }
-            for info in records
-        ]
+        return [_history_row(info) for info in _history_query(session, filter_patient_id).all()]
+
+
+def fetch_patient_history_page(filter_patient_id: Optional[int] = None, before_id: Optional[int] = None,
+                               page_size: Optional[int] = None) -> HistoryPage:
+    """患者履歴をbefore_idより古い行から新しい順にpage_size件取得（idのキーセットページング）
+
+    OFFSETを使わないので、何ページ目でも索引を読む範囲は1ページ分で済む
+    """
+    if not filter_patient_id:
+        return HistoryPage()
+
+    page_size = page_size or config_manager.get_settings().data_table.page_size
+    with get_session() as session:
+        query = _history_query(session, filter_patient_id)
+        if before_id is not None:
+            query = query.filter(PatientInfo.id < before_id)
+        # 1件多く読んで次のページの有無を判定する
+        records = query.limit(page_size + 1).all()
+
+    rows = [_history_row(info) for info in records[:page_size]]
+    next_before_id = records[page_size - 1].id if len(records) > page_size else None
+    return HistoryPage(rows, next_before_id)
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+from typing import Optional
+
+INDEX_FILE_NAME = "plan_index.json"
+
+
+class PlanFileIndex:
+    """内容ハッシュから生成済み計画書ファイルを引く索引（出力フォルダ内のJSONに保存）"""
+
+    def __init__(self, output_path: str) -> None:
+        self.output_path = output_path
+        self.index_path = os.path.join(output_path, INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = self._load()
+        self.prune()
+
+    def lookup(self, content_key: str) -> Optional[str]:
+        """同じ内容の計画書ファイルがあればそのパスを返す（削除・変更済みなら索引から外す）"""
+        with self._lock:
+            entry = self._entries.get(content_key)
+            if entry is None:
+                return None
+            file_path = os.path.join(self.output_path, entry["file"])
+            if self._is_unchanged(file_path, entry):
+                return file_path
+            del self._entries[content_key]
+            self._save()
+            return None
+
+    def store(self, content_key: str, file_path: str) -> None:
+        """生成した計画書ファイルを登録"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        with self._lock:
+            self._entries[content_key] = {
+                "file": os.path.basename(file_path),
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+            }
+            self._save()
+
+    def prune(self) -> int:
+        """ファイルが削除・変更されたエントリを取り除き、その件数を返す"""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if not self._is_unchanged(os.path.join(self.output_path, entry["file"]), entry)]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._save()
+            return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"計画書の索引を読み込めません: {e}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _save(self) -> None:
+        temp_path = f"{self.index_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"計画書の索引を保存できません: {e}")
+
+    @staticmethod
+    def _is_unchanged(file_path: str, entry: dict) -> bool:
+        # Excelで開いて上書き保存された場合も再利用しない
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == entry.get("mtime_ns") and stat.st_size == entry.get("size")
+
+
+_indexes: dict[str, PlanFileIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_plan_file_index(output_path: str) -> PlanFileIndex:
+    """出力フォルダごとの索引を取得"""
+    key = os.path.abspath(output_path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = PlanFileIndex(output_path)
+        return _indexes[key]
@@ -0,0 +1,108 @@
+import queue
+import threading
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+from services.batch_plan_service import snapshot_plan
+from services.treatment_plan_service import generate_plan
+
+
+@dataclass
+class PlanJob:
+    """計画書生成ジョブ"""
+    job_id: int
+    plan: SimpleNamespace
+    on_done: Optional[Callable[["PlanJob"], None]] = None
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+class PlanJobQueue:
+    """計画書生成をワーカースレッドで順番に実行するキュー"""
+
+    def __init__(self, generate: Optional[Callable[[Any], None]] = None) -> None:
+        self._generate = generate or (lambda plan: generate_plan(plan, "LDTPform"))
+        self._queue: queue.Queue[Optional[PlanJob]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._next_id = 1
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, patient_info: Any, on_done: Optional[Callable[[PlanJob], None]] = None) -> PlanJob:
+        """計画書の生成を登録（セッションから切り離したコピーを渡すので即座に戻る）"""
+        plan = patient_info if isinstance(patient_info, SimpleNamespace) else snapshot_plan(patient_info)
+        with self._lock:
+            job = PlanJob(job_id=self._next_id, plan=plan, on_done=on_done)
+            self._next_id += 1
+            self.queued += 1
+            self._ensure_worker()
+        self._queue.put(job)
+        return job
+
+    def stats(self) -> dict[str, int]:
+        """待機中・実行中・完了・失敗の件数"""
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+
+    def join(self) -> None:
+        """登録済みのジョブがすべて終わるまで待つ"""
+        self._queue.join()
+
+    def shutdown(self) -> None:
+        """残りのジョブを処理してからワーカーを停止"""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="plan-job-worker", daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, job: PlanJob) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+
+        try:
+            self._generate(job.plan)
+        except Exception as e:
+            job.error = str(e)
+
+        with self._lock:
+            self.running -= 1
+            if job.succeeded:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                print(f"計画書生成の完了通知でエラーが発生しました: {e}")
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import socket
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Iterator, Optional
+
+from utils import config_manager
+from utils.config_manager import TimingSettings
+
+# 計画書生成の各フェーズ（記録順）
+PHASES: tuple[str, ...] = ("reuse_lookup", "barcode_render", "template_load", "populate", "save", "launch")
+
+_logger = logging.getLogger("ldtp.plan_timing")
+_logger.propagate = False
+_logger_lock = threading.Lock()
+_log_key: Optional[tuple[str, int, int]] = None
+_recent: deque["PlanTiming"] = deque()
+
+
+@dataclass
+class PlanTiming:
+    """計画書1件の生成時間の記録（時間はミリ秒）"""
+    document_code: str
+    engine: str
+    plan_id: Optional[int] = None
+    terminal: str = field(default_factory=socket.gethostname)
+    started_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+    phases: dict[str, float] = field(default_factory=dict)
+    total_ms: float = 0.0
+    file_size: Optional[int] = None
+    reused: bool = False
+    error: Optional[str] = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line: str) -> "PlanTiming":
+        return cls(**json.loads(line))
+
+
+class PlanTimer:
+    """フェーズごとの経過時間を単調時計で計測"""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+
+def _timing_settings() -> TimingSettings:
+    return config_manager.get_settings().timing
+
+
+def record_timing(timing: PlanTiming) -> None:
+    """計測結果をメモリに保持し、JSON Lines形式のログへ追記"""
+    global _recent
+    settings = _timing_settings()
+    with _logger_lock:
+        if _recent.maxlen != settings.history_size:
+            # 設定の再読み込みで保持件数が変わった場合
+            _recent = deque(_recent, maxlen=settings.history_size)
+        _recent.append(timing)
+    if _ensure_handler(settings):
+        _logger.info(timing.to_json())
+
+
+def recent_timings() -> list[PlanTiming]:
+    """このプロセスで記録した直近の計測結果"""
+    return list(_recent)
+
+
+def read_timing_log(log_path: Optional[str] = None) -> list[PlanTiming]:
+    """ローテーション済みのファイルを含めてログを古い順に読み込む"""
+    settings = _timing_settings()
+    log_path = log_path or settings.log_path
+    if not log_path:
+        return []
+
+    # RotatingFileHandlerは番号が大きいほど古い
+    paths = [f"{log_path}.{index}" for index in range(settings.backup_count, 0, -1)] + [log_path]
+    timings = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    timings.append(PlanTiming.from_json(line))
+                except (ValueError, TypeError):
+                    continue
+    return timings
+
+
+def latency_percentiles(timings: list[PlanTiming], phase: str = "total",
+                        percentiles: tuple[int, ...] = (50, 90, 99)) -> dict[str, dict[int, float]]:
+    """端末ごとのレイテンシのパーセンタイル（phase="total"で全体時間）"""
+    samples: dict[str, list[float]] = {}
+    for timing in timings:
+        if timing.error is not None:
+            continue
+        value = timing.total_ms if phase == "total" else timing.phases.get(phase)
+        if value is not None:
+            samples.setdefault(timing.terminal, []).append(value)
+
+    result = {}
+    for terminal, values in samples.items():
+        if len(values) == 1:
+            result[terminal] = {p: values[0] for p in percentiles}
+            continue
+        cut_points = statistics.quantiles(values, n=100, method="inclusive")
+        result[terminal] = {p: cut_points[min(max(p, 1), 99) - 1] for p in percentiles}
+    return result
+
+
+def _ensure_handler(settings: TimingSettings) -> bool:
+    global _log_key
+    log_path = settings.log_path
+    if not log_path:
+        return False
+
+    # 設定の再読み込みでパス・ローテーションの設定が変わったら開き直す
+    log_key = (log_path, settings.max_bytes, settings.backup_count)
+    with _logger_lock:
+        if _log_key == log_key:
+            return True
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+            handler.close()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+            handler = RotatingFileHandler(log_path, maxBytes=settings.max_bytes,
+                                          backupCount=settings.backup_count, encoding="utf-8")
+        except OSError as e:
+            print(f"計測ログを開けません: {e}")
+            return False
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _log_key = log_key
+        return True
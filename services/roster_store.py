@@ -0,0 +1,215 @@
+import glob
+import hashlib
+import mmap
+import os
+import struct
+from datetime import date
+from typing import Iterable, Iterator, Optional
+
+from services.patient_service import ROSTER_SCHEMA, PatientRecord, _frame_records, read_patient_csv_chunks
+
+# 患者CSVをコンパイルしたバイナリファイル
+#   ヘッダー | 固定長レコード領域（CSVの行順） | 患者ID昇順の索引（患者ID, レコード番号） | 文字列ヒープ（UTF-8）
+MAGIC = b"LDTPRST1"
+FORMAT_VERSION = 1
+SCHEMA_DIGEST = hashlib.sha256(repr(ROSTER_SCHEMA).encode("utf-8")).digest()
+
+# マジック・版・列定義のハッシュ・元CSVの更新日時とサイズ・レコード数・索引数・ヒープサイズ
+_HEADER = struct.Struct("<8sI32sqqIII")
+_INDEX_ENTRY = struct.Struct("<qI")
+
+# 整数はint64、日付は序数のint32、文字列はヒープ内の位置と長さ。欠損値は以下の値で表す
+_FIELD_FORMATS = {"int": "q", "date": "i", "str": "II"}
+INT_NONE = -2 ** 63
+DATE_NONE = 0
+STR_NONE = 0xFFFFFFFF
+_RECORD = struct.Struct("<" + "".join(_FIELD_FORMATS[kind] for _, _, kind in ROSTER_SCHEMA))
+
+
+class RosterStoreError(ValueError):
+    """コンパイル済み患者ファイルの形式が不正"""
+
+
+class CompiledRoster:
+    """コンパイル済み患者ファイルをmmapで開き、患者IDを二分探索してPatientRecordを返す"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _read_header(self) -> None:
+        if len(self._mmap) < _HEADER.size:
+            raise RosterStoreError(f"ヘッダーが不足しています: {self.path}")
+        magic, version, schema_digest, mtime_ns, size, count, index_count, heap_size = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or schema_digest != SCHEMA_DIGEST:
+            raise RosterStoreError(f"形式が異なります: {self.path}")
+
+        self.source_key = (mtime_ns, size)
+        self.record_count = count
+        self.index_count = index_count
+        self._records_offset = _HEADER.size
+        self._index_offset = self._records_offset + count * _RECORD.size
+        self._heap_offset = self._index_offset + index_count * _INDEX_ENTRY.size
+        if self._heap_offset + heap_size != len(self._mmap):
+            raise RosterStoreError(f"ファイルサイズが一致しません: {self.path}")
+
+    def matches(self, source_key: tuple[int, int]) -> bool:
+        """元CSVの更新日時・サイズがコンパイル時と同じか"""
+        return self.source_key == source_key
+
+    def get(self, patient_id: int) -> Optional[PatientRecord]:
+        """患者IDに対応するレコードを返す（見つからなければNone）"""
+        low, high = 0, self.index_count
+        while low < high:
+            mid = (low + high) // 2
+            key, record_no = _INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + mid * _INDEX_ENTRY.size)
+            if key < patient_id:
+                low = mid + 1
+            elif key > patient_id:
+                high = mid
+            else:
+                return self.record(record_no)
+        return None
+
+    def record(self, record_no: int) -> Optional[PatientRecord]:
+        """CSVの行順でrecord_no番目のレコード"""
+        if not 0 <= record_no < self.record_count:
+            return None
+        fields = iter(_RECORD.unpack_from(self._mmap, self._records_offset + record_no * _RECORD.size))
+        values = []
+        for _, _, kind in ROSTER_SCHEMA:
+            value = next(fields)
+            if kind == "int":
+                values.append(None if value == INT_NONE else value)
+            elif kind == "date":
+                values.append(None if value == DATE_NONE else date.fromordinal(value))
+            else:
+                length = next(fields)
+                if value == STR_NONE:
+                    values.append(None)
+                else:
+                    start = self._heap_offset + value
+                    values.append(self._mmap[start:start + length].decode("utf-8"))
+        return PatientRecord(*values)
+
+    def items(self) -> Iterator[tuple[int, PatientRecord]]:
+        """患者ID昇順に（患者ID, レコード）を返す"""
+        for position in range(self.index_count):
+            key, record_no = _INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + position * _INDEX_ENTRY.size)
+            record = self.record(record_no)
+            if record is not None:
+                yield key, record
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self.index_count
+
+
+def versioned_path(compiled_path: str, source_key: tuple[int, int]) -> str:
+    """元CSVの更新日時・サイズを付けたコンパイル済み患者ファイルのパス（roster.bin → roster.<日時>-<サイズ>.bin）"""
+    root, ext = os.path.splitext(compiled_path)
+    return f"{root}.{source_key[0]:x}-{source_key[1]:x}{ext}"
+
+
+def compile_roster(csv_file_path: str, compiled_path: str) -> str:
+    """患者CSVをコンパイル済み患者ファイルに変換し、書き込んだパスを返す
+
+    ファイル名は元CSVの版ごとに変わるので、他のプロセスがmmapで開いている古い版を置き換えることはない
+    """
+    stat = os.stat(csv_file_path)
+    source_key = (stat.st_mtime_ns, stat.st_size)
+    records = (record for chunk in read_patient_csv_chunks(csv_file_path) for record in _frame_records(chunk))
+    data = build_roster_bytes(records, source_key)
+
+    path = versioned_path(compiled_path, source_key)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        try:
+            os.replace(temp_path, path)
+        except OSError:
+            # 同じ版を他のプロセスが先に書いて開いている場合は、そのファイルを使う
+            if not os.path.exists(path):
+                raise
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path
+
+
+def remove_old_rosters(compiled_path: str, keep: str) -> None:
+    """keep以外の版のコンパイル済み患者ファイルを削除（他のプロセスが開いていて削除できなければ残す）"""
+    root, ext = os.path.splitext(compiled_path)
+    candidates = glob.glob(f"{glob.escape(root)}.*-*{ext}") + [compiled_path]
+    for path in candidates:
+        if os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def build_roster_bytes(records: Iterable[PatientRecord], source_key: tuple[int, int]) -> bytes:
+    """PatientRecordの並びをコンパイル済み形式のバイト列にする"""
+    record_area = bytearray()
+    heap = bytearray()
+    heap_offsets: dict[str, tuple[int, int]] = {}
+    index: dict[int, int] = {}
+    count = 0
+
+    for record in records:
+        fields: list[int] = []
+        for _, attr, kind in ROSTER_SCHEMA:
+            value = getattr(record, attr)
+            if kind == "int":
+                fields.append(INT_NONE if value is None else int(value))
+            elif kind == "date":
+                fields.append(DATE_NONE if value is None else value.toordinal())
+            elif value is None:
+                fields.extend((STR_NONE, 0))
+            else:
+                # 医師名・診療科名など同じ文字列はヒープに1回だけ格納する
+                if value not in heap_offsets:
+                    encoded = str(value).encode("utf-8")
+                    heap_offsets[value] = (len(heap), len(encoded))
+                    heap.extend(encoded)
+                fields.extend(heap_offsets[value])
+        record_area.extend(_RECORD.pack(*fields))
+        if record.patient_id is not None:
+            # 同じ患者IDが複数行ある場合は先頭の行を使う
+            index.setdefault(record.patient_id, count)
+        count += 1
+
+    index_area = b"".join(_INDEX_ENTRY.pack(key, index[key]) for key in sorted(index))
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, SCHEMA_DIGEST, source_key[0], source_key[1],
+                          count, len(index), len(heap))
+    return header + bytes(record_area) + index_area + bytes(heap)
+
+
+def open_compiled_roster(csv_file_path: str, compiled_path: str,
+                         source_key: tuple[int, int]) -> CompiledRoster:
+    """元CSVの版のコンパイル済み患者ファイルを開く（ないか壊れている場合はコンパイルする）"""
+    path = versioned_path(compiled_path, source_key)
+    try:
+        roster = CompiledRoster(path)
+        if roster.matches(source_key):
+            return roster
+        roster.close()
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, struct.error) as e:
+        print(f"コンパイル済み患者ファイルを作り直します: {e}")
+
+    return CompiledRoster(compile_roster(csv_file_path, compiled_path))
@@ -0,0 +1,112 @@
+import hashlib
+import io
+import os
+import pickle
+import threading
+import zipfile
+from functools import lru_cache
+from typing import Optional
+
+from openpyxl import load_workbook
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.workbook import Workbook
+
+
+class _WorkbookPickler(pickle.Pickler):
+    """Workbookを複製用に直列化するPickler"""
+
+    def reducer_override(self, obj):
+        # IndexedListは既定のpickleだと内部辞書が復元されないためリストから再構築させる
+        if type(obj) is IndexedList:
+            return IndexedList, (list(obj),)
+        return NotImplemented
+
+
+class TemplateCache:
+    """テンプレートxlsmを一度だけ解析して保持し、呼び出しごとに独立した複製を返すキャッシュ"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        self._stat_key: Optional[tuple[int, int]] = None
+        self._digest: Optional[str] = None
+        self._raw: bytes = b""
+        self._snapshot: bytes = b""
+        self.load_count = 0
+
+    @property
+    def digest(self) -> Optional[str]:
+        """キャッシュ中のテンプレートのSHA-256"""
+        return self._digest
+
+    def get_workbook(self, template_path: str) -> Workbook:
+        """テンプレートの複製を取得"""
+        with self._lock:
+            self._refresh(template_path)
+            raw, snapshot = self._raw, self._snapshot
+
+        workbook = pickle.loads(snapshot)
+        workbook.vba_archive = zipfile.ZipFile(io.BytesIO(raw))
+        return workbook
+
+    def invalidate(self) -> None:
+        """キャッシュを破棄"""
+        with self._lock:
+            self._path = None
+            self._stat_key = None
+            self._digest = None
+            self._raw = b""
+            self._snapshot = b""
+
+    def _refresh(self, template_path: str) -> None:
+        stat = os.stat(template_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if template_path == self._path and stat_key == self._stat_key:
+            return
+
+        with open(template_path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        # 更新日時だけが変わり内容が同じなら再解析しない
+        if template_path == self._path and digest == self._digest:
+            self._stat_key = stat_key
+            return
+
+        workbook = load_workbook(io.BytesIO(raw), keep_vba=True)
+        workbook.vba_archive = None
+        buffer = io.BytesIO()
+        _WorkbookPickler(buffer, pickle.HIGHEST_PROTOCOL).dump(workbook)
+
+        self._path = template_path
+        self._stat_key = stat_key
+        self._digest = digest
+        self._raw = raw
+        self._snapshot = buffer.getvalue()
+        self.load_count += 1
+
+
+_template_cache = TemplateCache()
+
+
+def load_template_workbook(template_path: str) -> Workbook:
+    """キャッシュ済みテンプレートから独立したWorkbookを取得"""
+    return _template_cache.get_workbook(template_path)
+
+
+def get_template_cache() -> TemplateCache:
+    """プロセス共通のテンプレートキャッシュを取得"""
+    return _template_cache
+
+
+def template_digest(template_path: str) -> str:
+    """テンプレートファイルのSHA-256（解析はせず、更新日時・サイズが同じ間は再計算しない）"""
+    stat = os.stat(template_path)
+    return _file_digest(template_path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=8)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    del mtime_ns, size
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -1,21 +1,27 @@
+import hashlib
+import json
 import os
+import threading
 import time
-from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
-from typing import Any
+from typing import Any, Callable, Optional
 
 from barcode.codex import Code128
 from barcode.writer import ImageWriter
-from openpyxl import load_workbook
 from openpyxl.drawing.image import Image
 from openpyxl.workbook import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 
+from services import xlsm_patch_writer
+from services.document_code_service import allocate_document_code
+from services.plan_file_index import get_plan_file_index
+from services.plan_timing import PlanTimer, PlanTiming, record_timing
+from services.template_cache import load_template_workbook, template_digest
 from utils import config_manager
 
-config = config_manager.load_config()
-barcode_config = config['Barcode']
-DOCUMENT_NUMBER = config['Document']['document_number']
+# バーコードを貼る計画書シート
+PLAN_SHEETS: tuple[str, ...] = ("初回用", "継続用")
 
 # 共通情報シートのセルとPatientInfo属性の対応
 COMMON_SHEET_CELL_MAP: list[tuple[str, str]] = [
@@ -62,31 +68,120 @@ COMMON_SHEET_CELL_MAP: list[tuple[str, str]] = [
 
 def generate_plan(patient_info, file_name) -> None:
     del file_name
-    template_path = config.get("Paths", "template_path")
-    output_path = config.get("Paths", "output_path")
+    settings = config_manager.get_settings()
+    output_path = settings.paths.output_path
+
+    timer = PlanTimer()
+    timing = PlanTiming(document_code="", engine=settings.document.plan_engine,
+                        plan_id=getattr(patient_info, 'id', None))
+    try:
+        with timer.phase("reuse_lookup"):
+            content_key = _try_plan_content_key(patient_info) if settings.document.reuse_generated else None
+            file_path = get_plan_file_index(output_path).lookup(content_key) if content_key else None
+
+        if file_path is None:
+            file_path = build_plan_file(patient_info, output_path, timer)
+            if content_key:
+                get_plan_file_index(output_path).store(content_key, file_path)
+        else:
+            timing.reused = True
+        timing.document_code = os.path.splitext(os.path.basename(file_path))[0]
+        timing.file_size = _file_size(file_path)
+
+        with timer.phase("launch"):
+            time.sleep(0.1)
+            os.startfile(file_path)
+    except Exception as e:
+        timing.error = str(e)
+        raise
+    finally:
+        timing.phases = timer.phases
+        timing.total_ms = timer.elapsed_ms
+        record_timing(timing)
+
+
+def plan_content_key(patient_info) -> str:
+    """共通情報シートの値・テンプレート・バーコード設定から計画書の内容ハッシュを計算"""
+    settings = config_manager.get_settings()
+    content = {
+        "values": [getattr(patient_info, attr) for _, attr in COMMON_SHEET_CELL_MAP],
+        "template": template_digest(settings.paths.template_path),
+        "barcode": _build_barcode_options(),
+        "document_number": settings.document.document_number,
+        "engine": settings.document.plan_engine,
+    }
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _try_plan_content_key(patient_info) -> Optional[str]:
+    # 再利用は最適化なので、ハッシュを計算できなくても生成は続ける
+    try:
+        return plan_content_key(patient_info)
+    except OSError:
+        return None
+
+
+def build_plan_file(patient_info, output_path: str, timer: Optional[PlanTimer] = None) -> str:
+    """計画書ファイルを生成し、保存先のパスを返す"""
+    timer = timer or PlanTimer()
+    settings = config_manager.get_settings()
+    template_path = settings.paths.template_path
 
     document_code = _build_document_code(patient_info)
     new_file_name = f"{document_code}.xlsm"
     file_path = os.path.join(output_path, new_file_name)
 
-    workbook = load_workbook(template_path, keep_vba=True)
-    populate_common_sheet(workbook["共通情報"], patient_info)
+    with timer.phase("barcode_render"):
+        barcode_png = render_barcode(document_code, _build_barcode_options())
+    write_plan = PLAN_ENGINES.get(settings.document.plan_engine, write_plan_openpyxl)
+    write_plan(template_path, file_path, patient_info, barcode_png, timer)
+
+    return file_path
+
+
+def write_plan_openpyxl(template_path: str, file_path: str, patient_info, barcode_png: bytes,
+                        timer: Optional[PlanTimer] = None) -> None:
+    """openpyxlでテンプレート全体を読み書きして計画書を保存"""
+    timer = timer or PlanTimer()
+    with timer.phase("template_load"):
+        workbook = load_template_workbook(template_path)
 
-    options = _build_barcode_options()
-    buffers = [
-        _add_barcode_to_sheet(workbook["初回用"], document_code, options),
-        _add_barcode_to_sheet(workbook["継続用"], document_code, options),
-    ]
+    with timer.phase("populate"):
+        populate_common_sheet(workbook["共通情報"], patient_info)
+        for sheet_name in PLAN_SHEETS:
+            _add_barcode_to_sheet(workbook[sheet_name], barcode_png)
+        _activate_target_sheet(workbook, patient_info.creation_count)
 
-    _activate_target_sheet(workbook, patient_info.creation_count)
+    with timer.phase("save"):
+        workbook.save(file_path)
 
-    workbook.save(file_path)
 
-    for buffer in buffers:
-        buffer.close()
+def write_plan_xml_patch(template_path: str, file_path: str, patient_info, barcode_png: bytes,
+                         timer: Optional[PlanTimer] = None) -> None:
+    """テンプレートのzipを直接書き換えて計画書を保存（変更パーツ以外はそのままコピー）"""
+    timer = timer or PlanTimer()
+    with timer.phase("populate"):
+        barcode = config_manager.get_settings().barcode
+        layout = xlsm_patch_writer.PatchLayout(
+            common_sheet="共通情報",
+            cells=tuple(cell for cell, _ in COMMON_SHEET_CELL_MAP),
+            plan_sheets=PLAN_SHEETS,
+            image_anchor=barcode.image_position,
+            image_size=(barcode.image_width, barcode.image_height),
+        )
+        values = [getattr(patient_info, attr) for _, attr in COMMON_SHEET_CELL_MAP]
 
-    time.sleep(0.1)
-    os.startfile(file_path)
+    # テンプレートの解析はキャッシュされ、更新時のみ保存フェーズに含まれる
+    with timer.phase("save"):
+        xlsm_patch_writer.write_plan(template_path, file_path, layout, values,
+                                     _target_sheet_name(patient_info.creation_count), barcode_png)
+
+
+PLAN_ENGINES = {
+    "openpyxl": write_plan_openpyxl,
+    "xml_patch": write_plan_xml_patch,
+}
 
 
 def populate_common_sheet(common_sheet, patient_info) -> None:
@@ -99,36 +194,89 @@ def _build_document_code(patient_info) -> str:
     department_id = str(patient_info.department_id).zfill(3)
     doctor_id = str(patient_info.doctor_id).zfill(5)
     issue_date = patient_info.issue_date.strftime("%Y%m%d")
-    current_time = datetime.now().strftime("%H%M%S")
-    return f"{patient_id}{DOCUMENT_NUMBER}{department_id}{doctor_id}{issue_date}{current_time}"
+    # 末尾6桁は以前の時刻（HHMMSS）に代えてデータベースの連番を使う
+    document_number = config_manager.get_settings().document.document_number
+    return allocate_document_code(f"{patient_id}{document_number}{department_id}{doctor_id}{issue_date}")
+
+
+def _file_size(file_path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return None
 
 
 def _build_barcode_options() -> dict[str, Any]:
+    barcode = config_manager.get_settings().barcode
     return {
-        'write_text': barcode_config.getboolean('write_text', False),
-        'module_height': barcode_config.getfloat('module_height', 15),
-        'module_width': barcode_config.getfloat('module_width', 0.25),
-        'quiet_zone': barcode_config.getint('quiet_zone', 1),
+        'write_text': barcode.write_text,
+        'module_height': barcode.module_height,
+        'module_width': barcode.module_width,
+        'quiet_zone': barcode.quiet_zone,
     }
 
 
-def _add_barcode_to_sheet(sheet: Worksheet, data: str, options: dict) -> BytesIO:
+class _PngImage(Image):
+    """生成済みPNGバイト列を貼り付けるImage（保存時にPILで開き直さず、そのバイト列を書き込む）"""
+
+    def __init__(self, png: bytes):
+        # PILはヘッダーだけを読んで幅・高さ・形式を設定する（画素はデコードしない）
+        super().__init__(BytesIO(png))
+        self._png = png
+
+    def _data(self) -> bytes:
+        return self._png
+
+
+def render_barcode(data: str, options: dict[str, Any]) -> bytes:
+    """Code128バーコードのPNGバイト列を取得（同一データ・オプションはキャッシュを再利用）"""
+    return _barcode_png_cache()(data, tuple(sorted(options.items())))
+
+
+_barcode_cache: Optional[tuple[int, Callable[[str, tuple[tuple[str, Any], ...]], bytes]]] = None
+_barcode_cache_lock = threading.Lock()
+
+
+def _barcode_png_cache() -> Callable[[str, tuple[tuple[str, Any], ...]], bytes]:
+    """[Barcode] cache_size件のLRUキャッシュ付きの描画関数（設定の再読み込みでサイズが変わったら作り直す）"""
+    global _barcode_cache
+    size = config_manager.get_settings().barcode.cache_size
+    with _barcode_cache_lock:
+        if _barcode_cache is None or _barcode_cache[0] != size:
+            _barcode_cache = (size, lru_cache(maxsize=size)(_render_barcode_png))
+        return _barcode_cache[1]
+
+
+def clear_barcode_cache() -> None:
+    """描画済みのバーコードを破棄"""
+    global _barcode_cache
+    with _barcode_cache_lock:
+        _barcode_cache = None
+
+
+def _render_barcode_png(data: str, options: tuple[tuple[str, Any], ...]) -> bytes:
     barcode = Code128(data, writer=ImageWriter())
     buffer = BytesIO()
-    barcode.write(buffer, options=options)
-    buffer.seek(0)  # 重要: ポインタを先頭に戻す
-    img = Image(buffer)
-    img.width = barcode_config.getint('image_width', 200)
-    img.height = barcode_config.getint('image_height', 30)
-    sheet.add_image(img, barcode_config.get('image_position', 'B2'))
-    return buffer
+    barcode.write(buffer, options=dict(options))
+    return buffer.getvalue()
+
+
+def _add_barcode_to_sheet(sheet: Worksheet, png: bytes) -> None:
+    barcode = config_manager.get_settings().barcode
+    img = _PngImage(png)
+    img.width = barcode.image_width
+    img.height = barcode.image_height
+    sheet.add_image(img, barcode.image_position)
 
 
 def _activate_target_sheet(workbook: Workbook, creation_count: int) -> None:
     for sheet in workbook.worksheets:
         sheet.sheet_view.tabSelected = False
 
-    target_name = "初回用" if creation_count == 1 else "継続用"
-    ws_plan = workbook[target_name]
+    ws_plan = workbook[_target_sheet_name(creation_count)]
     ws_plan.sheet_view.tabSelected = True
     workbook.active = ws_plan
+
+
+def _target_sheet_name(creation_count: int) -> str:
+    return "初回用" if creation_count == 1 else "継続用"
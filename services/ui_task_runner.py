@@ -0,0 +1,158 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from utils import config_manager
+
+
+@dataclass(eq=False)
+class UITask:
+    """UIイベントから登録した処理"""
+    task_id: int
+    key: Optional[str]   # 表示用の読み込みの種類（Noneは保存・削除などの書き込み）
+    future: Optional[Future] = None
+    stale: bool = False  # 結果を画面に反映しない
+
+
+class UITaskRunner:
+    """イベントハンドラのDB・ファイル処理を上限付きのスレッドプールで実行し、完了したら結果を画面に反映する
+
+    keyを付けたタスク（表示用の読み込み）は、同じkeyの新しいタスクが登録されるか、invalidate()が呼ばれる
+    （別の患者に切り替わる）と古くなり、未開始なら取り消し、実行中なら結果を反映しない。
+    keyのないタスク（書き込み）は必ず実行して反映する。on_doneとon_errorはワーカースレッドから順番に呼ばれる
+    """
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 on_busy_change: Optional[Callable[[bool], None]] = None) -> None:
+        max_workers = max_workers or config_manager.get_settings().ui.worker_threads
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ui-task")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._apply_lock = threading.Lock()
+        self._busy_lock = threading.Lock()
+        self._busy_shown = False
+        self._latest: dict[str, UITask] = {}
+        self._pending: set[UITask] = set()
+        self._next_id = 1
+        self.on_busy_change = on_busy_change
+        self.completed = 0
+        self.failed = 0
+        self.discarded = 0
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return bool(self._pending)
+
+    def submit(self, work: Callable[[], Any], on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None, key: Optional[str] = None) -> UITask:
+        """workをスレッドプールで実行し、完了したらon_done(結果)、例外ならon_error(例外)を呼ぶ"""
+        superseded: list[UITask] = []
+        with self._lock:
+            task = UITask(task_id=self._next_id, key=key)
+            self._next_id += 1
+            if key is not None:
+                previous = self._latest.get(key)
+                if previous is not None:
+                    superseded.append(previous)
+                self._latest[key] = task
+            self._pending.add(task)
+
+        self._cancel(superseded)
+        self._notify_busy()
+        task.future = self._executor.submit(self._run, task, work, on_done, on_error)
+        task.future.add_done_callback(lambda future: self._finish(task, future.cancelled()))
+        return task
+
+    def invalidate(self) -> None:
+        """登録済みの表示用の読み込みをすべて古くする（別の患者に切り替えたとき）"""
+        with self._lock:
+            superseded = list(self._latest.values())
+            self._latest.clear()
+        self._cancel(superseded)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """登録済みのタスクがすべて終わるまで待つ（終わればTrue）"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def stats(self) -> dict[str, int]:
+        """実行中・完了・失敗・反映しなかった件数"""
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'completed': self.completed,
+                'failed': self.failed,
+                'discarded': self.discarded,
+            }
+
+    def shutdown(self) -> None:
+        """表示用の読み込みを取り消し、書き込みが終わるのを待ってから停止"""
+        self.invalidate()
+        self._executor.shutdown(wait=True)
+
+    def _cancel(self, tasks: list[UITask]) -> None:
+        # 取り消したFutureの完了通知は_lockを取るので、_lockを持たずに呼ぶ
+        for task in tasks:
+            with self._lock:
+                task.stale = True
+            if task.future is not None:
+                task.future.cancel()
+
+    def _still_current(self, task: UITask) -> bool:
+        """結果を反映してよければTrue（古くなっていれば反映しなかった件数に数える）"""
+        with self._lock:
+            if task.stale:
+                self.discarded += 1
+            return not task.stale
+
+    def _run(self, task: UITask, work: Callable[[], Any], on_done: Optional[Callable[[Any], None]],
+             on_error: Optional[Callable[[Exception], None]]) -> None:
+        if not self._still_current(task):
+            return
+        try:
+            argument = work()
+            succeeded, callback = True, on_done
+        except Exception as e:
+            argument = e
+            succeeded, callback = False, on_error
+
+        # 反映は1つずつ行い、古くなった結果は捨てる
+        with self._apply_lock:
+            if not self._still_current(task):
+                return
+            with self._lock:
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            if callback is not None:
+                try:
+                    callback(argument)
+                except Exception as e:
+                    print(f"処理結果の画面への反映でエラーが発生しました: {e}")
+
+    def _finish(self, task: UITask, cancelled: bool) -> None:
+        with self._lock:
+            self._pending.discard(task)
+            if task.key is not None and self._latest.get(task.key) is task:
+                del self._latest[task.key]
+            if cancelled:
+                self.discarded += 1
+            if not self._pending:
+                self._idle.notify_all()
+        self._notify_busy()
+
+    def _notify_busy(self) -> None:
+        # 登録と完了が別スレッドで重なっても、最後に表示した状態と今の状態が違うときだけ通知する
+        with self._busy_lock:
+            busy = self.busy
+            if busy == self._busy_shown:
+                return
+            self._busy_shown = busy
+            if self.on_busy_change is not None:
+                try:
+                    self.on_busy_change(busy)
+                except Exception as e:
+                    print(f"処理中表示の更新でエラーが発生しました: {e}")
@@ -0,0 +1,338 @@
+import io
+import numbers
+import os
+import posixpath
+import re
+import threading
+import zipfile
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.units import pixels_to_EMU
+
+NS_OFFICE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PACKAGE_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+REL_TYPE_DRAWING = f"{NS_OFFICE_REL}/drawing"
+REL_TYPE_IMAGE = f"{NS_OFFICE_REL}/image"
+REL_TYPE_CALC_CHAIN = f"{NS_OFFICE_REL}/calcChain"
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+@dataclass(frozen=True)
+class PatchLayout:
+    """テンプレートのどこを書き換えるかの定義"""
+    common_sheet: str
+    cells: tuple[str, ...]
+    plan_sheets: tuple[str, ...]
+    image_anchor: str
+    image_size: tuple[int, int]
+
+
+@dataclass(frozen=True)
+class _CompiledTemplate:
+    base: bytes
+    common_sheet_part: str
+    cells: tuple[str, ...]
+    cell_styles: tuple[Optional[str], ...]
+    fragments: tuple[str, ...]
+    date_style: str
+    media_part: str
+    selected_parts: dict[str, tuple[tuple[str, bytes], ...]]
+
+
+_lock = threading.Lock()
+_compiled: Optional[tuple[tuple, _CompiledTemplate]] = None
+
+
+def write_plan(template_path: str, file_path: str, layout: PatchLayout, values: list[Any],
+               target_sheet: str, barcode_png: bytes) -> None:
+    """テンプレートxlsmをzipのまま差分だけ書き換えて計画書を保存"""
+    compiled = _get_compiled(template_path, layout)
+    if target_sheet not in compiled.selected_parts:
+        raise ValueError(f"選択できないシートです: {target_sheet}")
+
+    # 変更しないパーツは圧縮済みのままコピーし、差分だけを追記する
+    buffer = io.BytesIO(compiled.base)
+    with zipfile.ZipFile(buffer, "a", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(compiled.common_sheet_part, _render_common_sheet(compiled, values))
+        for part_name, data in compiled.selected_parts[target_sheet]:
+            archive.writestr(part_name, data)
+        archive.writestr(compiled.media_part, barcode_png, compress_type=zipfile.ZIP_STORED)
+
+    with open(file_path, "wb") as f:
+        f.write(buffer.getvalue())
+
+
+def _get_compiled(template_path: str, layout: PatchLayout) -> _CompiledTemplate:
+    global _compiled
+    stat = os.stat(template_path)
+    key = (template_path, stat.st_mtime_ns, stat.st_size, layout)
+    with _lock:
+        if _compiled is None or _compiled[0] != key:
+            _compiled = (key, _compile_template(template_path, layout))
+        return _compiled[1]
+
+
+def _compile_template(template_path: str, layout: PatchLayout) -> _CompiledTemplate:
+    with zipfile.ZipFile(template_path) as archive:
+        infos = {info.filename: info for info in archive.infolist()}
+        parts = {name: archive.read(name) for name in infos}
+
+    sheet_parts = _resolve_sheet_parts(parts)
+    for name in (layout.common_sheet, *layout.plan_sheets):
+        if name not in sheet_parts:
+            raise ValueError(f"テンプレートにシート'{name}'がありません")
+
+    replaced: dict[str, bytes] = {}
+    removed = _drop_calc_chain(parts, replaced)
+
+    styles, date_style = _add_date_style(parts["xl/styles.xml"].decode("utf-8"))
+    replaced["xl/styles.xml"] = styles.encode("utf-8")
+
+    media_part = _unused_part_name(parts, "xl/media/image{0}.png")
+    for sheet_name in layout.plan_sheets:
+        _add_picture_to_drawing(parts, replaced, sheet_parts[sheet_name], media_part, layout)
+
+    content_types = replaced.get("[Content_Types].xml", parts["[Content_Types].xml"]).decode("utf-8")
+    if 'Extension="png"' not in content_types:
+        content_types = content_types.replace(
+            "<Default ", '<Default Extension="png" ContentType="image/png"/><Default ', 1)
+    replaced["[Content_Types].xml"] = content_types.encode("utf-8")
+
+    common_part = sheet_parts[layout.common_sheet]
+    common_xml = _set_tab_selected(parts[common_part].decode("utf-8"), False)
+    fragments, cell_styles = _split_cells(common_xml, layout.cells)
+
+    workbook_xml = parts["xl/workbook.xml"].decode("utf-8")
+    sheet_order = re.findall(r'<sheet [^>]*?name="([^"]*)"', workbook_xml)
+    workbook_xml = _set_attribute(workbook_xml, "calcPr", "fullCalcOnLoad", "1")
+    selected_parts = {}
+    for target in layout.plan_sheets:
+        variant = [("xl/workbook.xml",
+                    _set_attribute(workbook_xml, "workbookView", "activeTab",
+                                   str(sheet_order.index(target))).encode("utf-8"))]
+        for sheet_name in layout.plan_sheets:
+            part = sheet_parts[sheet_name]
+            xml = _set_tab_selected(parts[part].decode("utf-8"), sheet_name == target)
+            variant.append((part, xml.encode("utf-8")))
+        selected_parts[target] = tuple(variant)
+
+    per_plan = {common_part, "xl/workbook.xml", *(sheet_parts[name] for name in layout.plan_sheets)}
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as base:
+        for name, info in infos.items():
+            if name in per_plan or name in removed:
+                continue
+            base.writestr(info, replaced.get(name, parts[name]), compress_type=info.compress_type)
+        for name, data in replaced.items():
+            if name not in infos:
+                base.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED)
+
+    return _CompiledTemplate(
+        base=buffer.getvalue(),
+        common_sheet_part=common_part,
+        cells=layout.cells,
+        cell_styles=tuple(cell_styles),
+        fragments=tuple(fragments),
+        date_style=date_style,
+        media_part=media_part,
+        selected_parts=selected_parts,
+    )
+
+
+def _render_common_sheet(compiled: _CompiledTemplate, values: list[Any]) -> bytes:
+    if len(values) != len(compiled.cells):
+        raise ValueError("セル数と値の数が一致しません")
+
+    pieces = [compiled.fragments[0]]
+    for index, value in enumerate(values):
+        pieces.append(_render_cell(compiled.cells[index], compiled.cell_styles[index], value, compiled.date_style))
+        pieces.append(compiled.fragments[index + 1])
+    return "".join(pieces).encode("utf-8")
+
+
+def _render_cell(ref: str, style: Optional[str], value: Any, date_style: str) -> str:
+    if isinstance(value, (datetime, date)):
+        style = date_style
+    style_attr = f' s="{style}"' if style else ""
+
+    if value is None or value == "":
+        return f'<c r="{ref}"{style_attr}/>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Integral):
+        return f'<c r="{ref}"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Real):
+        return f'<c r="{ref}"{style_attr}><v>{float(value)!r}</v></c>'
+    if isinstance(value, datetime):
+        return f'<c r="{ref}"{style_attr}><v>{(value - EXCEL_EPOCH).total_seconds() / 86400!r}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}"{style_attr}><v>{(value - EXCEL_EPOCH.date()).days}</v></c>'
+    text = escape(str(value))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _split_cells(sheet_xml: str, cells: tuple[str, ...]) -> tuple[list[str], list[Optional[str]]]:
+    """シートXMLを書き換えるセルの位置で分割"""
+    spans = []
+    for ref in cells:
+        match = re.search(rf'<c r="{ref}"(?P<attrs>[^>]*?)(?:/>|>.*?</c>)', sheet_xml, re.DOTALL)
+        if match is None:
+            raise ValueError(f"テンプレートにセル{ref}がありません")
+        style = re.search(r'\bs="(\d+)"', match.group("attrs"))
+        spans.append((match.start(), match.end(), style.group(1) if style else None))
+
+    order = sorted(range(len(cells)), key=lambda i: spans[i][0])
+    if [cells[i] for i in order] != list(cells):
+        raise ValueError("セルはシート内の出現順に指定してください")
+
+    fragments = []
+    position = 0
+    for start, end, _ in spans:
+        fragments.append(sheet_xml[position:start])
+        position = end
+    fragments.append(sheet_xml[position:])
+    return fragments, [style for _, _, style in spans]
+
+
+def _resolve_sheet_parts(parts: dict[str, bytes]) -> dict[str, str]:
+    """シート名からワークシートのパーツ名を解決"""
+    workbook_xml = parts["xl/workbook.xml"].decode("utf-8")
+    rels = _read_rels(parts["xl/_rels/workbook.xml.rels"])
+    result = {}
+    for match in re.finditer(r"<sheet [^>]*?/>", workbook_xml):
+        name = re.search(r'name="([^"]*)"', match.group(0))
+        rel_id = re.search(r'r:id="([^"]*)"', match.group(0))
+        if name and rel_id and rel_id.group(1) in rels:
+            result[name.group(1)] = _resolve_target("xl/workbook.xml", rels[rel_id.group(1)][1])
+    return result
+
+
+def _read_rels(data: bytes) -> dict[str, tuple[str, str]]:
+    rels = {}
+    for match in re.finditer(r"<Relationship [^>]*?/>", data.decode("utf-8")):
+        attrs = dict(re.findall(r'(\w+)="([^"]*)"', match.group(0)))
+        rels[attrs["Id"]] = (attrs["Type"], attrs["Target"])
+    return rels
+
+
+def _rels_part(part_name: str) -> str:
+    directory, name = posixpath.split(part_name)
+    return posixpath.join(directory, "_rels", f"{name}.rels")
+
+
+def _resolve_target(source_part: str, target: str) -> str:
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def _relative_target(source_part: str, target_part: str) -> str:
+    return posixpath.relpath(target_part, posixpath.dirname(source_part))
+
+
+def _unused_part_name(parts: dict[str, bytes], pattern: str) -> str:
+    index = 1
+    while pattern.format(index) in parts:
+        index += 1
+    return pattern.format(index)
+
+
+def _drop_calc_chain(parts: dict[str, bytes], replaced: dict[str, bytes]) -> set[str]:
+    rels_xml = parts["xl/_rels/workbook.xml.rels"].decode("utf-8")
+    removed = set()
+    for rel_id, (rel_type, target) in _read_rels(parts["xl/_rels/workbook.xml.rels"]).items():
+        if rel_type != REL_TYPE_CALC_CHAIN:
+            continue
+        part_name = _resolve_target("xl/workbook.xml", target)
+        removed.add(part_name)
+        rels_xml = re.sub(rf'<Relationship [^>]*?Id="{rel_id}"[^>]*?/>', "", rels_xml)
+        content_types = parts["[Content_Types].xml"].decode("utf-8")
+        content_types = re.sub(rf'<Override [^>]*?PartName="/{re.escape(part_name)}"[^>]*?/>', "", content_types)
+        replaced["[Content_Types].xml"] = content_types.encode("utf-8")
+    replaced["xl/_rels/workbook.xml.rels"] = rels_xml.encode("utf-8")
+    return removed
+
+
+def _add_date_style(styles_xml: str) -> tuple[str, str]:
+    """日付表示用のセル書式を追加し、そのインデックスを返す"""
+    match = re.search(r'<cellXfs count="(\d+)">', styles_xml)
+    if match is None:
+        raise ValueError("styles.xmlにcellXfsがありません")
+    index = int(match.group(1))
+    styles_xml = styles_xml.replace(match.group(0), f'<cellXfs count="{index + 1}">', 1)
+    styles_xml = styles_xml.replace(
+        "</cellXfs>",
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>', 1)
+    return styles_xml, str(index)
+
+
+def _add_picture_to_drawing(parts: dict[str, bytes], replaced: dict[str, bytes], sheet_part: str,
+                            media_part: str, layout: PatchLayout) -> None:
+    sheet_rels = _read_rels(parts.get(_rels_part(sheet_part), b""))
+    drawing_targets = [target for rel_type, target in sheet_rels.values() if rel_type == REL_TYPE_DRAWING]
+    if not drawing_targets:
+        raise ValueError(f"{sheet_part}に描画パーツがありません")
+    drawing_part = _resolve_target(sheet_part, drawing_targets[0])
+
+    drawing_rels_part = _rels_part(drawing_part)
+    rels_xml = replaced.get(drawing_rels_part, parts.get(drawing_rels_part, b"")).decode("utf-8")
+    if not rels_xml:
+        rels_xml = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    f'<Relationships xmlns="{NS_PACKAGE_REL}"></Relationships>')
+    existing_ids = set(re.findall(r'Id="([^"]*)"', rels_xml))
+    rel_id = _unused_id(existing_ids, "rId{0}")
+    rels_xml = rels_xml.replace(
+        "</Relationships>",
+        f'<Relationship Id="{rel_id}" Type="{REL_TYPE_IMAGE}" '
+        f'Target={quoteattr(_relative_target(drawing_part, media_part))}/></Relationships>', 1)
+    replaced[drawing_rels_part] = rels_xml.encode("utf-8")
+
+    drawing_xml = parts[drawing_part].decode("utf-8")
+    shape_ids = [int(value) for value in re.findall(r'<xdr:cNvPr id="(\d+)"', drawing_xml)]
+    row, col = coordinate_to_tuple(layout.image_anchor)
+    width, height = (pixels_to_EMU(value) for value in layout.image_size)
+    anchor = (
+        f'<xdr:oneCellAnchor><xdr:from><xdr:col>{col - 1}</xdr:col><xdr:colOff>0</xdr:colOff>'
+        f'<xdr:row>{row - 1}</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:from>'
+        f'<xdr:ext cx="{width}" cy="{height}"/>'
+        f'<xdr:pic><xdr:nvPicPr><xdr:cNvPr id="{max(shape_ids, default=0) + 1}" name="Barcode"/>'
+        f'<xdr:cNvPicPr><a:picLocks noChangeAspect="1"/></xdr:cNvPicPr></xdr:nvPicPr>'
+        f'<xdr:blipFill><a:blip xmlns:r="{NS_OFFICE_REL}" r:embed="{rel_id}"/>'
+        f'<a:stretch><a:fillRect/></a:stretch></xdr:blipFill>'
+        f'<xdr:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{width}" cy="{height}"/></a:xfrm>'
+        f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></xdr:spPr></xdr:pic>'
+        f'<xdr:clientData/></xdr:oneCellAnchor>'
+    )
+    if "</xdr:wsDr>" not in drawing_xml:
+        raise ValueError(f"{drawing_part}の形式に対応していません")
+    replaced[drawing_part] = drawing_xml.replace("</xdr:wsDr>", f"{anchor}</xdr:wsDr>", 1).encode("utf-8")
+
+
+def _unused_id(existing: set[str], pattern: str) -> str:
+    index = 1
+    while pattern.format(index) in existing:
+        index += 1
+    return pattern.format(index)
+
+
+def _set_tab_selected(sheet_xml: str, selected: bool) -> str:
+    match = re.search(r"<sheetView\b[^>]*?(/?)>", sheet_xml)
+    if match is None:
+        return sheet_xml
+    tag = re.sub(r'\s+tabSelected="[^"]*"', "", match.group(0))
+    if selected:
+        tag = tag.replace("<sheetView", '<sheetView tabSelected="1"', 1)
+    return sheet_xml[:match.start()] + tag + sheet_xml[match.end():]
+
+
+def _set_attribute(xml: str, element: str, name: str, value: str) -> str:
+    match = re.search(rf"<{element}\b[^>]*?/?>", xml)
+    if match is None:
+        return xml
+    tag = re.sub(rf'\s+{name}="[^"]*"', "", match.group(0))
+    tag = tag.replace(f"<{element}", f'<{element} {name}="{value}"', 1)
+    return xml[:match.start()] + tag + xml[match.end():]
@@ -1,8 +1,42 @@
+from collections import deque
+
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from models import Base
+from services.document_code_service import DocumentCodeAllocator
+from utils import config_manager
+
+
+@pytest.fixture(autouse=True)
+def isolate_timing_log(tmp_path, monkeypatch):
+    """計画書生成の計測ログをテスト用の一時フォルダに出力"""
+    settings = config_manager.get_settings().timing.model_copy(update={'log_path': str(tmp_path / 'plan_timing.jsonl')})
+    monkeypatch.setattr('services.plan_timing._timing_settings', lambda: settings)
+    monkeypatch.setattr('services.plan_timing._recent', deque(maxlen=settings.history_size))
+
+
+@pytest.fixture(autouse=True)
+def isolate_document_sequence(tmp_path, monkeypatch):
+    """文書番号の連番をテスト用の一時データベースで払い出す"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'document_sequence.db'}")
+    monkeypatch.setattr('services.document_code_service._allocator', DocumentCodeAllocator(engine))
+    yield
+    engine.dispose()
+
+
+@pytest.fixture
+def override_settings(monkeypatch):
+    """get_settings()が返す設定のセクションを一部差し替える（例: override_settings(paths={'output_path': ...})）"""
+    def override(**sections):
+        settings = config_manager.get_settings()
+        updated = settings.model_copy(update={
+            name: getattr(settings, name).model_copy(update=values) for name, values in sections.items()
+        })
+        monkeypatch.setattr(config_manager, 'get_settings', lambda reload=False: updated)
+        return updated
+    return override
 
 
 @pytest.fixture(scope='function')
@@ -1,6 +1,7 @@
 from unittest.mock import MagicMock, patch
 
 from database import connection
+from utils.config_manager import DatabaseSettings
 
 
 class TestGetEngine:
@@ -30,18 +31,18 @@ class TestGetEngine:
         assert all(engine is engines[0] for engine in engines)
 
     @patch('database.connection.create_engine')
-    def test_get_engine_creates_with_pool_settings(self, mock_create_engine):
-        """正常系: プールオプション付きでエンジンが作成される"""
+    def test_get_engine_sqlite_without_server_pool_settings(self, mock_create_engine):
+        """正常系: SQLiteではサーバー向けのプール設定を渡さない"""
         mock_engine = MagicMock()
         mock_create_engine.return_value = mock_engine
 
-        connection.get_engine()
+        with patch('database.connection.event.listens_for', return_value=lambda fn: fn):
+            connection.get_engine()
 
-        # create_engineが適切なパラメータで呼ばれることを確認
         mock_create_engine.assert_called_once()
         call_kwargs = mock_create_engine.call_args[1]
-        assert call_kwargs.get('pool_pre_ping') is True
-        assert call_kwargs.get('pool_size') == 10
+        assert 'pool_pre_ping' not in call_kwargs
+        assert 'pool_size' not in call_kwargs
 
     def test_get_engine_returns_sqlalchemy_engine(self):
         """正常系: SQLAlchemyエンジンインスタンスが返される"""
@@ -52,6 +53,88 @@ class TestGetEngine:
         assert hasattr(engine, 'url')
 
 
+class TestCreateEngineFor:
+    """create_engine_for関数のテストクラス"""
+
+    def test_sqlite_pragmas_applied_on_connect(self, tmp_path):
+        """正常系: SQLiteの接続ごとに設定したPRAGMAが適用される"""
+        settings = DatabaseSettings(db_url=f"sqlite:///{tmp_path / 'app.db'}", sqlite_journal_mode='WAL',
+                                    sqlite_synchronous='NORMAL', sqlite_busy_timeout=1234,
+                                    sqlite_cache_size=-4096, sqlite_mmap_size=1048576)
+        engine = connection.create_engine_for(settings)
+
+        with engine.connect() as conn:
+            def pragma(name):
+                return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+            assert pragma('journal_mode') == 'wal'
+            assert pragma('synchronous') == 1  # NORMAL
+            assert pragma('busy_timeout') == 1234
+            assert pragma('cache_size') == -4096
+            assert pragma('mmap_size') == 1048576
+            assert pragma('temp_store') == 2  # MEMORY
+        engine.dispose()
+
+    def test_sqlite_defaults_are_safe_on_file_server(self, tmp_path):
+        """正常系: 既定ではファイルサーバー上でも使えるDELETE・FULL・mmapなしになる"""
+        engine = connection.create_engine_for(DatabaseSettings(db_url=f"sqlite:///{tmp_path / 'app.db'}"))
+
+        with engine.connect() as conn:
+            def pragma(name):
+                return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+            assert pragma('journal_mode') == 'delete'
+            assert pragma('synchronous') == 2  # FULL
+            assert pragma('mmap_size') == 0
+        engine.dispose()
+
+    def test_sqlite_memory_keeps_default_pool(self):
+        """正常系: インメモリSQLiteは接続を共有する既定のプールのまま"""
+        engine = connection.create_engine_for(DatabaseSettings(db_url="sqlite:///:memory:"))
+
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+        assert not isinstance(engine.pool, connection.TimedQueuePool)
+        engine.dispose()
+
+    @patch('database.connection.create_engine')
+    def test_mysql_pool_settings_from_config(self, mock_create_engine):
+        """正常系: MySQLでは接続プールの設定を渡す"""
+        settings = DatabaseSettings(db_url="mysql+mysqldb://user:pass@db/ldtp", pool_size=8, max_overflow=4,
+                                    pool_timeout=10, pool_recycle=1800, pool_pre_ping=True)
+
+        connection.create_engine_for(settings)
+
+        call_kwargs = mock_create_engine.call_args[1]
+        assert call_kwargs['poolclass'] is connection.TimedQueuePool
+        assert call_kwargs['pool_size'] == 8
+        assert call_kwargs['max_overflow'] == 4
+        assert call_kwargs['pool_timeout'] == 10
+        assert call_kwargs['pool_recycle'] == 1800
+        assert call_kwargs['pool_pre_ping'] is True
+
+
+class TestGetPoolStats:
+    """get_pool_stats関数のテストクラス"""
+
+    def test_counts_checkouts_and_wait_time(self, tmp_path):
+        """正常系: 払い出し中の接続数と払い出しの回数・待ち時間が取得できる"""
+        engine = connection.create_engine_for(DatabaseSettings(db_url=f"sqlite:///{tmp_path / 'app.db'}"))
+
+        with engine.connect():
+            stats = connection.get_pool_stats(engine)
+            assert stats['pool'] == 'TimedQueuePool'
+            assert stats['checked_out'] == 1
+        stats = connection.get_pool_stats(engine)
+
+        assert stats['checked_out'] == 0
+        assert stats['checked_in'] == 1
+        assert stats['overflow'] <= 0
+        assert stats['checkouts'] == 1
+        assert stats['wait_seconds'] >= stats['max_wait_seconds'] > 0
+        engine.dispose()
+
+
 class TestGetSessionFactory:
     """get_session_factory関数のテストクラス"""
 
@@ -0,0 +1,197 @@
+import importlib.util
+from datetime import date, datetime
+from pathlib import Path
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import inspect
+from sqlalchemy.orm import Query
+
+from models import MainDisease, PatientInfo, SheetName, Template
+from models.patient_info import natural_key_hash
+
+VERSIONS_DIR = Path(__file__).resolve().parents[2] / 'alembic' / 'versions'
+INDEX_MIGRATION = 'b7d2f4a8c6e1_add_indexes_for_history_and_masters.py'
+NATURAL_KEY_MIGRATION = 'c4e8a2b6d9f3_add_natural_key_and_imported_files.py'
+CHANGE_TRACKING_MIGRATION = 'd9b3f5e7a1c4_add_change_tracking_and_export_watermarks.py'
+MASTER_COUNTER_MIGRATION = 'e5b7d9f1a3c6_add_master_data_change_counter.py'
+
+INDEX_NAMES = {
+    'patient_info': {'ix_patient_info_history'},
+    'templates': {'ix_templates_main_disease_sheet_name'},
+    'sheet_names': {'ix_sheet_names_main_disease_id_name'},
+    'main_diseases': {'ix_main_diseases_name'},
+}
+
+
+def query_plan(engine, query: Query) -> str:
+    """ORMのクエリをSQLiteのEXPLAIN QUERY PLANにかけ、計画の各行をつないで返す"""
+    sql = str(query.statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+def load_migration(file_name: str):
+    spec = importlib.util.spec_from_file_location(file_name[:-3], VERSIONS_DIR / file_name)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def index_names(engine) -> dict[str, set[str]]:
+    """INDEX_MIGRATIONで追加する索引の有無（自然キー・変更番号の索引は別のリビジョンで追加するので除く）"""
+    inspector = inspect(engine)
+    later = {'ix_patient_info_natural_key', 'ix_patient_info_change_seq'}
+    return {table: {index['name'] for index in inspector.get_indexes(table)} - later for table in INDEX_NAMES}
+
+
+def run_migration(engine, step) -> None:
+    with engine.begin() as conn, Operations.context(MigrationContext.configure(conn)):
+        step()
+
+
+class TestQueryPlans:
+    """よく使うクエリが索引を使うことのテスト"""
+
+    def test_patient_history_uses_covering_index(self, test_engine):
+        """患者履歴の取得は索引だけで済み、並べ替えも不要なことを確認"""
+        query = Query([
+            PatientInfo.id, PatientInfo.issue_date, PatientInfo.department, PatientInfo.doctor_name,
+            PatientInfo.main_diagnosis, PatientInfo.sheet_name, PatientInfo.creation_count,
+        ]).filter(PatientInfo.patient_id == 1001) \
+          .order_by(PatientInfo.patient_id.asc(), PatientInfo.id.desc())
+
+        plan = query_plan(test_engine, query)
+
+        assert "COVERING INDEX ix_patient_info_history" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_history_page_seeks_index(self, test_engine):
+        """履歴の2ページ目以降も索引の範囲検索で取得し、並べ替えないことを確認"""
+        query = Query([PatientInfo.id, PatientInfo.issue_date, PatientInfo.creation_count]) \
+            .filter(PatientInfo.patient_id == 1001, PatientInfo.id < 500) \
+            .order_by(PatientInfo.patient_id.asc(), PatientInfo.id.desc()).limit(51)
+
+        plan = query_plan(test_engine, query)
+
+        assert "COVERING INDEX ix_patient_info_history (patient_id=? AND id<?)" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_latest_patient_info_uses_index(self, test_engine):
+        """前回の計画書のコピー元（患者IDの最新1件）が索引で引けることを確認"""
+        query = Query(PatientInfo).filter(PatientInfo.patient_id == 1001) \
+            .order_by(PatientInfo.id.desc()).limit(1)
+
+        plan = query_plan(test_engine, query)
+
+        assert "USING INDEX ix_patient_info_history" in plan
+        assert "TEMP B-TREE" not in plan
+
+    @pytest.mark.parametrize('query, index_name', [
+        (Query(Template).filter_by(main_disease="高血圧症", sheet_name="1"), 'ix_templates_main_disease_sheet_name'),
+        (Query(SheetName).filter(SheetName.main_disease_id == 1), 'ix_sheet_names_main_disease_id_name'),
+        (Query(MainDisease).filter_by(name="高血圧症"), 'ix_main_diseases_name'),
+    ])
+    def test_master_lookups_use_index(self, test_engine, query, index_name):
+        """テンプレート・シート名・主病名の検索が全件走査しないことを確認"""
+        plan = query_plan(test_engine, query)
+
+        assert index_name in plan
+        assert not any(line.startswith("SCAN") for line in plan.splitlines())
+
+
+class TestIndexMigration:
+    """索引を追加するマイグレーションのテスト"""
+
+    def test_downgrade_and_upgrade_match_models(self, test_engine):
+        """downgradeで索引が消え、upgradeでモデルの定義と同じ索引ができることを確認"""
+        migration = load_migration(INDEX_MIGRATION)
+        assert index_names(test_engine) == INDEX_NAMES
+
+        run_migration(test_engine, migration.downgrade)
+        assert index_names(test_engine) == {table: set() for table in INDEX_NAMES}
+
+        run_migration(test_engine, migration.upgrade)
+        assert index_names(test_engine) == INDEX_NAMES
+
+
+class TestNaturalKeyMigration:
+    """自然キーの列と取込済みファイルの表を追加するマイグレーションのテスト"""
+
+    def test_upgrade_backfills_natural_key(self, test_engine):
+        """既存の行の自然キーがモデルと同じ計算で埋められることを確認"""
+        migration = load_migration(NATURAL_KEY_MIGRATION)
+        run_migration(test_engine, load_migration(CHANGE_TRACKING_MIGRATION).downgrade)
+        run_migration(test_engine, migration.downgrade)
+        with test_engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT INTO patient_info (patient_id, issue_date, main_diagnosis, sheet_name, creation_count) "
+                "VALUES (1001, '2025-01-10', '糖尿病', '1_HbA1c７％', 2)")
+
+        run_migration(test_engine, migration.upgrade)
+
+        with test_engine.connect() as conn:
+            key = conn.exec_driver_sql("SELECT natural_key FROM patient_info").scalar_one()
+        assert key == natural_key_hash({'patient_id': 1001, 'issue_date': date(2025, 1, 10),
+                                        'main_diagnosis': '糖尿病', 'sheet_name': '1_HbA1c７％',
+                                        'creation_count': 2})
+        assert 'imported_files' in inspect(test_engine).get_table_names()
+
+    def test_natural_key_lookup_uses_index(self, test_engine):
+        """CSV取込の既存行の照合（IN検索）が索引を使うことを確認"""
+        query = Query(PatientInfo).filter(PatientInfo.natural_key.in_(['a' * 64, 'b' * 64]))
+
+        plan = query_plan(test_engine, query)
+
+        assert "USING INDEX ix_patient_info_natural_key" in plan
+
+
+class TestChangeTrackingMigration:
+    """変更番号の列・カウンタと差分出力の基準の表を追加するマイグレーションのテスト"""
+
+    def test_upgrade_backfills_change_seq(self, test_engine):
+        """既存の行に移行時点の更新日時とIDの順の変更番号が入り、カウンタが続きから払い出すことを確認"""
+        migration = load_migration(CHANGE_TRACKING_MIGRATION)
+        run_migration(test_engine, migration.downgrade)
+        with test_engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO patient_info (patient_id) VALUES (1001), (1002)")
+        started = datetime.now()
+
+        run_migration(test_engine, migration.upgrade)
+
+        with test_engine.connect() as conn:
+            rows = conn.exec_driver_sql("SELECT updated_at, change_seq FROM patient_info ORDER BY id").fetchall()
+            last_value = conn.exec_driver_sql("SELECT last_value FROM change_counters").scalar_one()
+        assert all(datetime.fromisoformat(updated_at) >= started for updated_at, _ in rows)
+        assert [change_seq for _, change_seq in rows] == [1, 2]
+        assert last_value == 2
+        assert 'export_watermarks' in inspect(test_engine).get_table_names()
+
+    def test_changed_rows_lookup_uses_index(self, test_engine):
+        """差分出力の変更番号の範囲検索が索引を使うことを確認"""
+        query = Query(PatientInfo).filter(PatientInfo.change_seq > 100, PatientInfo.change_seq <= 200)
+
+        plan = query_plan(test_engine, query)
+
+        assert "USING INDEX ix_patient_info_change_seq" in plan
+
+
+class TestMasterDataCounterMigration:
+    """マスタの変更回数のカウンタを追加するマイグレーションのテスト"""
+
+    def test_upgrade_adds_counter_row(self, test_engine):
+        """カウンタの行を追加し、ダウングレードで削除することを確認"""
+        migration = load_migration(MASTER_COUNTER_MIGRATION)
+        run_migration(test_engine, migration.downgrade)
+        with test_engine.connect() as conn:
+            assert conn.exec_driver_sql("SELECT name FROM change_counters").scalars().all() == ['patient_info']
+
+        run_migration(test_engine, migration.upgrade)
+
+        with test_engine.connect() as conn:
+            last_value = conn.exec_driver_sql(
+                "SELECT last_value FROM change_counters WHERE name = 'master_data'").scalar_one()
+        assert last_value == 0
@@ -1,3 +1,4 @@
+import threading
 from datetime import date
 from typing import cast
 from unittest.mock import MagicMock, Mock, patch
@@ -7,7 +8,10 @@ import pytest
 
 from app.dialogs import DialogManager
 from app.event_handlers import EventHandlers
+from app.history_view import HistoryView
 from app.routes import RouteManager
+from services.patient_service import HistoryPage, RosterChange
+from services.ui_task_runner import UITaskRunner
 
 
 @pytest.fixture
@@ -185,6 +189,34 @@ class TestEventHandlers:
         assert sample_fields['issue_date_value'].value == ''
         assert sample_fields['name_value'].value == ''
 
+    def test_reload_patient_roster_shows_next_patient(self, mock_page, sample_fields):
+        """患者CSVの先頭の患者が変わったら、その患者の情報と履歴を表示することを確認"""
+        dialog_manager = DialogManager(mock_page, sample_fields)
+        roster = MagicMock(error_message="")
+        roster.reload.return_value = RosterChange({1001, 1002}, 1002, True)
+        event_handlers = EventHandlers(mock_page, sample_fields, None, dialog_manager, patient_roster=roster)
+        event_handlers.update_history = Mock()
+
+        with patch.object(event_handlers, 'load_patient_info') as mock_load:
+            event_handlers.reload_patient_roster()
+
+        mock_load.assert_called_once_with(1002)
+        event_handlers.update_history.assert_called_once_with('1002')
+
+    def test_reload_patient_roster_refreshes_current_patient(self, mock_page, sample_fields):
+        """表示中の患者の行が変わった場合は同じ患者の情報を読み直すことを確認"""
+        dialog_manager = DialogManager(mock_page, sample_fields)
+        roster = MagicMock(error_message="")
+        roster.reload.return_value = RosterChange({1001}, 1003, False)
+        event_handlers = EventHandlers(mock_page, sample_fields, None, dialog_manager, patient_roster=roster)
+
+        with patch.object(event_handlers, 'load_patient_info') as mock_load:
+            event_handlers.reload_patient_roster()
+            roster.reload.return_value = RosterChange({1005}, 1003, False)
+            event_handlers.reload_patient_roster()
+
+        mock_load.assert_called_once_with(1001)
+
     def test_on_tobacco_checkbox_change_nonsmoker(self, mock_page, sample_fields, sample_df_patients):
         """非喫煙者チェックボックス変更テスト"""
         dialog_manager = DialogManager(mock_page, sample_fields)
@@ -215,8 +247,21 @@ class TestEventHandlers:
         # 非喫煙者がFalseになることを確認
         assert sample_fields['nonsmoker'].value is False
 
+    @patch('app.event_handlers.template_operations.get_master_data_cache')
+    @patch('app.event_handlers.template_operations.Session')
+    def test_save_template_invalidates_master_cache(self, mock_session_class, mock_get_cache, mock_page,
+                                                    sample_fields, sample_df_patients):
+        """テンプレート保存後にマスタのキャッシュが破棄されることを確認"""
+        dialog_manager = DialogManager(mock_page, sample_fields)
+        event_handlers = EventHandlers(mock_page, sample_fields, sample_df_patients, dialog_manager)
+
+        event_handlers.save_template(None)
+
+        mock_session_class.return_value.commit.assert_called_once()
+        mock_get_cache.return_value.invalidate.assert_called_once()
+
     @patch('app.event_handlers.treatment_plan_operations.Session')
-    def test_create_treatment_plan_object(self, mock_session_class, mock_page, sample_fields, sample_df_patients):
+    def test_create_treatment_plan_object(self,mock_session_class, mock_page, sample_fields, sample_df_patients):
         """療養計画書オブジェクト作成テスト"""
         dialog_manager = DialogManager(mock_page, sample_fields)
         event_handlers = EventHandlers(mock_page, sample_fields, sample_df_patients, dialog_manager)
@@ -253,6 +298,309 @@ class TestEventHandlers:
             )
 
 
+class TestHandlersOffUIThread:
+    """DB処理をワーカースレッドで実行するハンドラのテスト"""
+
+    @pytest.fixture
+    def event_handlers(self, mock_page, sample_fields, sample_df_patients):
+        dialog_manager = DialogManager(mock_page, sample_fields)
+        handlers = EventHandlers(mock_page, sample_fields, sample_df_patients, dialog_manager,
+                                 task_runner=UITaskRunner(max_workers=2))
+        yield handlers
+        handlers.task_runner.shutdown()
+
+    def select_row(self, event_handlers, row_id):
+        row = Mock(data={'id': row_id})
+        event_handlers.fields['history'].rows = [row]
+        event_handlers.on_row_selected(Mock(data="true", control=row))
+
+    @patch('app.event_handlers.ui_events.Session')
+    def test_row_selection_opens_edit_after_loading(self, mock_session_class, event_handlers, mock_page):
+        """行を選択すると読み込み後にフォームへ反映して編集画面を開くことを確認"""
+        patient_info = Mock(id=5)
+        mock_session_class.return_value.query.return_value.filter.return_value.first.return_value = patient_info
+
+        with patch.object(event_handlers, '_populate_form_from_patient_info') as mock_populate:
+            self.select_row(event_handlers, 5)
+            assert event_handlers.task_runner.wait(5)
+
+        mock_populate.assert_called_once_with(patient_info)
+        mock_page.go.assert_called_once_with("/edit")
+        mock_session_class.return_value.close.assert_called_once()
+
+    @patch('app.event_handlers.ui_events.Session')
+    def test_row_loaded_after_patient_change_is_not_shown(self, mock_session_class, event_handlers, mock_page):
+        """読み込み中に患者IDが変わったら、前の患者の計画書をフォームに反映しないことを確認"""
+        started, release = threading.Event(), threading.Event()
+
+        def slow_first():
+            started.set()
+            release.wait(5)
+            return Mock(id=5)
+
+        mock_session_class.return_value.query.return_value.filter.return_value.first.side_effect = slow_first
+        event_handlers.update_history = Mock()
+
+        with patch.object(event_handlers, '_populate_form_from_patient_info') as mock_populate, \
+                patch.object(event_handlers, 'load_patient_info'):
+            self.select_row(event_handlers, 5)
+            started.wait(5)
+            event_handlers.fields['patient_id'].value = '1002'
+            event_handlers.on_patient_id_change(None)
+            release.set()
+            assert event_handlers.task_runner.wait(5)
+
+        mock_populate.assert_not_called()
+        mock_page.go.assert_not_called()
+
+    @patch('app.event_handlers.data_operations.Session')
+    def test_delete_refreshes_history_after_commit(self, mock_session_class, event_handlers, mock_page):
+        """削除はワーカースレッドでコミットし、完了後に履歴を更新してホームに戻ることを確認"""
+        patient_info = Mock(patient_id=1001)
+        mock_session = mock_session_class.return_value
+        mock_session.query.return_value.filter.return_value.first.return_value = patient_info
+        event_handlers.selected_row = {'id': 5}
+        event_handlers.update_history = Mock()
+
+        event_handlers.delete_data(None)
+        assert event_handlers.task_runner.wait(5)
+
+        mock_session.delete.assert_called_once_with(patient_info)
+        mock_session.commit.assert_called_once()
+        event_handlers.update_history.assert_called_once_with(1001)
+        assert event_handlers.selected_row is None
+        mock_page.go.assert_called_once_with("/")
+
+    @patch('app.event_handlers.data_operations.Session')
+    def test_save_uses_form_values_at_click(self, mock_session_class, event_handlers):
+        """保存はクリック時のフォームの値の写しを使い、ワーカースレッドからフォームを読まないことを確認"""
+        started, release = threading.Event(), threading.Event()
+        patient_info = Mock(birthdate=date(1985, 4, 10))
+
+        def slow_first():
+            started.set()
+            release.wait(5)
+            return patient_info
+
+        mock_session_class.return_value.query.return_value.filter.return_value.first.side_effect = slow_first
+        event_handlers.selected_row = {'id': 5}
+
+        event_handlers.save_data(None)
+        started.wait(5)
+        event_handlers.fields['goal1'].value = '保存後に入力した目標'
+        release.set()
+        assert event_handlers.task_runner.wait(5)
+
+        assert patient_info.goal1 == '目標1'
+        assert patient_info.patient_id == 1001
+        mock_session_class.return_value.commit.assert_called_once()
+
+    @patch('app.event_handlers.data_operations.Session')
+    def test_print_plan_saves_on_worker_thread(self, mock_session_class, event_handlers):
+        """印刷はワーカースレッドで保存してから計画書の生成を登録することを確認"""
+        threads = []
+        mock_session = mock_session_class.return_value
+        mock_session.commit.side_effect = lambda: threads.append(threading.current_thread())
+        patient_info = Mock(birthdate=date(1985, 4, 10))
+        mock_session.query.return_value.filter.return_value.first.return_value = patient_info
+        event_handlers.selected_row = {'id': 5}
+        event_handlers.plan_job_queue = Mock()
+
+        event_handlers.print_plan(None)
+        assert event_handlers.task_runner.wait(5)
+
+        assert threads[0] is not threading.current_thread()
+        assert patient_info.sheet_name == '糖尿病用'
+        mock_session.close.assert_called_once()
+        event_handlers.plan_job_queue.submit.assert_called_once_with(patient_info, event_handlers._on_plan_generated)
+
+    @patch('app.event_handlers.treatment_plan_operations.Session')
+    def test_create_new_plan_saves_on_worker_thread(self, mock_session_class, event_handlers):
+        """新規登録して印刷はワーカースレッドで保存し、完了後に履歴を更新することを確認"""
+        threads = []
+        mock_session = mock_session_class.return_value
+        mock_session.commit.side_effect = lambda: threads.append(threading.current_thread())
+        event_handlers.plan_job_queue = Mock()
+        event_handlers.update_history = Mock()
+
+        event_handlers.create_new_plan_and_print(None)
+        assert event_handlers.task_runner.wait(5)
+
+        assert threads[0] is not threading.current_thread()
+        saved = mock_session.add.call_args[0][0]
+        assert (saved.patient_id, saved.goal1) == (1001, '目標1')
+        event_handlers.plan_job_queue.submit.assert_called_once_with(saved, event_handlers._on_plan_generated)
+        event_handlers.update_history.assert_called_once_with(1001)
+        mock_session.close.assert_called_once()
+
+    @patch('app.event_handlers.treatment_plan_operations.Session')
+    def test_create_new_plan_reports_unknown_patient(self, mock_session_class, event_handlers):
+        """患者が見つからない場合は保存せずにそのメッセージを表示することを確認"""
+        event_handlers.fields['patient_id'].value = '9999'
+        event_handlers.update_history = Mock()
+
+        with patch.object(event_handlers.dialog_manager, 'show_error_message') as mock_error:
+            event_handlers.create_new_plan_and_print(None)
+            assert event_handlers.task_runner.wait(5)
+
+        mock_error.assert_called_once_with("患者ID 9999 が見つかりません。")
+        mock_session_class.return_value.commit.assert_not_called()
+        event_handlers.update_history.assert_not_called()
+
+
+class TestHistoryView:
+    """HistoryViewクラス（履歴の逐次読み込みと差分更新）のテスト"""
+
+    @pytest.fixture
+    def history(self):
+        """患者1001の履歴（idから表示内容。初期はid 10〜1）"""
+        return {1001: {i: {"department": "内科", "count": i} for i in range(1, 11)}}
+
+    @pytest.fixture
+    def pages(self, history):
+        """historyを新しい順にpage_size件ずつ返すfetch_pageのモック"""
+        def fetch_page(patient_id, before_id=None, page_size=3):
+            plans = history.get(int(patient_id), {})
+            ids = sorted((i for i in plans if before_id is None or i < before_id), reverse=True)
+            rows = [{"id": str(i), "issue_date": "", "department": plans[i]["department"], "doctor_name": "",
+                     "main_diagnosis": "", "sheet_name": "", "count": plans[i]["count"]}
+                    for i in ids[:page_size]]
+            return HistoryPage(rows, ids[page_size - 1] if len(ids) > page_size else None)
+        return Mock(side_effect=fetch_page)
+
+    @pytest.fixture
+    def runner(self):
+        task_runner = UITaskRunner(max_workers=2)
+        yield task_runner
+        task_runner.shutdown()
+
+    @pytest.fixture
+    def view(self, pages, runner):
+        return HistoryView(Mock(rows=[]), Mock(), fetch_page=pages, page_size=3, task_runner=runner)
+
+    @pytest.fixture
+    def blocked_pages(self, pages):
+        """2ページ目以降の取得をreleaseまで止めるfetch_page（startedは取得開始）"""
+        started, release = threading.Event(), threading.Event()
+        fetch_page = pages.side_effect
+
+        def blocked(patient_id, before_id=None, page_size=3):
+            if before_id is not None:
+                started.set()
+                release.wait(5)
+            return fetch_page(patient_id, before_id=before_id, page_size=page_size)
+        pages.side_effect = blocked
+        return started, release
+
+    def scroll_event(self, pixels, max_scroll_extent=1000):
+        return Mock(pixels=pixels, max_scroll_extent=max_scroll_extent)
+
+    def row_ids(self, view):
+        return [row.data["id"] for row in view.table.rows]
+
+    def test_reload_shows_first_page_only(self, view, pages):
+        """患者を切り替えると1ページ目だけを表示することを確認"""
+        view.reload(1001)
+
+        assert self.row_ids(view) == ["10", "9", "8"]
+        assert view.has_more
+        pages.assert_called_once_with(1001, page_size=3)
+
+    def test_scroll_to_bottom_appends_next_page(self, view, pages, runner):
+        """最下部付近までスクロールすると次のページをワーカースレッドで取得し、末尾に追加することを確認"""
+        view.reload(1001)
+
+        view.on_scroll(self.scroll_event(500))
+        assert len(view.table.rows) == 3
+        view.on_scroll(self.scroll_event(950))
+        assert runner.wait(5)
+
+        assert self.row_ids(view) == ["10", "9", "8", "7", "6", "5"]
+        pages.assert_called_with(1001, before_id=8, page_size=3)
+        view.table.update.assert_called_once()
+
+    def test_stops_after_last_page(self, view, pages, runner):
+        """最後のページを読み込んだ後はスクロールしても取得しないことを確認"""
+        view.reload(1001)
+        while view.load_more():
+            assert runner.wait(5)
+        calls = pages.call_count
+
+        view.on_scroll(self.scroll_event(1000))
+
+        assert len(view.table.rows) == 10
+        assert pages.call_count == calls
+
+    def test_does_not_request_same_page_twice(self, view, pages, runner, blocked_pages):
+        """次のページの取得中にスクロールが続いても、同じページを重ねて取得しないことを確認"""
+        started, release = blocked_pages
+        view.reload(1001)
+
+        assert view.load_more()
+        started.wait(5)
+        view.on_scroll(self.scroll_event(1000))
+        release.set()
+        assert runner.wait(5)
+
+        assert self.row_ids(view) == ["10", "9", "8", "7", "6", "5"]
+        assert pages.call_count == 2
+
+    def test_discards_page_fetched_for_previous_patient(self, view, history, runner, blocked_pages):
+        """次のページの取得中に患者を切り替えた場合、取得したページを追加しないことを確認"""
+        started, release = blocked_pages
+        history[2002] = {20: {"department": "外科", "count": 1}}
+        view.reload(1001)
+
+        view.load_more()
+        started.wait(5)
+        view.reload(2002)
+        release.set()
+        assert runner.wait(5)
+
+        assert self.row_ids(view) == ["20"]
+        assert not view.has_more
+        view.table.update.assert_not_called()
+
+    def test_reload_same_patient_patches_only_changed_rows(self, view, history, runner):
+        """同じ患者の読み直しでは追加・更新・削除された行だけを書き換え、他の行は使い回すことを確認"""
+        view.reload(1001)
+        view.load_more()
+        assert runner.wait(5)
+        before = {row.data["id"]: row for row in view.table.rows}
+        history[1001][11] = {"department": "内科", "count": 11}
+        history[1001][9]["department"] = "循環器科"
+        del history[1001][6]
+
+        diff = view.reload(1001)
+
+        assert (diff.inserted, diff.updated, diff.deleted, diff.rebuilt) == (["11"], ["9"], ["6"], False)
+        assert self.row_ids(view) == ["11", "10", "9", "8", "7", "5"]
+        assert all(row is before[row.data["id"]] for row in view.table.rows[1:])
+        assert before["9"].cells[1].content.value == "循環器科"
+        assert before["9"].data["department"] == "循環器科"
+
+    def test_reload_without_changes_keeps_rows(self, view):
+        """内容が変わっていなければ行のリストもそのままにすることを確認"""
+        view.reload(1001)
+        rows = view.table.rows
+
+        diff = view.reload("1001")
+
+        assert diff.changed == 0
+        assert view.table.rows is rows
+
+    def test_rebuilds_when_most_rows_changed(self, view, history):
+        """ほとんどの行が変わった場合と患者を切り替えた場合は全行を作り直すことを確認"""
+        history[2002] = {20: {"department": "外科", "count": 1}}
+        view.reload(1001)
+        for plan in history[1001].values():
+            plan["count"] += 100
+
+        assert view.reload(1001).rebuilt
+        assert view.reload(2002).rebuilt
+        assert self.row_ids(view) == ["20"]
+
+
 class TestRouteManager:
     """RouteManagerの統合テスト"""
 
@@ -413,6 +761,7 @@ class TestRouteManager:
         }
         dialog_manager = DialogManager(mock_page, sample_fields)
         event_handlers = EventHandlers(mock_page, sample_fields, pd.DataFrame(), dialog_manager)
+        event_handlers.file_observer = MagicMock()
         route_manager = RouteManager(
             mock_page, sample_fields, ui_elements, event_handlers, "manual.pdf"
         )
@@ -420,6 +769,8 @@ class TestRouteManager:
         route_manager.on_close(None)
 
         mock_page.window.close.assert_called_once()
+        event_handlers.file_observer.stop.assert_called_once()
+        event_handlers.file_observer.join.assert_called_once()
 
 
 class TestUIFlowIntegration:
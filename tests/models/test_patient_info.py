@@ -2,7 +2,7 @@ from datetime import date
 
 import pytest
 
-from models.patient_info import PatientInfo
+from models.patient_info import PatientInfo, natural_key_hash
 
 
 @pytest.fixture
@@ -166,3 +166,35 @@ class TestPatientInfoModel:
         """Float型フィールドのテスト"""
         assert isinstance(sample_patient_info.target_weight, float)
         assert sample_patient_info.target_weight == 65.5
+
+    def test_patient_info_natural_key_maintained(self, test_db, sample_patient_info):
+        """自然キーが登録時に設定され、キーの列の更新時に計算し直されることを確認"""
+        test_db.add(sample_patient_info)
+        test_db.commit()
+        registered_key = sample_patient_info.natural_key
+
+        sample_patient_info.goal1 = "目標を変更"
+        test_db.commit()
+        assert sample_patient_info.natural_key == registered_key
+        assert registered_key == natural_key_hash({
+            'patient_id': '12345', 'issue_date': '2025-01-10', 'main_diagnosis': "糖尿病",
+            'sheet_name': "糖尿病用", 'creation_count': 1,
+        })
+
+        sample_patient_info.creation_count = 2
+        test_db.commit()
+        assert sample_patient_info.natural_key != registered_key
+
+    def test_patient_info_change_tracking_maintained(self, test_db, sample_patient_info):
+        """更新日時と変更番号が登録時に設定され、更新のたびに新しくなることを確認"""
+        test_db.add(sample_patient_info)
+        test_db.commit()
+        registered_at = sample_patient_info.updated_at
+        registered_seq = sample_patient_info.change_seq
+        assert registered_at is not None
+        assert registered_seq == 1
+
+        sample_patient_info.goal1 = "目標を変更"
+        test_db.commit()
+        assert sample_patient_info.updated_at > registered_at
+        assert sample_patient_info.change_seq == 2
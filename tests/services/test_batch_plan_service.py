@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from models.patient_info import PatientInfo
+from services.batch_plan_service import BatchReport, PlanResult, generate_plans, main, snapshot_plan
+
+
+@pytest.fixture
+def sample_plans():
+    """テスト用の計画書データ"""
+    return [
+        PatientInfo(
+            id=plan_id,
+            patient_id=1000 + plan_id,
+            department_id=1,
+            doctor_id=10,
+            issue_date=date(2025, 1, 10),
+            creation_count=1,
+        )
+        for plan_id in (1, 2, 3)
+    ]
+
+
+class TestSnapshotPlan:
+    """snapshot_plan関数のテスト"""
+
+    def test_snapshot_plan_copies_sheet_fields(self, sample_plans):
+        """共通情報シートに必要な属性とIDがコピーされることを確認"""
+        snapshot = snapshot_plan(sample_plans[0])
+
+        assert isinstance(snapshot, SimpleNamespace)
+        assert snapshot.id == 1
+        assert snapshot.patient_id == 1001
+        assert snapshot.issue_date == date(2025, 1, 10)
+        assert snapshot.creation_count == 1
+
+
+class TestGeneratePlans:
+    """generate_plans関数のテスト"""
+
+    @patch('os.startfile')
+    @patch('services.batch_plan_service.build_plan_file')
+    def test_generate_plans_reports_each_plan(self, mock_build, mock_startfile, sample_plans, tmp_path):
+        """計画書ごとの結果が返され、ファイルは開かれないことを確認"""
+        mock_build.side_effect = lambda plan, output_dir: f"{output_dir}/{plan.id}.xlsm"
+
+        report = generate_plans(sample_plans, str(tmp_path))
+
+        assert [result.plan_id for result in report.results] == [1, 2, 3]
+        assert len(report.succeeded) == 3
+        assert report.failed == []
+        assert report.results[0].file_path == f"{tmp_path}/1.xlsm"
+        mock_startfile.assert_not_called()
+
+    @patch('services.batch_plan_service.build_plan_file')
+    def test_generate_plans_collects_failures(self, mock_build, sample_plans, tmp_path):
+        """失敗した計画書があっても残りの生成が続くことを確認"""
+        def build(plan, output_dir):
+            if plan.id == 2:
+                raise OSError("書き込みできません")
+            return f"{output_dir}/{plan.id}.xlsm"
+
+        mock_build.side_effect = build
+
+        report = generate_plans(sample_plans, str(tmp_path))
+
+        assert len(report.succeeded) == 2
+        assert len(report.failed) == 1
+        assert report.failed[0].plan_id == 2
+        assert "書き込みできません" in (report.failed[0].error or "")
+
+    @patch('services.batch_plan_service.ProcessPoolExecutor', ThreadPoolExecutor)
+    @patch('services.batch_plan_service.build_plan_file')
+    def test_generate_plans_uses_pool_when_workers_given(self, mock_build, sample_plans, tmp_path):
+        """workersが2以上ならプール経由で全件処理され順序が保たれることを確認"""
+        mock_build.side_effect = lambda plan, output_dir: f"{output_dir}/{plan.id}.xlsm"
+
+        report = generate_plans(sample_plans, str(tmp_path), workers=2)
+
+        assert [result.plan_id for result in report.results] == [1, 2, 3]
+        assert mock_build.call_count == 3
+
+    def test_generate_plans_creates_output_dir(self, tmp_path):
+        """出力先フォルダが作成されることを確認"""
+        output_dir = tmp_path / "batch"
+
+        generate_plans([], str(output_dir))
+
+        assert output_dir.is_dir()
+
+
+class TestBatchReport:
+    """BatchReportクラスのテスト"""
+
+    def test_plans_per_second(self):
+        """成功件数と経過時間からスループットが計算されることを確認"""
+        report = BatchReport(
+            results=[PlanResult(plan_id=1, file_path="a"), PlanResult(plan_id=2, error="x")],
+            elapsed=0.5,
+        )
+
+        assert report.plans_per_second == 2.0
+
+    def test_plans_per_second_zero_elapsed(self):
+        """経過時間が0の場合は0を返すことを確認"""
+        assert BatchReport().plans_per_second == 0.0
+
+
+class TestMain:
+    """main関数のテスト"""
+
+    @patch('services.batch_plan_service.generate_plans')
+    @patch('services.batch_plan_service.load_plans')
+    def test_main_passes_arguments(self, mock_load, mock_generate, tmp_path, capsys):
+        """コマンドライン引数が読み込み・生成に渡されることを確認"""
+        mock_load.return_value = []
+        mock_generate.return_value = BatchReport(results=[PlanResult(plan_id=5, file_path="x.xlsm")], elapsed=1.0)
+
+        exit_code = main(["5", "6", "--output-dir", str(tmp_path), "--workers", "3"])
+
+        assert exit_code == 0
+        mock_load.assert_called_once_with([5, 6])
+        mock_generate.assert_called_once_with([], str(tmp_path), workers=3)
+        assert "成功 1件" in capsys.readouterr().out
+
+    @patch('services.batch_plan_service.generate_plans')
+    @patch('services.batch_plan_service.load_plans')
+    def test_main_returns_error_code_on_failure(self, mock_load, mock_generate, tmp_path):
+        """失敗があれば終了コード1を返すことを確認"""
+        mock_load.return_value = []
+        mock_generate.return_value = BatchReport(results=[PlanResult(plan_id=5, error="NG")], elapsed=1.0)
+
+        assert main(["--output-dir", str(tmp_path)]) == 1
@@ -1,13 +1,20 @@
 import csv
 import os
 import tempfile
-from datetime import date
-from unittest.mock import MagicMock, Mock, patch
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
 
 import pytest
+from sqlalchemy import event
 
-from models import PatientInfo
-from services.data_export_service import export_to_csv, import_from_csv
+from models import ExportWatermark, ImportedFile, PatientInfo
+from services.data_export_service import (
+    ExportFilter,
+    _write_csv,
+    export_changes_to_csv,
+    export_to_csv,
+    import_from_csv,
+)
 
 
 class TestExportToCsv:
@@ -20,56 +27,37 @@ class TestExportToCsv:
             yield tmpdir
 
     @pytest.fixture
-    def mock_patient_data(self):
+    def export_session(self, test_db):
+        """出力元のインメモリDBのセッションをget_sessionから返す"""
+        with patch('services.data_export_service.get_session') as mock_get_session:
+            mock_get_session.return_value.__enter__.return_value = test_db
+            yield test_db
+
+    @pytest.fixture
+    def mock_patient_data(self, export_session):
         """テスト用患者データのフィクスチャ"""
-        patient = Mock(spec=PatientInfo)
-        patient.patient_id = 12345
-        patient.patient_name = "山田太郎"
-        patient.kana = "ヤマダタロウ"
-        patient.gender = "男性"
-        patient.birthdate = date(1980, 1, 1)
-        patient.issue_date = date(2025, 1, 1)
-        patient.issue_date_age = 45
-        patient.doctor_id = 1
-        patient.doctor_name = "鈴木医師"
-        patient.department = "内科"
-        patient.department_id = 10
-        patient.main_diagnosis = "糖尿病"
-        patient.sheet_name = "糖尿病"
-        patient.creation_count = 1
-        patient.target_weight = 70.5
-        patient.target_bp = "130/80"
-        patient.target_hba1c = "7.0"
-        patient.goal1 = "体重減少"
-        patient.goal2 = "運動習慣"
-        patient.target_achievement = "3ヶ月"
-        patient.diet1 = "カロリー制限"
-        patient.diet2 = "塩分制限"
-        patient.diet3 = ""
-        patient.diet4 = ""
-        patient.diet_comment = "バランスの良い食事"
-        patient.exercise_prescription = "ウォーキング"
-        patient.exercise_time = "30分"
-        patient.exercise_frequency = "週5回"
-        patient.exercise_intensity = "中等度"
-        patient.daily_activity = "通勤時歩行"
-        patient.exercise_comment = "無理のない範囲で"
-        patient.nonsmoker = True
-        patient.smoking_cessation = False
-        patient.other1 = ""
-        patient.other2 = ""
-        patient.ophthalmology = True
-        patient.dental = False
-        patient.cancer_screening = True
+        patient = PatientInfo(
+            patient_id=12345, patient_name="山田太郎", kana="ヤマダタロウ", gender="男性",
+            birthdate=date(1980, 1, 1), issue_date=date(2025, 1, 1), issue_date_age=45,
+            doctor_id=1, doctor_name="鈴木医師", department="内科", department_id=10,
+            main_diagnosis="糖尿病", sheet_name="糖尿病", creation_count=1, target_weight=70.5,
+            target_bp="130/80", target_hba1c="7.0", goal1="体重減少", goal2="運動習慣",
+            target_achievement="3ヶ月", diet1="カロリー制限", diet2="塩分制限", diet3="", diet4="",
+            diet_comment="バランスの良い食事", exercise_prescription="ウォーキング", exercise_time="30分",
+            exercise_frequency="週5回", exercise_intensity="中等度", daily_activity="通勤時歩行",
+            exercise_comment="無理のない範囲で", nonsmoker=True, smoking_cessation=False, other1="",
+            other2="", ophthalmology=True, dental=False, cancer_screening=True,
+        )
+        export_session.add(patient)
+        export_session.commit()
         return [patient]
 
-    @patch('services.data_export_service.get_session')
-    def test_export_to_csv_success(self, mock_get_session, temp_export_dir, mock_patient_data):
-        """正常系: CSV出力が成功する"""
-        mock_session = MagicMock()
-        mock_get_session.return_value.__enter__.return_value = mock_session
-        mock_session.query.return_value.all.return_value = mock_patient_data
+    def read_rows(self, csv_path):
+        with open(csv_path, 'r', encoding='shift_jis') as f:
+            return list(csv.reader(f))
 
+    def test_export_to_csv_success(self, temp_export_dir, mock_patient_data):
+        """正常系: CSV出力が成功する"""
         csv_filename, csv_path, error = export_to_csv(temp_export_dir)
 
         assert error is None
@@ -80,22 +68,68 @@ class TestExportToCsv:
         assert csv_path == os.path.join(temp_export_dir, csv_filename)
         assert os.path.exists(csv_path)
 
-        with open(csv_path, 'r', encoding='shift_jis') as f:
-            reader = csv.reader(f)
-            rows = list(reader)
-            assert len(rows) == 2  # ヘッダー + 1データ行
-            assert rows[0][0] == 'id'
+        rows = self.read_rows(csv_path)
+        assert len(rows) == 2  # ヘッダー + 1データ行
+        assert rows[0][0] == 'id'
+        record = dict(zip(rows[0], rows[1]))
+        assert record['patient_name'] == "山田太郎"
+        assert record['birthdate'] == "1980-01-01"
+        assert record['target_weight'] == "70.5"
+        assert record['nonsmoker'] == "True"
+
+    def test_export_to_csv_round_trip(self, temp_export_dir, mock_patient_data, export_session):
+        """正常系: 出力したCSVを取り込むと、型を含めて既存の行と同じと判定される"""
+        _, csv_path, _ = export_to_csv(temp_export_dir)
+        assert csv_path is not None
+        import_path = os.path.join(temp_export_dir, 'patient_info_round_trip.csv')
+        os.rename(csv_path, import_path)
 
-    @patch('services.data_export_service.get_session')
-    def test_export_to_csv_creates_directory(self, mock_get_session, mock_patient_data):
+        report = import_from_csv(import_path)
+
+        assert report.ok
+        assert (report.inserted, report.updated, report.skipped) == (0, 0, 1)
+        assert export_session.query(PatientInfo).count() == 1
+        assert 'natural_key' not in self.read_rows(import_path)[0]
+
+    def test_export_to_csv_streams_in_chunks(self, temp_export_dir, export_session):
+        """正常系: chunk_size行ずつ受け取っても全行がid順に出力される"""
+        export_session.add_all([PatientInfo(patient_id=1000 + i, patient_name=f"患者{i}") for i in range(7)])
+        export_session.commit()
+
+        _, csv_path, error = export_to_csv(temp_export_dir, chunk_size=3)
+
+        assert error is None
+        rows = self.read_rows(csv_path)
+        assert [row[1] for row in rows[1:]] == [str(1000 + i) for i in range(7)]
+
+    def test_export_to_csv_filters(self, temp_export_dir, export_session):
+        """正常系: 発行日の範囲・診療科・医師・主病名で絞り込める"""
+        export_session.add_all([
+            PatientInfo(patient_id=1, issue_date=date(2025, 1, 10), department_id=10, doctor_id=1,
+                        main_diagnosis="糖尿病"),
+            PatientInfo(patient_id=2, issue_date=date(2025, 2, 10), department_id=10, doctor_id=2,
+                        main_diagnosis="糖尿病"),
+            PatientInfo(patient_id=3, issue_date=date(2025, 2, 20), department_id=20, doctor_id=1,
+                        main_diagnosis="高血圧症"),
+            PatientInfo(patient_id=4, issue_date=date(2025, 3, 1), department_id=10, doctor_id=1,
+                        main_diagnosis="糖尿病"),
+        ])
+        export_session.commit()
+
+        def exported_ids(filters):
+            _, csv_path, _ = export_to_csv(temp_export_dir, filters)
+            return [int(row[1]) for row in self.read_rows(csv_path)[1:]]
+
+        assert exported_ids(ExportFilter(issue_date_from=date(2025, 2, 10), issue_date_to=date(2025, 2, 20))) == [2, 3]
+        assert exported_ids(ExportFilter(department_id=10, doctor_id=1)) == [1, 4]
+        assert exported_ids(ExportFilter(main_diagnosis="高血圧症")) == [3]
+        assert exported_ids(ExportFilter()) == [1, 2, 3, 4]
+
+    def test_export_to_csv_creates_directory(self, mock_patient_data):
         """正常系: エクスポートフォルダが存在しない場合に作成される"""
         with tempfile.TemporaryDirectory() as tmpdir:
             non_existent_dir = os.path.join(tmpdir, "new_export_folder")
 
-            mock_session = MagicMock()
-            mock_get_session.return_value.__enter__.return_value = mock_session
-            mock_session.query.return_value.all.return_value = mock_patient_data
-
             _, csv_path, error = export_to_csv(non_existent_dir)
 
             assert error is None
@@ -103,32 +137,18 @@ class TestExportToCsv:
             assert csv_path is not None
             assert os.path.exists(csv_path)
 
-    @patch('services.data_export_service.get_session')
-    def test_export_to_csv_empty_data(self, mock_get_session, temp_export_dir):
+    def test_export_to_csv_empty_data(self, temp_export_dir, export_session):
         """正常系: データが0件の場合でもヘッダーのみ出力される"""
-        mock_session = MagicMock()
-        mock_get_session.return_value.__enter__.return_value = mock_session
-        mock_session.query.return_value.all.return_value = []
-
         _, csv_path, error = export_to_csv(temp_export_dir)
 
         assert error is None
         assert csv_path is not None
         assert os.path.exists(csv_path)
-
-        with open(csv_path, 'r', encoding='shift_jis') as f:
-            reader = csv.reader(f)
-            rows = list(reader)
-            assert len(rows) == 1  # ヘッダーのみ
+        assert len(self.read_rows(csv_path)) == 1  # ヘッダーのみ
 
     @patch('builtins.open', side_effect=PermissionError("Permission denied"))
-    @patch('services.data_export_service.get_session')
-    def test_export_to_csv_permission_error(self, mock_get_session, _mock_open_func, temp_export_dir, mock_patient_data):
+    def test_export_to_csv_permission_error(self, _mock_open_func, temp_export_dir, mock_patient_data):
         """異常系: ファイル書き込み権限エラー"""
-        mock_session = MagicMock()
-        mock_get_session.return_value.__enter__.return_value = mock_session
-        mock_session.query.return_value.all.return_value = mock_patient_data
-
         csv_filename, csv_path, error = export_to_csv(temp_export_dir)
 
         assert csv_filename is None
@@ -137,13 +157,8 @@ class TestExportToCsv:
         assert "Permission denied" in error
 
     @patch('builtins.open', side_effect=IOError("I/O error"))
-    @patch('services.data_export_service.get_session')
-    def test_export_to_csv_io_error(self, mock_get_session, _mock_open_func, temp_export_dir, mock_patient_data):
+    def test_export_to_csv_io_error(self, _mock_open_func, temp_export_dir, mock_patient_data):
         """異常系: ファイルI/Oエラー"""
-        mock_session = MagicMock()
-        mock_get_session.return_value.__enter__.return_value = mock_session
-        mock_session.query.return_value.all.return_value = mock_patient_data
-
         csv_filename, csv_path, error = export_to_csv(temp_export_dir)
 
         assert csv_filename is None
@@ -156,7 +171,7 @@ class TestExportToCsv:
         """異常系: データベースクエリエラー"""
         mock_session = MagicMock()
         mock_get_session.return_value.__enter__.return_value = mock_session
-        mock_session.query.side_effect = Exception("Database connection failed")
+        mock_session.execute.side_effect = Exception("Database connection failed")
 
         csv_filename, csv_path, error = export_to_csv(temp_export_dir)
 
@@ -165,13 +180,8 @@ class TestExportToCsv:
         assert error is not None
         assert "Database connection failed" in error
 
-    @patch('services.data_export_service.get_session')
-    def test_export_to_csv_filename_format(self, mock_get_session, temp_export_dir, mock_patient_data):
+    def test_export_to_csv_filename_format(self, temp_export_dir, mock_patient_data):
         """正常系: ファイル名のフォーマットが正しい"""
-        mock_session = MagicMock()
-        mock_get_session.return_value.__enter__.return_value = mock_session
-        mock_session.query.return_value.all.return_value = mock_patient_data
-
         csv_filename, _, error = export_to_csv(temp_export_dir)
 
         assert error is None
@@ -181,351 +191,376 @@ class TestExportToCsv:
         assert re.match(pattern, csv_filename)
 
 
+FIELDNAMES = [
+    'patient_id', 'patient_name', 'kana', 'gender', 'birthdate', 'issue_date',
+    'issue_date_age', 'doctor_id', 'doctor_name', 'department', 'department_id',
+    'main_diagnosis', 'sheet_name', 'creation_count', 'target_weight', 'target_bp',
+    'target_hba1c', 'goal1', 'goal2', 'target_achievement', 'diet1', 'diet2',
+    'diet3', 'diet4', 'diet_comment', 'exercise_prescription', 'exercise_time',
+    'exercise_frequency', 'exercise_intensity', 'daily_activity', 'exercise_comment',
+    'nonsmoker', 'smoking_cessation', 'other1', 'other2', 'ophthalmology',
+    'dental', 'cancer_screening'
+]
+
+SAMPLE_ROW = {
+    'patient_id': '12345',
+    'patient_name': '山田太郎',
+    'kana': 'ヤマダタロウ',
+    'gender': '男性',
+    'birthdate': '1980-01-01',
+    'issue_date': '2025-01-01',
+    'issue_date_age': '45',
+    'doctor_id': '1',
+    'doctor_name': '鈴木医師',
+    'department': '内科',
+    'department_id': '10',
+    'main_diagnosis': '糖尿病',
+    'sheet_name': '糖尿病',
+    'creation_count': '1',
+    'target_weight': '70.5',
+    'target_bp': '130/80',
+    'target_hba1c': '7.0',
+    'goal1': '体重減少',
+    'goal2': '運動習慣',
+    'target_achievement': '3ヶ月',
+    'diet1': 'カロリー制限',
+    'diet2': '塩分制限',
+    'diet3': '',
+    'diet4': '',
+    'diet_comment': 'バランスの良い食事',
+    'exercise_prescription': 'ウォーキング',
+    'exercise_time': '30分',
+    'exercise_frequency': '週5回',
+    'exercise_intensity': '中等度',
+    'daily_activity': '通勤時歩行',
+    'exercise_comment': '無理のない範囲で',
+    'nonsmoker': 'True',
+    'smoking_cessation': 'False',
+    'other1': '',
+    'other2': '',
+    'ophthalmology': 'True',
+    'dental': 'False',
+    'cancer_screening': 'True'
+}
+
+
+def write_import_csv(directory, rows, name='patient_info_test.csv'):
+    """取込用のCSV（Shift-JIS、ヘッダーあり）を書き出す。rowsはSAMPLE_ROWとの差分"""
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='shift_jis', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**SAMPLE_ROW, **row})
+    return path
+
+
+@pytest.fixture
+def import_session(test_db):
+    """取込先のインメモリDBのセッションをget_sessionから返す"""
+    with patch('services.data_export_service.get_session') as mock_get_session:
+        mock_get_session.return_value.__enter__.return_value = test_db
+        yield test_db
+
+
 class TestImportFromCsv:
     """import_from_csv関数のテストクラス"""
 
-    @pytest.fixture
-    def temp_csv_file(self):
-        """一時CSVファイルのフィクスチャ"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', prefix='patient_info_',
-                                        encoding='shift_jis', delete=False, newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'patient_id', 'patient_name', 'kana', 'gender', 'birthdate', 'issue_date',
-                'issue_date_age', 'doctor_id', 'doctor_name', 'department', 'department_id',
-                'main_diagnosis', 'sheet_name', 'creation_count', 'target_weight', 'target_bp',
-                'target_hba1c', 'goal1', 'goal2', 'target_achievement', 'diet1', 'diet2',
-                'diet3', 'diet4', 'diet_comment', 'exercise_prescription', 'exercise_time',
-                'exercise_frequency', 'exercise_intensity', 'daily_activity', 'exercise_comment',
-                'nonsmoker', 'smoking_cessation', 'other1', 'other2', 'ophthalmology',
-                'dental', 'cancer_screening'
-            ])
-            writer.writeheader()
-            writer.writerow({
-                'patient_id': '12345',
-                'patient_name': '山田太郎',
-                'kana': 'ヤマダタロウ',
-                'gender': '男性',
-                'birthdate': '1980-01-01',
-                'issue_date': '2025-01-01',
-                'issue_date_age': '45',
-                'doctor_id': '1',
-                'doctor_name': '鈴木医師',
-                'department': '内科',
-                'department_id': '10',
-                'main_diagnosis': '糖尿病',
-                'sheet_name': '糖尿病',
-                'creation_count': '1',
-                'target_weight': '70.5',
-                'target_bp': '130/80',
-                'target_hba1c': '7.0',
-                'goal1': '体重減少',
-                'goal2': '運動習慣',
-                'target_achievement': '3ヶ月',
-                'diet1': 'カロリー制限',
-                'diet2': '塩分制限',
-                'diet3': '',
-                'diet4': '',
-                'diet_comment': 'バランスの良い食事',
-                'exercise_prescription': 'ウォーキング',
-                'exercise_time': '30分',
-                'exercise_frequency': '週5回',
-                'exercise_intensity': '中等度',
-                'daily_activity': '通勤時歩行',
-                'exercise_comment': '無理のない範囲で',
-                'nonsmoker': 'True',
-                'smoking_cessation': 'False',
-                'other1': '',
-                'other2': '',
-                'ophthalmology': 'True',
-                'dental': 'False',
-                'cancer_screening': 'True'
-            })
-            temp_path = f.name
-
-        yield temp_path
-
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
-
-    @patch('services.data_export_service.get_session')
-    def test_import_from_csv_success(self, mock_get_session, temp_csv_file):
+    def test_import_from_csv_success(self, tmp_path, import_session):
         """正常系: CSV取込が成功する"""
-        mock_session = MagicMock()
-        mock_get_session.return_value.__enter__.return_value = mock_session
-
-        error = import_from_csv(temp_csv_file)
-
-        assert error is None
-        mock_session.add.assert_called_once()
-        mock_session.commit.assert_called_once()
-
-        added_patient = mock_session.add.call_args[0][0]
-        assert added_patient.patient_id == 12345
-        assert added_patient.patient_name == "山田太郎"
-        assert added_patient.birthdate == date(1980, 1, 1)
-        assert added_patient.issue_date == date(2025, 1, 1)
-        assert added_patient.target_weight == 70.5
-        assert added_patient.nonsmoker is True
-        assert added_patient.smoking_cessation is False
+        report = import_from_csv(write_import_csv(str(tmp_path), [{}]))
+
+        assert report.ok
+        assert report.imported == 1
+        patient = import_session.query(PatientInfo).one()
+        assert patient.patient_id == 12345
+        assert patient.patient_name == "山田太郎"
+        assert patient.birthdate == date(1980, 1, 1)
+        assert patient.issue_date == date(2025, 1, 1)
+        assert patient.target_weight == 70.5
+        assert patient.nonsmoker is True
+        assert patient.smoking_cessation is False
+        assert patient.diet3 is None
+
+    def test_import_from_csv_commits_per_batch(self, tmp_path, import_session):
+        """正常系: batch_size行ごとにINSERT・コミットされ、処理件数/秒が計算される"""
+        path = write_import_csv(str(tmp_path), [{'patient_id': str(1000 + i)} for i in range(5)])
+
+        with patch.object(import_session, 'commit', wraps=import_session.commit) as mock_commit:
+            report = import_from_csv(path, batch_size=2)
+
+        assert report.inserted == 5
+        assert report.batches == 3
+        assert mock_commit.call_count == 4  # バッチごと + 取込済みファイルの記録
+        assert report.rows_per_second > 0
+        assert import_session.query(PatientInfo).count() == 5
 
     def test_import_from_csv_invalid_filename(self):
         """異常系: ファイル名が不正"""
-        invalid_file = "invalid_filename.csv"
-
-        error = import_from_csv(invalid_file)
+        report = import_from_csv("invalid_filename.csv")
 
-        assert error == "インポートエラー:このファイルはインポートできません"
+        assert report.fatal == "インポートエラー:このファイルはインポートできません"
+        assert report.summary() == "インポートエラー:このファイルはインポートできません"
 
     @patch('services.data_export_service.get_session')
     def test_import_from_csv_file_not_found(self, _mock_get_session):
         """異常系: ファイルが存在しない"""
-        non_existent_file = "patient_info_nonexistent.csv"
+        report = import_from_csv("patient_info_nonexistent.csv")
 
-        error = import_from_csv(non_existent_file)
+        assert report.fatal is not None
+        assert "インポート中にエラーが発生しました" in report.fatal
 
-        assert error is not None
-        assert "インポート中にエラーが発生しました" in error
+    def test_import_from_csv_empty_file(self, tmp_path, import_session):
+        """正常系: 空のCSVファイル（データ行なし）"""
+        path = os.path.join(str(tmp_path), 'patient_info_empty.csv')
+        with open(path, 'w', encoding='shift_jis', newline='') as f:
+            csv.writer(f).writerow(['patient_id', 'patient_name'])
 
-    @patch('services.data_export_service.get_session')
-    def test_import_from_csv_empty_file(self, mock_get_session):
-        """異常系: 空のCSVファイル（データ行なし）"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', prefix='patient_info_',
-                                        encoding='shift_jis', delete=False, newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['patient_id', 'patient_name'])
-            temp_path = f.name
+        report = import_from_csv(path)
 
-        try:
-            mock_session = MagicMock()
-            mock_get_session.return_value.__enter__.return_value = mock_session
+        assert report.ok
+        assert report.imported == 0
+        assert import_session.query(PatientInfo).count() == 0
 
-            error = import_from_csv(temp_path)
+    def test_import_from_csv_invalid_date_format(self, tmp_path, import_session):
+        """異常系: 日付フォーマットが不正な行は行番号付きで報告され、取り込まれない"""
+        report = import_from_csv(write_import_csv(str(tmp_path), [{'birthdate': 'invalid-date'}]))
 
-            assert error is None
-            mock_session.add.assert_not_called()
-            mock_session.commit.assert_called_once()
-        finally:
-            os.unlink(temp_path)
+        assert report.fatal is None
+        assert report.imported == 0
+        assert len(report.errors) == 1
+        error = report.errors[0]
+        assert (error.line_no, error.column, error.value) == (2, 'birthdate', 'invalid-date')
+        assert "2行目" in report.summary()
 
-    @patch('services.data_export_service.get_session')
-    def test_import_from_csv_invalid_date_format(self, mock_get_session):
-        """異常系: 日付フォーマットが不正"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', prefix='patient_info_',
-                                        encoding='shift_jis', delete=False, newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'patient_id', 'patient_name', 'kana', 'gender', 'birthdate', 'issue_date',
-                'issue_date_age', 'doctor_id', 'doctor_name', 'department', 'department_id',
-                'main_diagnosis', 'sheet_name', 'creation_count', 'target_weight', 'target_bp',
-                'target_hba1c', 'goal1', 'goal2', 'target_achievement', 'diet1', 'diet2',
-                'diet3', 'diet4', 'diet_comment', 'exercise_prescription', 'exercise_time',
-                'exercise_frequency', 'exercise_intensity', 'daily_activity', 'exercise_comment',
-                'nonsmoker', 'smoking_cessation', 'other1', 'other2', 'ophthalmology',
-                'dental', 'cancer_screening'
-            ])
-            writer.writeheader()
-            writer.writerow({
-                'patient_id': '12345',
-                'patient_name': '山田太郎',
-                'kana': 'ヤマダタロウ',
-                'gender': '男性',
-                'birthdate': 'invalid-date',
-                'issue_date': '2025-01-01',
-                'issue_date_age': '45',
-                'doctor_id': '1',
-                'doctor_name': '鈴木医師',
-                'department': '内科',
-                'department_id': '10',
-                'main_diagnosis': '糖尿病',
-                'sheet_name': '糖尿病',
-                'creation_count': '1',
-                'target_weight': '70.5',
-                'target_bp': '130/80',
-                'target_hba1c': '7.0',
-                'goal1': '体重減少',
-                'goal2': '運動習慣',
-                'target_achievement': '3ヶ月',
-                'diet1': 'カロリー制限',
-                'diet2': '塩分制限',
-                'diet3': '',
-                'diet4': '',
-                'diet_comment': 'バランスの良い食事',
-                'exercise_prescription': 'ウォーキング',
-                'exercise_time': '30分',
-                'exercise_frequency': '週5回',
-                'exercise_intensity': '中等度',
-                'daily_activity': '通勤時歩行',
-                'exercise_comment': '無理のない範囲で',
-                'nonsmoker': 'True',
-                'smoking_cessation': 'False',
-                'other1': '',
-                'other2': '',
-                'ophthalmology': 'True',
-                'dental': 'False',
-                'cancer_screening': 'True'
-            })
-            temp_path = f.name
+    def test_import_from_csv_invalid_integer_format(self, tmp_path, import_session):
+        """異常系: 整数フォーマットが不正な行を飛ばして残りの行を取り込む"""
+        path = write_import_csv(str(tmp_path), [{'patient_id': '1001'}, {'patient_id': 'not_a_number'},
+                                                {'patient_id': '1003'}])
 
-        try:
-            mock_session = MagicMock()
-            mock_get_session.return_value.__enter__.return_value = mock_session
+        report = import_from_csv(path)
 
-            error = import_from_csv(temp_path)
+        assert report.imported == 2
+        assert [(error.line_no, error.column) for error in report.errors] == [(3, 'patient_id')]
+        assert sorted(p.patient_id for p in import_session.query(PatientInfo)) == [1001, 1003]
 
-            assert error is not None
-            assert "インポート中にエラーが発生しました" in error
-        finally:
-            os.unlink(temp_path)
+    def test_import_from_csv_null_target_weight(self, tmp_path, import_session):
+        """正常系: target_weightがNullの場合"""
+        report = import_from_csv(write_import_csv(str(tmp_path), [{'target_weight': ''}]))
+
+        assert report.ok
+        assert import_session.query(PatientInfo).one().target_weight is None
 
     @patch('services.data_export_service.get_session')
-    def test_import_from_csv_invalid_integer_format(self, mock_get_session):
-        """異常系: 整数フォーマットが不正"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', prefix='patient_info_',
-                                        encoding='shift_jis', delete=False, newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'patient_id', 'patient_name', 'kana', 'gender', 'birthdate', 'issue_date',
-                'issue_date_age', 'doctor_id', 'doctor_name', 'department', 'department_id',
-                'main_diagnosis', 'sheet_name', 'creation_count', 'target_weight', 'target_bp',
-                'target_hba1c', 'goal1', 'goal2', 'target_achievement', 'diet1', 'diet2',
-                'diet3', 'diet4', 'diet_comment', 'exercise_prescription', 'exercise_time',
-                'exercise_frequency', 'exercise_intensity', 'daily_activity', 'exercise_comment',
-                'nonsmoker', 'smoking_cessation', 'other1', 'other2', 'ophthalmology',
-                'dental', 'cancer_screening'
-            ])
-            writer.writeheader()
-            writer.writerow({
-                'patient_id': 'not_a_number',
-                'patient_name': '山田太郎',
-                'kana': 'ヤマダタロウ',
-                'gender': '男性',
-                'birthdate': '1980-01-01',
-                'issue_date': '2025-01-01',
-                'issue_date_age': '45',
-                'doctor_id': '1',
-                'doctor_name': '鈴木医師',
-                'department': '内科',
-                'department_id': '10',
-                'main_diagnosis': '糖尿病',
-                'sheet_name': '糖尿病',
-                'creation_count': '1',
-                'target_weight': '70.5',
-                'target_bp': '130/80',
-                'target_hba1c': '7.0',
-                'goal1': '体重減少',
-                'goal2': '運動習慣',
-                'target_achievement': '3ヶ月',
-                'diet1': 'カロリー制限',
-                'diet2': '塩分制限',
-                'diet3': '',
-                'diet4': '',
-                'diet_comment': 'バランスの良い食事',
-                'exercise_prescription': 'ウォーキング',
-                'exercise_time': '30分',
-                'exercise_frequency': '週5回',
-                'exercise_intensity': '中等度',
-                'daily_activity': '通勤時歩行',
-                'exercise_comment': '無理のない範囲で',
-                'nonsmoker': 'True',
-                'smoking_cessation': 'False',
-                'other1': '',
-                'other2': '',
-                'ophthalmology': 'True',
-                'dental': 'False',
-                'cancer_screening': 'True'
-            })
-            temp_path = f.name
+    def test_import_from_csv_database_commit_error(self, mock_get_session, tmp_path):
+        """異常系: データベースコミットエラー"""
+        mock_session = MagicMock()
+        mock_get_session.return_value.__enter__.return_value = mock_session
+        mock_session.execute.return_value.scalar.return_value = None
+        mock_session.commit.side_effect = Exception("Database commit failed")
 
-        try:
-            mock_session = MagicMock()
-            mock_get_session.return_value.__enter__.return_value = mock_session
+        report = import_from_csv(write_import_csv(str(tmp_path), [{}]))
 
-            error = import_from_csv(temp_path)
+        assert report.fatal is not None
+        assert "インポート中にエラーが発生しました" in report.fatal
+        assert "Database commit failed" in report.fatal
+        assert report.imported == 0
+        mock_session.rollback.assert_called_once()
 
-            assert error is not None
-            assert "インポート中にエラーが発生しました" in error
-        finally:
-            os.unlink(temp_path)
 
-    @patch('services.data_export_service.get_session')
-    def test_import_from_csv_null_target_weight(self, mock_get_session):
-        """正常系: target_weightがNullの場合"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', prefix='patient_info_',
-                                        encoding='shift_jis', delete=False, newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'patient_id', 'patient_name', 'kana', 'gender', 'birthdate', 'issue_date',
-                'issue_date_age', 'doctor_id', 'doctor_name', 'department', 'department_id',
-                'main_diagnosis', 'sheet_name', 'creation_count', 'target_weight', 'target_bp',
-                'target_hba1c', 'goal1', 'goal2', 'target_achievement', 'diet1', 'diet2',
-                'diet3', 'diet4', 'diet_comment', 'exercise_prescription', 'exercise_time',
-                'exercise_frequency', 'exercise_intensity', 'daily_activity', 'exercise_comment',
-                'nonsmoker', 'smoking_cessation', 'other1', 'other2', 'ophthalmology',
-                'dental', 'cancer_screening'
-            ])
-            writer.writeheader()
-            writer.writerow({
-                'patient_id': '12345',
-                'patient_name': '山田太郎',
-                'kana': 'ヤマダタロウ',
-                'gender': '男性',
-                'birthdate': '1980-01-01',
-                'issue_date': '2025-01-01',
-                'issue_date_age': '45',
-                'doctor_id': '1',
-                'doctor_name': '鈴木医師',
-                'department': '内科',
-                'department_id': '10',
-                'main_diagnosis': '糖尿病',
-                'sheet_name': '糖尿病',
-                'creation_count': '1',
-                'target_weight': '',
-                'target_bp': '130/80',
-                'target_hba1c': '7.0',
-                'goal1': '体重減少',
-                'goal2': '運動習慣',
-                'target_achievement': '3ヶ月',
-                'diet1': 'カロリー制限',
-                'diet2': '塩分制限',
-                'diet3': '',
-                'diet4': '',
-                'diet_comment': 'バランスの良い食事',
-                'exercise_prescription': 'ウォーキング',
-                'exercise_time': '30分',
-                'exercise_frequency': '週5回',
-                'exercise_intensity': '中等度',
-                'daily_activity': '通勤時歩行',
-                'exercise_comment': '無理のない範囲で',
-                'nonsmoker': 'True',
-                'smoking_cessation': 'False',
-                'other1': '',
-                'other2': '',
-                'ophthalmology': 'True',
-                'dental': 'False',
-                'cancer_screening': 'True'
-            })
-            temp_path = f.name
+class TestIncrementalImport:
+    """同じ行・同じファイルを重複して取り込まないことのテスト"""
 
-        try:
-            mock_session = MagicMock()
-            mock_get_session.return_value.__enter__.return_value = mock_session
+    def test_same_file_is_imported_once(self, tmp_path, import_session):
+        """取込済みと同じ内容のファイルは何もしないことを確認"""
+        path = write_import_csv(str(tmp_path), [{'patient_id': '1001'}, {'patient_id': '1002'}])
+        import_from_csv(path)
 
-            error = import_from_csv(temp_path)
+        report = import_from_csv(path)
 
-            assert error is None
-            mock_session.add.assert_called_once()
+        assert report.already_imported_at is not None
+        assert report.imported == 0
+        assert "インポート済み" in report.summary()
+        assert import_session.query(PatientInfo).count() == 2
+        assert import_session.query(ImportedFile).one().inserted == 2
 
-            added_patient = mock_session.add.call_args[0][0]
-            assert added_patient.target_weight is None
-        finally:
-            os.unlink(temp_path)
+    def test_inserts_new_updates_changed_and_skips_same_rows(self, tmp_path, import_session):
+        """自然キーで照合し、新しい行は追加・内容が変わった行は更新・同じ行は飛ばすことを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}, {'patient_id': '1002'}],
+                                         name='patient_info_day1.csv'))
 
-    @patch('services.data_export_service.get_session')
-    def test_import_from_csv_database_commit_error(self, mock_get_session, temp_csv_file):
-        """異常系: データベースコミットエラー"""
-        mock_session = MagicMock()
-        mock_get_session.return_value.__enter__.return_value = mock_session
-        mock_session.commit.side_effect = Exception("Database commit failed")
+        report = import_from_csv(write_import_csv(str(tmp_path), [
+            {'patient_id': '1001'},
+            {'patient_id': '1002', 'goal1': '血糖値の改善'},
+            {'patient_id': '1003'},
+        ], name='patient_info_day2.csv'))
 
-        error = import_from_csv(temp_csv_file)
+        assert (report.inserted, report.updated, report.skipped) == (1, 1, 1)
+        rows = {p.patient_id: p for p in import_session.query(PatientInfo)}
+        assert sorted(rows) == [1001, 1002, 1003]
+        assert rows[1002].goal1 == '血糖値の改善'
 
-        assert error is not None
-        assert "インポート中にエラーが発生しました" in error
-        assert "Database commit failed" in error
+    def test_matches_rows_created_in_app(self, tmp_path, import_session):
+        """アプリで登録した行（空文字を含む）とも照合されることを確認"""
+        import_session.add(PatientInfo(patient_id=1001, issue_date=date(2025, 1, 1), main_diagnosis='糖尿病',
+                                       sheet_name='糖尿病', creation_count=1, diet3='', other1=''))
+        import_session.commit()
+        values = {name: '' for name in FIELDNAMES}
+        values.update(patient_id='1001', issue_date='2025-01-01', main_diagnosis='糖尿病', sheet_name='糖尿病',
+                      creation_count='1')
+
+        report = import_from_csv(write_import_csv(str(tmp_path), [values]))
+
+        assert (report.inserted, report.updated, report.skipped) == (0, 0, 1)
+
+    def test_looks_up_existing_keys_once_per_batch(self, tmp_path, import_session):
+        """既存の行の照合はバッチごとに1回のIN検索で行うことを確認"""
+        path = write_import_csv(str(tmp_path), [{'patient_id': str(1000 + i)} for i in range(4)])
+        statements = []
+        engine = import_session.get_bind()
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            report = import_from_csv(path, batch_size=2)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        assert report.inserted == 4
+        assert sum('natural_key IN' in statement for statement in statements) == 2
+
+    @pytest.mark.parametrize("batch_size", [1, 1000])
+    def test_conflicting_duplicates_use_last_row_regardless_of_batch(self, tmp_path, import_session, batch_size):
+        """同じ計画書で内容の異なる行は、バッチの大きさによらず後の行を使い、先の行をエラーに記録することを確認"""
+        path = write_import_csv(str(tmp_path), [
+            {'patient_id': '1001', 'goal1': '先の目標'},
+            {'patient_id': '1001', 'goal1': '後の目標'},
+            {'patient_id': '1001', 'goal1': '後の目標'},
+        ])
+
+        report = import_from_csv(path, batch_size=batch_size)
+
+        assert import_session.query(PatientInfo).one().goal1 == '後の目標'
+        assert (report.inserted, report.updated, report.skipped) == (1, 0, 1)
+        assert [(error.line_no, error.message) for error in report.errors] == [
+            (2, "3行目と同じ計画書で内容が異なるため、3行目の内容で取り込みました")]
+
+
+class TestExportChangesToCsv:
+    """export_changes_to_csv関数（前回からの変更分の出力）のテスト"""
+
+    def exported_patient_ids(self, result):
+        with open(result.csv_path, encoding='shift_jis') as f:
+            return [int(row['patient_id']) for row in csv.DictReader(f)]
+
+    def test_first_export_writes_all_rows_and_saves_watermark(self, tmp_path, import_session):
+        """初回は全件を出力し、コミット済みの最後の変更番号を保存することを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}, {'patient_id': '1002'}]))
+
+        result = export_changes_to_csv(str(tmp_path / 'export'))
+
+        assert result.error is None
+        assert result.since is None
+        assert result.csv_filename is not None and result.csv_filename.startswith("patient_info_changes_")
+        assert self.exported_patient_ids(result) == [1001, 1002]
+        state = import_session.get(ExportWatermark, 'default')
+        assert state is not None
+        assert result.watermark == 2
+        assert state.change_seq == result.watermark
+        assert state.row_count == 2
+
+    def test_second_export_writes_only_changed_rows(self, tmp_path, import_session):
+        """2回目は前回の出力より後に追加・更新された行だけを出力することを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}, {'patient_id': '1002'}],
+                                         name='patient_info_day1.csv'))
+        first = export_changes_to_csv(str(tmp_path / 'export'))
+        import_from_csv(write_import_csv(str(tmp_path), [
+            {'patient_id': '1001'},
+            {'patient_id': '1002', 'goal1': '血糖値の改善'},
+            {'patient_id': '1003'},
+        ], name='patient_info_day2.csv'))
+
+        second = export_changes_to_csv(str(tmp_path / 'export'))
+
+        assert second.since == first.watermark
+        assert self.exported_patient_ids(second) == [1002, 1003]
+
+    def test_no_changes_writes_no_file(self, tmp_path, import_session):
+        """変更がなければファイルを作らず、基準の変更番号も変えないことを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}]))
+        first = export_changes_to_csv(str(tmp_path / 'export'))
+
+        result = export_changes_to_csv(str(tmp_path / 'export'))
+
+        assert result.error is None
+        assert result.csv_filename is None
+        assert os.listdir(tmp_path / 'export') == [first.csv_filename]
+        state = import_session.get(ExportWatermark, 'default')
+        assert state is not None
+        assert state.change_seq == first.watermark
+
+    def test_watermarks_are_kept_per_name(self, tmp_path, import_session):
+        """出力先の名前ごとに基準の変更番号を持つことを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}]))
+        export_changes_to_csv(str(tmp_path / 'export'), name='本院')
+
+        result = export_changes_to_csv(str(tmp_path / 'export'), name='分院')
+
+        assert self.exported_patient_ids(result) == [1001]
+
+    def test_failed_export_keeps_watermark(self, tmp_path, import_session):
+        """書き込みに失敗したときは基準の変更番号を進めないことを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}]))
+
+        with patch('services.data_export_service.open', side_effect=PermissionError("アクセスが拒否されました")):
+            result = export_changes_to_csv(str(tmp_path / 'export'))
+
+        assert result.error is not None and "アクセスが拒否されました" in result.error
+        import_session.rollback()
+        assert import_session.get(ExportWatermark, 'default') is None
+
+    def test_imported_rows_get_change_seq(self, tmp_path, import_session):
+        """CSV取込で追加・更新した行にも更新日時と連続した変更番号が付くことを確認"""
+        started = datetime.now()
+
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}, {'patient_id': '1002'}]))
+
+        rows = import_session.query(PatientInfo).order_by(PatientInfo.id).all()
+        assert all(row.updated_at is not None and row.updated_at >= started for row in rows)
+        assert [row.change_seq for row in rows] == [1, 2]
+
+    def test_rows_committed_after_export_starts_are_exported_next_time(self, tmp_path, import_session):
+        """出力中にコミットされた行は今回の上限より大きい変更番号になり、次回に出力されることを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [{'patient_id': '1001'}]))
+        original = _write_csv
+
+        def write_while_another_terminal_saves(*args):
+            import_session.add(PatientInfo(patient_id=1002))
+            import_session.commit()
+            return original(*args)
+
+        with patch('services.data_export_service._write_csv', side_effect=write_while_another_terminal_saves):
+            first = export_changes_to_csv(str(tmp_path / 'export'))
+        assert self.exported_patient_ids(first) == [1001]
+        second = export_changes_to_csv(str(tmp_path / 'export'))
+
+        assert second.since == first.watermark
+        assert self.exported_patient_ids(second) == [1002]
+
+    def test_watermarks_are_kept_per_filter(self, tmp_path, import_session):
+        """絞り込み条件ごとに基準を持ち、別の条件の出力で他の条件の行が出力済みにならないことを確認"""
+        import_from_csv(write_import_csv(str(tmp_path), [
+            {'patient_id': '1001', 'department_id': '1'},
+            {'patient_id': '1002', 'department_id': '2'},
+        ]))
+
+        internal = export_changes_to_csv(str(tmp_path / 'export'), ExportFilter(department_id=1))
+        assert self.exported_patient_ids(internal) == [1001]
+        surgery = export_changes_to_csv(str(tmp_path / 'export'), ExportFilter(department_id=2))
+        assert self.exported_patient_ids(surgery) == [1002]
+        again = export_changes_to_csv(str(tmp_path / 'export'), ExportFilter(department_id=1))
+
+        assert again.error is None
+        assert again.csv_filename is None
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from models import DocumentSequence
+from models.patient_info import PatientInfo
+from services.document_code_service import SEQUENCE_END, SEQUENCE_START, DocumentCodeAllocator
+from services.treatment_plan_service import _build_document_code
+
+PREFIX = "000012345392210100100120250110"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """テスト用のSQLiteエンジン（ファイル）"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'sequence.db'}")
+    yield engine
+    engine.dispose()
+
+
+class TestDocumentCodeAllocator:
+    """DocumentCodeAllocatorクラスのテスト"""
+
+    def test_allocate_creates_sequence(self, engine):
+        """初回は連番の開始値が払い出され、テーブルが作成されることを確認"""
+        code = DocumentCodeAllocator(engine).allocate(PREFIX)
+
+        assert code == f"{PREFIX}{SEQUENCE_START}"
+        with engine.connect() as connection:
+            assert connection.execute(select(DocumentSequence.last_value)).scalar_one() == SEQUENCE_START
+
+    def test_allocate_increments_per_prefix(self, engine):
+        """接頭辞ごとに連番が増えることを確認"""
+        allocator = DocumentCodeAllocator(engine)
+
+        codes = [allocator.allocate(PREFIX) for _ in range(3)]
+        other = allocator.allocate("999999999392210100100120250110")
+
+        assert [code[-6:] for code in codes] == ["240000", "240001", "240002"]
+        assert other.endswith("240000")
+
+    def test_allocate_keeps_code_length(self, engine):
+        """文書番号の長さが従来（36桁）と変わらないことを確認"""
+        assert len(DocumentCodeAllocator(engine).allocate(PREFIX)) == 36
+
+    def test_allocate_is_unique_across_threads(self, engine):
+        """複数スレッドから同時に払い出しても重複しないことを確認"""
+        allocator = DocumentCodeAllocator(engine)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            codes = list(executor.map(lambda _: allocator.allocate(PREFIX), range(40)))
+
+        assert len(set(codes)) == 40
+
+    def test_allocate_is_unique_across_allocators(self, engine, tmp_path):
+        """別の端末（別インスタンス・別接続）と同じデータベースを共有しても重複しないことを確認"""
+        other_engine = create_engine(f"sqlite:///{tmp_path / 'sequence.db'}")
+        first = DocumentCodeAllocator(engine)
+        second = DocumentCodeAllocator(other_engine)
+
+        codes = [allocator.allocate(PREFIX) for _ in range(5) for allocator in (first, second)]
+        other_engine.dispose()
+
+        assert len(set(codes)) == 10
+
+    def test_allocate_raises_when_exhausted(self, engine):
+        """連番が上限を超えるとエラーになることを確認"""
+        allocator = DocumentCodeAllocator(engine)
+        allocator.allocate(PREFIX)
+        with engine.begin() as connection:
+            connection.execute(DocumentSequence.__table__.update().values(last_value=SEQUENCE_END))
+
+        with pytest.raises(ValueError, match="上限"):
+            allocator.allocate(PREFIX)
+
+
+class TestBuildDocumentCode:
+    """_build_document_code関数のテスト"""
+
+    def test_build_document_code_layout(self, override_settings):
+        """患者ID・文書番号・診療科・医師・発行日・連番の順に並ぶことを確認"""
+        patient = PatientInfo(patient_id=12345, department_id=1, doctor_id=1001,
+                              issue_date=date(2025, 1, 10), creation_count=1)
+
+        override_settings(document={'document_number': '39221'})
+        first = _build_document_code(patient)
+        second = _build_document_code(patient)
+
+        assert first == "000012345" "39221" "001" "01001" "20250110" "240000"
+        assert second.endswith("240001")
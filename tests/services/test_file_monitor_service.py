@@ -1,15 +1,26 @@
+import os
+import threading
+import time
 from unittest.mock import MagicMock, Mock, patch
 
+import pytest
 from watchdog.events import FileSystemEvent
 from watchdog.observers import Observer
 
-from services.file_monitor_service import MyHandler, check_file_exists, start_file_monitoring
+from services.file_monitor_service import (
+    MyHandler,
+    StatPollingObserver,
+    check_file_exists,
+    create_observer,
+    start_file_monitoring,
+    stop_file_monitoring,
+)
 
 
 class TestMyHandler:
     """MyHandlerクラスのテスト"""
 
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\test\\pat.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
     def test_MyHandler_on_deleted_closes_window_when_target_file_deleted(self):
         """対象ファイル削除時にwindowがcloseされることを確認"""
         # Arrange
@@ -24,7 +35,7 @@ class TestMyHandler:
         # Assert
         page_mock.window.close.assert_called_once()
 
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\test\\pat.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
     def test_MyHandler_on_deleted_does_not_close_when_other_file_deleted(self):
         """他のファイル削除時はwindowがcloseされないことを確認"""
         # Arrange
@@ -39,6 +50,60 @@ class TestMyHandler:
         # Assert
         page_mock.window.close.assert_not_called()
 
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
+    def test_MyHandler_debounces_modified_events(self):
+        """連続した更新イベントは最後のイベントの後に1回だけ再読み込みすることを確認"""
+        # Arrange
+        reloaded = threading.Event()
+        on_changed = Mock(side_effect=reloaded.set)
+        handler = MyHandler(MagicMock(), on_changed, debounce_seconds=0.05)
+        event = Mock(spec=FileSystemEvent)
+        event.src_path = 'C:\\test\\pat.csv'
+
+        # Act
+        for _ in range(5):
+            handler.on_modified(event)
+
+        # Assert
+        assert reloaded.wait(2)
+        time.sleep(0.1)
+        on_changed.assert_called_once()
+
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
+    def test_MyHandler_on_moved_reloads_when_replaced(self):
+        """一時ファイルから対象ファイルへ置き換えられた場合に再読み込みすることを確認"""
+        # Arrange
+        handler = MyHandler(MagicMock(), Mock())
+        event = Mock(spec=FileSystemEvent)
+        event.src_path = 'C:\\test\\pat.tmp'
+        event.dest_path = 'C:\\test\\pat.csv'
+
+        # Act
+        with patch.object(handler, '_schedule_reload') as mock_schedule:
+            handler.on_moved(event)
+            event.src_path = 'C:\\test\\other.csv'
+            handler.on_modified(event)
+
+        # Assert
+        mock_schedule.assert_called_once()
+
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
+    def test_MyHandler_cancel_discards_pending_reload(self):
+        """取り消した再読み込みは実行されないことを確認"""
+        # Arrange
+        on_changed = Mock()
+        handler = MyHandler(MagicMock(), on_changed, debounce_seconds=0.05)
+        event = Mock(spec=FileSystemEvent)
+        event.src_path = 'C:\\test\\pat.csv'
+
+        # Act
+        handler.on_modified(event)
+        handler.cancel()
+        time.sleep(0.1)
+
+        # Assert
+        on_changed.assert_not_called()
+
     def test_MyHandler_stores_page_reference(self):
         """pageオブジェクトが正しく保持されることを確認"""
         # Arrange
@@ -55,7 +120,7 @@ class TestStartFileMonitoring:
     """start_file_monitoring関数のテスト"""
 
     @patch('services.file_monitor_service.Observer')
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\test\\pat.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
     @patch('services.file_monitor_service.os.path.dirname')
     def test_start_file_monitoring_returns_observer(self, mock_dirname, mock_observer_class):
         """Observerオブジェクトが返されることを確認"""
@@ -73,7 +138,7 @@ class TestStartFileMonitoring:
         observer_instance.start.assert_called_once()
 
     @patch('services.file_monitor_service.Observer')
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\test\\subdir\\pat.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\subdir\\pat.csv')
     @patch('services.file_monitor_service.os.path.dirname')
     def test_start_file_monitoring_schedules_correct_path(self, mock_dirname, mock_observer_class):
         """正しいパスで監視がスケジュールされることを確認"""
@@ -94,7 +159,7 @@ class TestStartFileMonitoring:
         assert call_args.kwargs['recursive'] is False
 
     @patch('services.file_monitor_service.Observer')
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\test\\pat.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
     @patch('services.file_monitor_service.os.path.dirname')
     def test_start_file_monitoring_creates_handler_with_page(self, mock_dirname, mock_observer_class):
         """MyHandlerがpageを渡されて作成されることを確認"""
@@ -117,7 +182,7 @@ class TestStartFileMonitoring:
 class TestCheckFileExists:
     """check_file_exists関数のテスト"""
 
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\test\\pat.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
     @patch('services.file_monitor_service.os.path.exists')
     def test_check_file_exists_closes_window_when_file_missing(self, mock_exists):
         """ファイルが存在しない場合にwindowがcloseされることを確認"""
@@ -132,7 +197,7 @@ class TestCheckFileExists:
         mock_exists.assert_called_once_with('C:\\test\\pat.csv')
         page_mock.window.close.assert_called_once()
 
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\test\\pat.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\test\\pat.csv')
     @patch('services.file_monitor_service.os.path.exists')
     def test_check_file_exists_does_nothing_when_file_exists(self, mock_exists):
         """ファイルが存在する場合は何もしないことを確認"""
@@ -147,7 +212,7 @@ class TestCheckFileExists:
         mock_exists.assert_called_once_with('C:\\test\\pat.csv')
         page_mock.window.close.assert_not_called()
 
-    @patch('services.file_monitor_service.csv_file_path', 'C:\\different\\path\\data.csv')
+    @patch('services.file_monitor_service.patient_csv_path', lambda: 'C:\\different\\path\\data.csv')
     @patch('services.file_monitor_service.os.path.exists')
     def test_check_file_exists_uses_correct_path(self, mock_exists):
         """設定された正しいパスが使用されることを確認"""
@@ -160,3 +225,178 @@ class TestCheckFileExists:
 
         # Assert
         mock_exists.assert_called_once_with('C:\\different\\path\\data.csv')
+
+    @patch('services.file_monitor_service.os.path.exists')
+    def test_check_file_exists_follows_settings_reload(self, mock_exists, override_settings):
+        """設定の再読み込み後は新しい患者CSVのパスを確認することを確認"""
+        page_mock = MagicMock()
+        mock_exists.return_value = True
+        override_settings(file_paths={'patient_data': 'C:\\reloaded\\pat.csv'})
+
+        check_file_exists(page_mock)
+
+        mock_exists.assert_called_once_with('C:\\reloaded\\pat.csv')
+
+
+class TestStatPollingObserver:
+    """StatPollingObserverクラスのテスト"""
+
+    def test_detects_modification_created_and_deleted(self, tmp_path):
+        """ファイルの更新・作成・削除を対応するイベントとして通知することを確認"""
+        # Arrange
+        path = tmp_path / 'pat.csv'
+        path.write_text("1001")
+        handler = MagicMock()
+        observer = StatPollingObserver(str(path), interval=0.01, max_interval=0.02)
+        observer.schedule(handler, path=str(tmp_path))
+
+        # Act
+        observer._dispatch((1, 4, 1), (2, 8, 1))
+        observer._dispatch((2, 8, 1), None)
+        observer._dispatch(None, (3, 8, 2))
+
+        # Assert
+        event_types = [call.args[0].event_type for call in handler.dispatch.call_args_list]
+        assert event_types == ['modified', 'deleted', 'created']
+        assert all(call.args[0].src_path == str(path) for call in handler.dispatch.call_args_list)
+        assert observer.stats()['changes'] == 3
+
+    def test_polls_until_file_changes(self, tmp_path):
+        """スレッドとして動かすとファイルの更新を検出し、停止できることを確認"""
+        # Arrange
+        path = tmp_path / 'pat.csv'
+        path.write_text("1001")
+        detected = threading.Event()
+        handler = MagicMock()
+        handler.dispatch.side_effect = lambda event: detected.set()
+        observer = StatPollingObserver(str(path), interval=0.01, max_interval=0.05)
+        observer.schedule(handler)
+        observer.start()
+
+        # Act
+        time.sleep(0.05)
+        path.write_text("1001,1002")
+
+        # Assert
+        assert detected.wait(2)
+        stop_file_monitoring(observer)
+        assert not observer.is_alive()
+        stats = observer.stats()
+        assert stats['polls'] >= 1
+        assert stats['last_latency'] is not None
+
+    def test_backs_off_while_idle(self, tmp_path):
+        """変化がない間は確認間隔が上限まで延びることを確認"""
+        # Arrange
+        path = tmp_path / 'pat.csv'
+        path.write_text("1001")
+        observer = StatPollingObserver(str(path), interval=0.01, max_interval=0.04)
+        observer.start()
+
+        # Act
+        time.sleep(0.2)
+        stop_file_monitoring(observer)
+
+        # Assert
+        assert observer.current_interval == 0.04
+        assert observer.stats()['changes'] == 0
+
+    def test_transient_stat_error_is_not_deletion(self, tmp_path):
+        """アクセス拒否などの一時的なエラーでは削除を通知せず、次の確認で再試行することを確認"""
+        # Arrange
+        path = tmp_path / 'pat.csv'
+        path.write_text("1001")
+        handler = MagicMock()
+        observer = StatPollingObserver(str(path), interval=0.01, max_interval=0.02)
+        observer.schedule(handler)
+        failed = threading.Event()
+        calls = []
+        real_stat = os.stat
+
+        def flaky_stat(file_path, *args, **kwargs):
+            # 開始時の確認の次（1回目の定期確認）だけ失敗させる
+            if file_path == str(path):
+                calls.append(file_path)
+                if len(calls) == 2:
+                    failed.set()
+                    raise PermissionError(13, "Permission denied", file_path)
+            return real_stat(file_path, *args, **kwargs)
+
+        # Act
+        with patch('services.file_monitor_service.os.stat', side_effect=flaky_stat):
+            observer.start()
+            assert failed.wait(2)
+            time.sleep(0.1)
+            stop_file_monitoring(observer)
+
+        # Assert
+        handler.dispatch.assert_not_called()
+        assert observer.stats()['errors'] == 1
+        assert observer.stats()['changes'] == 0
+
+    def test_missing_file_is_deletion(self, tmp_path):
+        """ファイルがなくなった場合は削除として通知することを確認"""
+        path = tmp_path / 'pat.csv'
+        path.write_text("1001")
+        observer = StatPollingObserver(str(path))
+        previous = observer._read_stat(None)
+        path.unlink()
+
+        assert previous is not None
+        assert observer._read_stat(previous) is None
+        assert observer.stats()['errors'] == 0
+
+
+class TestCreateObserver:
+    """create_observer関数のテスト"""
+
+    def test_create_polling_observer(self):
+        """polling指定でStatPollingObserverが作成されることを確認"""
+        observer = create_observer('polling', 'C:\\test\\pat.csv')
+
+        assert isinstance(observer, StatPollingObserver)
+        assert observer.file_path == 'C:\\test\\pat.csv'
+
+    @patch('services.file_monitor_service.Observer')
+    def test_create_watchdog_observer(self, mock_observer_class):
+        """watchdog指定でwatchdogのObserverが作成されることを確認"""
+        assert create_observer('watchdog') is mock_observer_class.return_value
+
+    def test_unknown_backend(self):
+        """不明な方式はエラーになることを確認"""
+        with pytest.raises(ValueError):
+            create_observer('inotify')
+
+
+class TestStopFileMonitoring:
+    """stop_file_monitoring関数のテスト"""
+
+    def test_stop_and_join(self):
+        """監視を停止してスレッドの終了を待つことを確認"""
+        observer = MagicMock()
+
+        stop_file_monitoring(observer)
+
+        observer.stop.assert_called_once()
+        observer.join.assert_called_once()
+
+    def test_cancels_pending_reload(self, tmp_path):
+        """停止すると待機中の再読み込みを取り消し、停止後にon_changedが呼ばれないことを確認"""
+        path = tmp_path / 'pat.csv'
+        path.write_text("1001")
+        on_changed = Mock()
+
+        with patch('services.file_monitor_service.patient_csv_path', lambda: str(path)):
+            observer = start_file_monitoring(MagicMock(), on_changed=on_changed, backend='polling')
+            handler = getattr(observer, 'event_handler')
+            handler.debounce_seconds = 0.05
+            handler.on_modified(FileSystemEvent(str(path)))
+            stop_file_monitoring(observer)
+        time.sleep(0.1)
+
+        on_changed.assert_not_called()
+        assert handler._timer is None
+
+    def test_none_is_ignored(self):
+        """監視が開始されていなければ何もしないことを確認"""
+        stop_file_monitoring(None)
@@ -0,0 +1,120 @@
+from unittest.mock import patch
+
+import pytest
+
+from models import MainDisease, SheetName, Template
+from services.master_data_cache import MasterDataCache, load_master_data
+
+
+@pytest.fixture
+def master_db(test_db):
+    """主病名・シート名・テンプレートを登録したセッション"""
+    test_db.add_all([
+        MainDisease(id=1, name="高血圧症"),
+        MainDisease(id=2, name="糖尿病"),
+        SheetName(id=1, main_disease_id=1, name="1_血圧130-80以下"),
+        SheetName(id=2, main_disease_id=2, name="1_HbA1c７％"),
+        SheetName(id=3, main_disease_id=1, name="2_血圧140-90以下"),
+        Template(id=1, main_disease="高血圧症", sheet_name="1_血圧130-80以下", target_bp="130/80", goal1="減塩"),
+    ])
+    test_db.commit()
+    with patch('services.master_data_cache.get_session') as mock_get_session:
+        mock_get_session.return_value.__enter__.return_value = test_db
+        yield test_db
+
+
+class TestLoadMasterData:
+    """load_master_data関数のテスト"""
+
+    def test_builds_lookups_and_options(self, master_db):
+        """主病名のID・主病名ごとのシート名・テンプレートが引けることを確認"""
+        data = load_master_data(master_db)
+
+        assert data.disease_id("糖尿病") == 2
+        assert data.disease_id("未登録") is None
+        assert [option.key for option in data.main_disease_options()] == ["高血圧症", "糖尿病"]
+        assert [option.key for option in data.sheet_name_options(1)] == ["1_血圧130-80以下", "2_血圧140-90以下"]
+        assert len(data.sheet_name_options()) == 3
+        assert data.sheet_name_options(99) == []
+        template = data.template("高血圧症", "1_血圧130-80以下")
+        assert template is not None
+        assert template.target_bp == "130/80"
+        assert template.goal1 == "減塩"
+        assert data.template("糖尿病", "1_HbA1c７％") is None
+
+    def test_options_are_shared_but_lists_are_independent(self, master_db):
+        """選択肢のOptionは使い回し、返すリストへの変更はキャッシュに影響しないことを確認"""
+        data = load_master_data(master_db)
+
+        options = data.main_disease_options()
+        options.clear()
+
+        again = data.main_disease_options()
+        assert len(again) == 2
+        assert again[0] is data.main_disease_options()[0]
+        with pytest.raises(TypeError):
+            data.disease_ids["追加"] = 3  # type: ignore[index]
+
+
+class TestMasterDataCache:
+    """MasterDataCacheクラスのテスト"""
+
+    def test_loads_once(self, master_db):
+        """変更がなければ一度だけ読み込むことを確認"""
+        cache = MasterDataCache(check_interval=0)
+
+        first = cache.get()
+        second = cache.get()
+
+        assert first is second
+        assert cache.load_count == 1
+
+    def test_invalidate_reloads_saved_template(self, master_db):
+        """invalidate後は保存したテンプレートの内容を返すことを確認"""
+        cache = MasterDataCache(check_interval=60)
+        cache.get()
+        master_db.query(Template).filter_by(id=1).update({'target_bp': "125/75"})
+        master_db.commit()
+
+        cached = cache.get().template("高血圧症", "1_血圧130-80以下")
+        assert cached is not None and cached.target_bp == "130/80"
+        cache.invalidate()
+        reloaded = cache.get().template("高血圧症", "1_血圧130-80以下")
+        assert reloaded is not None and reloaded.target_bp == "125/75"
+        assert cache.load_count == 2
+
+    def test_detects_edited_template_by_stamp(self, master_db):
+        """他の端末でテンプレートが書き換えられた（件数・最大IDは変わらない）ことを変更回数で検出することを確認"""
+        cache = MasterDataCache(check_interval=0)
+        cache.get()
+        template = master_db.get(Template, 1)
+        assert template is not None
+        template.target_bp = "125/75"
+        master_db.commit()
+
+        reloaded = cache.get().template("高血圧症", "1_血圧130-80以下")
+
+        assert reloaded is not None and reloaded.target_bp == "125/75"
+        assert cache.load_count == 2
+
+    def test_detects_added_rows_by_stamp(self, master_db):
+        """他の端末で追加されたシート名を件数・最大IDの変化で検出することを確認"""
+        cache = MasterDataCache(check_interval=0)
+        cache.get()
+        master_db.add(SheetName(id=4, main_disease_id=2, name="2_HbA1c６％"))
+        master_db.commit()
+
+        data = cache.get()
+
+        assert [option.key for option in data.sheet_name_options(2)] == ["1_HbA1c７％", "2_HbA1c６％"]
+        assert cache.load_count == 2
+
+    def test_check_interval_limits_stamp_queries(self, master_db):
+        """確認間隔内は変更の確認もしないことを確認"""
+        cache = MasterDataCache(check_interval=60)
+        cache.get()
+        master_db.add(MainDisease(id=3, name="脂質異常症"))
+        master_db.commit()
+
+        assert cache.get().disease_id("脂質異常症") is None
+        assert cache.load_count == 1
@@ -1,17 +1,34 @@
-import configparser
 from datetime import date
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 
 import pandas as pd
 import pytest
 
 from models import MainDisease, PatientInfo, SheetName
 from services.patient_service import (
+    ROSTER_COLUMNS,
+    ROSTER_SCHEMA,
+    PatientRecord,
+    PatientRoster,
+    _frame_records,
+    as_patient_roster,
     fetch_patient_history,
+    fetch_patient_history_page,
     load_main_diseases,
     load_patient_data,
     load_sheet_names,
+    read_patient_csv_chunks,
 )
+from utils.config_manager import Settings
+
+
+def write_patient_csv(path, rows):
+    """テスト用の患者CSV（Shift-JIS、ヘッダーなし）を書き出す"""
+    lines = [
+        f"2025/01/01,ﾀﾅｶ,{patient_id},{name},{kana},1,1985/04/10,123-4567,東京都,101,山田医師,,,10,内科"
+        for patient_id, name, kana in rows
+    ]
+    path.write_bytes(("\n".join(lines) + "\n").encode("shift_jis"))
 
 
 @pytest.fixture
@@ -69,13 +86,11 @@ class TestLoadPatientData:
     """load_patient_data関数のテスト"""
 
     @patch('services.patient_service.pd.read_csv')
-    @patch('services.patient_service.config_manager.load_config')
-    def test_load_patient_data_success(self, mock_config, mock_read_csv):
+    @patch('services.patient_service.config_manager.get_settings')
+    def test_load_patient_data_success(self, mock_settings, mock_read_csv):
         """患者データ正常読み込みテスト"""
         # モック設定
-        mock_config_obj = MagicMock()
-        mock_config_obj.get.return_value = 'C:/test/pat.csv'
-        mock_config.return_value = mock_config_obj
+        mock_settings.return_value.file_paths.patient_data = 'C:/test/pat.csv'
 
         # ダミーDataFrame
         df_data = {
@@ -95,13 +110,11 @@ class TestLoadPatientData:
         assert len(df) == 3
         mock_read_csv.assert_called_once()
 
-    @patch('services.patient_service.config_manager.load_config')
-    def test_load_patient_data_config_error(self, mock_config):
+    @patch('services.patient_service.config_manager.get_settings')
+    def test_load_patient_data_config_error(self, mock_settings):
         """設定ファイルエラー時のテスト"""
-        # config.iniの読み込みエラーをシミュレート
-        mock_config_obj = MagicMock()
-        mock_config_obj.get.side_effect = configparser.NoSectionError('FilePaths')
-        mock_config.return_value = mock_config_obj
+        # config.iniの検証エラーをシミュレート
+        mock_settings.side_effect = lambda: Settings.model_validate({})
 
         # テスト実行
         error_msg, df = load_patient_data()
@@ -111,12 +124,10 @@ class TestLoadPatientData:
         assert df is None
 
     @patch('services.patient_service.pd.read_csv')
-    @patch('services.patient_service.config_manager.load_config')
-    def test_load_patient_data_file_not_found(self, mock_config, mock_read_csv):
+    @patch('services.patient_service.config_manager.get_settings')
+    def test_load_patient_data_file_not_found(self, mock_settings, mock_read_csv):
         """ファイル未検出時のテスト"""
-        mock_config_obj = MagicMock()
-        mock_config_obj.get.return_value = 'C:/test/not_found.csv'
-        mock_config.return_value = mock_config_obj
+        mock_settings.return_value.file_paths.patient_data = 'C:/test/not_found.csv'
 
         mock_read_csv.side_effect = FileNotFoundError("File not found")
 
@@ -128,6 +139,176 @@ class TestLoadPatientData:
         assert df is None
 
 
+class TestReadPatientCsvChunks:
+    """read_patient_csv_chunks関数のテスト"""
+
+    def test_reads_only_used_columns_with_dtypes(self, tmp_path):
+        """使う列だけが指定した型で読み込まれることを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1001, "田中太郎", "タナカタロウ")])
+
+        df = next(read_patient_csv_chunks(str(csv_path)))
+
+        assert list(df.columns) == ROSTER_COLUMNS
+        assert df[2].dtype == "float64"
+        assert df[14].iloc[0] == "内科"
+
+        row = PatientRoster.from_dataframe(df).get(1001)
+        assert row is not None
+        assert row.birthdate == date(1985, 4, 10)
+        assert type(row.patient_id) is int
+
+    def test_chunks_and_row_limit(self, tmp_path):
+        """分割サイズごとに読み込まれ、行数の上限が守られることを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1000 + i, f"患者{i}", "カナ") for i in range(10)])
+
+        chunks = list(read_patient_csv_chunks(str(csv_path), max_rows=7, chunk_size=3))
+
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+
+    def test_missing_values(self, tmp_path):
+        """欠損値があっても整数列の型が保たれることを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        csv_path.write_bytes("2025/01/01,,1001,田中太郎,,1,1985/04/10,,,,,,,,\n".encode("shift_jis"))
+
+        roster = PatientRoster(str(csv_path))
+        row = roster.get(1001)
+
+        assert row is not None
+        assert row.kana is None
+        assert row.doctor_id is None
+        assert row.gender == "男性"
+
+
+class TestPatientRecord:
+    """PatientRecordクラスのテスト"""
+
+    def test_slots_follow_schema(self):
+        """属性が列定義と同じ順に宣言され、インスタンス辞書を持たないことを確認"""
+        record = PatientRecord(None, 1001, "田中太郎", "タナカタロウ", 2, date(1985, 4, 10), 101, "山田医師", 10, "内科")
+
+        assert PatientRecord.__slots__ == tuple(attr for _, attr, _ in ROSTER_SCHEMA)
+        assert not hasattr(record, '__dict__')
+        assert record.gender == "女性"
+        assert record.birthdate == date(1985, 4, 10)
+
+
+class TestPatientRoster:
+    """PatientRosterクラスのテスト"""
+
+    def test_get_returns_row_by_patient_id(self, tmp_path):
+        """患者IDで行が引け、ヒット・ミスが記録されることを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1001, "田中太郎", "タナカタロウ"), (1002, "佐藤花子", "サトウハナコ")])
+        roster = PatientRoster(str(csv_path))
+
+        row = roster.get(1002)
+        by_str = roster.get("1001")
+
+        assert row is not None and by_str is not None
+        assert row.name == "佐藤花子"
+        assert type(row.doctor_id) is int
+        assert row.department == "内科"
+        assert by_str.name == "田中太郎"
+        assert roster.get(9999) is None
+        assert roster.stats() == {'hits': 2, 'misses': 1, 'loads': 1, 'size': 2}
+
+    def test_csv_is_parsed_once(self, tmp_path):
+        """ファイルが変わらなければ再解析しないことを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1001, "田中太郎", "タナカタロウ")])
+        roster = PatientRoster(str(csv_path))
+
+        with patch('services.patient_service.read_patient_csv_chunks', wraps=read_patient_csv_chunks) as mock_read:
+            for _ in range(5):
+                roster.get(1001)
+
+        assert mock_read.call_count == 1
+
+    def test_reloads_when_file_changes(self, tmp_path):
+        """ファイルの内容が変わると読み直すことを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1001, "田中太郎", "タナカタロウ")])
+        roster = PatientRoster(str(csv_path))
+        assert roster.get(1002) is None
+
+        write_patient_csv(csv_path, [(1001, "田中太郎", "タナカタロウ"), (1002, "佐藤花子", "サトウハナコ")])
+        row = roster.get(1002)
+
+        assert row is not None
+        assert row.name == "佐藤花子"
+        assert roster.stats()['loads'] == 2
+
+    def test_reload_parses_only_appended_rows(self, tmp_path):
+        """行が追記されただけなら追加分だけを解析し、追加された患者IDを返すことを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1001, "田中太郎", "タナカタロウ")])
+        roster = PatientRoster(str(csv_path))
+        roster.refresh()
+        with open(csv_path, 'ab') as f:
+            f.write("2025/01/01,ｻﾄｳ,1002,佐藤花子,サトウハナコ,2,1990/01/01,,,102,鈴木医師,,,20,外科\n".encode("shift_jis"))
+
+        with patch('services.patient_service._frame_records', wraps=_frame_records) as mock_records:
+            change = roster.reload()
+
+        assert change.incremental
+        assert change.patient_ids == {1002}
+        assert not change.first_changed
+        assert len(mock_records.call_args[0][0]) == 1
+        appended, unchanged = roster.get(1002), roster.get(1001)
+        assert appended is not None and unchanged is not None
+        assert appended.department == "外科"
+        assert unchanged.name == "田中太郎"
+
+    def test_reload_reports_changed_patients(self, tmp_path):
+        """書き換えられた場合は変わった患者IDと先頭の患者の変化を返すことを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1001, "田中太郎", "タナカタロウ"), (1002, "佐藤花子", "サトウハナコ")])
+        roster = PatientRoster(str(csv_path))
+        assert roster.reload().patient_ids == set()
+
+        write_patient_csv(csv_path, [(1003, "鈴木一郎", "スズキイチロウ"), (1002, "佐藤花子（旧姓）", "サトウハナコ")])
+        roster.get(1003)  # 通知の前に画面から検索されても変化は失われない
+        change = roster.reload()
+
+        assert not change.incremental
+        assert change.patient_ids == {1001, 1002, 1003}
+        assert change.first_patient_id == 1003
+        assert change.first_changed
+        assert roster.reload().patient_ids == set()
+
+    def test_first_returns_first_row(self, tmp_path):
+        """CSVの先頭行が取得できることを確認"""
+        csv_path = tmp_path / 'pat.csv'
+        write_patient_csv(csv_path, [(1003, "鈴木一郎", "スズキイチロウ"), (1001, "田中太郎", "タナカタロウ")])
+
+        first = PatientRoster(str(csv_path)).first()
+
+        assert first is not None
+        assert first.patient_id == 1003
+
+    def test_missing_file_sets_error(self, tmp_path):
+        """ファイルがない場合はエラーメッセージを返し、検索はNoneになることを確認"""
+        roster = PatientRoster(str(tmp_path / 'missing.csv'))
+
+        assert "エラー" in roster.refresh()
+        assert roster.get(1001) is None
+        assert roster.first() is None
+
+    def test_from_dataframe(self):
+        """DataFrameから索引を作成でき、重複IDは先頭行が使われることを確認"""
+        df = pd.DataFrame({0: [1, 2], 1: ['a', 'b'], 2: [1001, 1001], 3: ['先頭', '後続']})
+
+        roster = as_patient_roster(df)
+        row = roster.get(1001)
+
+        assert row is not None
+        assert row.name == '先頭'
+        assert as_patient_roster(roster) is roster
+        assert len(PatientRoster.from_dataframe(None)) == 0
+
+
 class TestLoadMainDiseases:
     """load_main_diseases関数のテスト"""
 
@@ -282,3 +463,65 @@ class TestFetchPatientHistory:
         assert 'main_diagnosis' in record
         assert 'sheet_name' in record
         assert 'count' in record
+
+
+class TestFetchPatientHistoryPage:
+    """fetch_patient_history_page関数（キーセットページング）のテスト"""
+
+    @pytest.fixture
+    def long_history(self, test_db):
+        """1人の患者に7件の計画書"""
+        test_db.add_all([
+            PatientInfo(patient_id=1001, issue_date=date(2025, month, 1), main_diagnosis="糖尿病",
+                        sheet_name="糖尿病用", creation_count=month)
+            for month in range(1, 8)
+        ])
+        test_db.commit()
+        with patch('services.patient_service.get_session') as mock_get_session:
+            mock_get_session.return_value.__enter__.return_value = test_db
+            yield test_db
+
+    def test_pages_follow_each_other_without_gaps(self, long_history):
+        """前のページの最後のIDから続けて取得すると、全件を新しい順に1回ずつ返すことを確認"""
+        first = fetch_patient_history_page(1001, page_size=3)
+        second = fetch_patient_history_page(1001, before_id=first.next_before_id, page_size=3)
+        last = fetch_patient_history_page(1001, before_id=second.next_before_id, page_size=3)
+
+        counts = [row['count'] for page in (first, second, last) for row in page.rows]
+        assert counts == [7, 6, 5, 4, 3, 2, 1]
+        assert last.next_before_id is None
+        assert [row['id'] for row in first.rows + second.rows + last.rows] == \
+            [row['id'] for row in fetch_patient_history(1001)]
+
+    def test_exact_page_has_no_next(self, long_history):
+        """件数がページの大きさちょうどなら次のページがないことを確認"""
+        page = fetch_patient_history_page(1001, page_size=7)
+
+        assert len(page.rows) == 7
+        assert page.next_before_id is None
+
+    def test_rows_added_while_paging_do_not_shift_pages(self, long_history):
+        """ページングの途中で追加された計画書が後のページをずらさないことを確認"""
+        first = fetch_patient_history_page(1001, page_size=3)
+        long_history.add(PatientInfo(patient_id=1001, issue_date=date(2025, 8, 1), creation_count=8))
+        long_history.commit()
+
+        second = fetch_patient_history_page(1001, before_id=first.next_before_id, page_size=3)
+
+        assert [row['count'] for row in second.rows] == [4, 3, 2]
+
+    def test_page_size_defaults_to_settings(self, long_history, override_settings):
+        """page_sizeを省略すると[DataTable] page_sizeを使うことを確認"""
+        override_settings(data_table={'page_size': 5})
+
+        page = fetch_patient_history_page(1001)
+
+        assert len(page.rows) == 5
+        assert page.next_before_id is not None
+
+    def test_no_patient_id(self, long_history):
+        """患者ID未指定時は空のページを返すことを確認"""
+        page = fetch_patient_history_page(None)
+
+        assert page.rows == []
+        assert page.next_before_id is None
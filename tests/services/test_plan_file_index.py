@@ -0,0 +1,131 @@
+import os
+import shutil
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from models.patient_info import PatientInfo
+from services.plan_file_index import INDEX_FILE_NAME, PlanFileIndex
+from services.plan_timing import recent_timings
+from services.treatment_plan_service import generate_plan, plan_content_key
+
+TEMPLATE_SOURCE = os.path.join(os.path.dirname(__file__), '..', '..', 'template', 'LDTPform.xlsm')
+
+
+@pytest.fixture
+def generated_file(tmp_path):
+    """生成済みの計画書ファイル"""
+    path = tmp_path / 'plan.xlsm'
+    path.write_bytes(b'xlsm')
+    return str(path)
+
+
+class TestPlanFileIndex:
+    """PlanFileIndexクラスのテスト"""
+
+    def test_store_and_lookup(self, tmp_path, generated_file):
+        """登録したファイルが同じキーで引けることを確認"""
+        index = PlanFileIndex(str(tmp_path))
+        index.store("key", generated_file)
+
+        assert index.lookup("key") == generated_file
+        assert index.lookup("other") is None
+
+    def test_index_is_persisted(self, tmp_path, generated_file):
+        """索引がファイルに保存され、別インスタンスから読めることを確認"""
+        PlanFileIndex(str(tmp_path)).store("key", generated_file)
+
+        assert (tmp_path / INDEX_FILE_NAME).exists()
+        assert PlanFileIndex(str(tmp_path)).lookup("key") == generated_file
+
+    def test_lookup_evicts_removed_file(self, tmp_path, generated_file):
+        """ファイルが削除されたエントリは索引から外れることを確認"""
+        index = PlanFileIndex(str(tmp_path))
+        index.store("key", generated_file)
+        os.remove(generated_file)
+
+        assert index.lookup("key") is None
+        assert len(index) == 0
+        assert len(PlanFileIndex(str(tmp_path))) == 0
+
+    def test_lookup_ignores_modified_file(self, tmp_path, generated_file):
+        """ファイルが上書きされた場合は再利用しないことを確認"""
+        index = PlanFileIndex(str(tmp_path))
+        index.store("key", generated_file)
+        with open(generated_file, 'ab') as f:
+            f.write(b'edited')
+
+        assert index.lookup("key") is None
+
+    def test_prune_on_load(self, tmp_path, generated_file):
+        """読み込み時に削除済みファイルのエントリが除かれることを確認"""
+        PlanFileIndex(str(tmp_path)).store("key", generated_file)
+        os.remove(generated_file)
+
+        with patch.object(PlanFileIndex, '_save') as mock_save:
+            index = PlanFileIndex(str(tmp_path))
+
+        assert len(index) == 0
+        mock_save.assert_called_once()
+
+    def test_broken_index_file(self, tmp_path):
+        """索引ファイルが壊れていても空の索引として扱うことを確認"""
+        (tmp_path / INDEX_FILE_NAME).write_text("{壊れた", encoding='utf-8')
+
+        assert len(PlanFileIndex(str(tmp_path))) == 0
+
+
+class TestPlanReuse:
+    """計画書ファイル再利用のテスト"""
+
+    @pytest.fixture
+    def plan_paths(self, tmp_path, override_settings):
+        """テンプレートと出力先を一時フォルダに設定"""
+        template_path = tmp_path / 'LDTPform.xlsm'
+        output_path = tmp_path / 'output'
+        shutil.copyfile(TEMPLATE_SOURCE, template_path)
+        output_path.mkdir()
+        override_settings(paths={'template_path': str(template_path), 'output_path': str(output_path)})
+        return template_path, output_path
+
+    @pytest.fixture
+    def sample_plan(self):
+        """テスト用の計画書データ"""
+        return PatientInfo(id=1, patient_id=12345, patient_name="山田太郎", issue_date=date(2025, 1, 10),
+                           birthdate=date(1980, 5, 15), doctor_id=1001, department_id=10, creation_count=1)
+
+    @patch('os.startfile', create=True)
+    def test_reprint_reuses_file(self, mock_startfile, plan_paths, sample_plan):
+        """内容が同じなら再生成せず同じファイルを開くことを確認"""
+        _, output_path = plan_paths
+
+        generate_plan(sample_plan, "LDTPform")
+        with patch('services.treatment_plan_service.build_plan_file') as mock_build:
+            generate_plan(sample_plan, "LDTPform")
+
+        mock_build.assert_not_called()
+        first, second = mock_startfile.call_args_list
+        assert first == second
+        assert recent_timings()[-1].reused
+        assert len([name for name in os.listdir(output_path) if name.endswith('.xlsm')]) == 1
+
+    @patch('os.startfile', create=True)
+    def test_changed_plan_is_regenerated(self, mock_startfile, plan_paths, sample_plan):
+        """内容が変わった場合は新しく生成することを確認"""
+        generate_plan(sample_plan, "LDTPform")
+        sample_plan.goal1 = "体重を3kg減らす"
+        with patch('services.treatment_plan_service.build_plan_file', return_value="new.xlsm") as mock_build:
+            generate_plan(sample_plan, "LDTPform")
+
+        mock_build.assert_called_once()
+
+    def test_content_key_depends_on_template(self, plan_paths, sample_plan):
+        """テンプレートが変わると内容ハッシュも変わることを確認"""
+        template_path, _ = plan_paths
+        before = plan_content_key(sample_plan)
+
+        with open(template_path, 'ab') as f:
+            f.write(b'\0')
+
+        assert plan_content_key(sample_plan) != before
@@ -0,0 +1,96 @@
+import threading
+from datetime import date
+from types import SimpleNamespace
+
+from models.patient_info import PatientInfo
+from services.plan_job_queue import PlanJobQueue
+
+
+class TestPlanJobQueue:
+    """PlanJobQueueクラスのテスト"""
+
+    def test_submit_runs_job_on_worker_thread(self):
+        """ジョブがワーカースレッドで実行され、完了通知が届くことを確認"""
+        threads = []
+        finished = []
+        job_queue = PlanJobQueue(generate=lambda plan: threads.append(threading.current_thread()))
+
+        job = job_queue.submit(SimpleNamespace(id=1), finished.append)
+        job_queue.join()
+
+        assert threads[0] is not threading.main_thread()
+        assert finished == [job]
+        assert job.succeeded
+        assert job_queue.stats() == {'queued': 0, 'running': 0, 'completed': 1, 'failed': 0}
+
+    def test_submit_returns_before_generation_finishes(self):
+        """生成が終わる前にsubmitが戻り、待機・実行中の件数が見えることを確認"""
+        release = threading.Event()
+        started = threading.Event()
+
+        def generate(plan):
+            started.set()
+            release.wait(5)
+
+        job_queue = PlanJobQueue(generate=generate)
+        job_queue.submit(SimpleNamespace(id=1))
+        job_queue.submit(SimpleNamespace(id=2))
+        started.wait(5)
+
+        assert job_queue.stats() == {'queued': 1, 'running': 1, 'completed': 0, 'failed': 0}
+
+        release.set()
+        job_queue.join()
+        assert job_queue.stats()['completed'] == 2
+
+    def test_failed_job_reports_error(self):
+        """生成に失敗したジョブはエラーを通知し、後続のジョブは処理されることを確認"""
+        def generate(plan):
+            if plan.id == 1:
+                raise OSError("テンプレートが見つかりません")
+
+        finished = []
+        job_queue = PlanJobQueue(generate=generate)
+        job_queue.submit(SimpleNamespace(id=1), finished.append)
+        job_queue.submit(SimpleNamespace(id=2), finished.append)
+        job_queue.join()
+
+        assert [job.succeeded for job in finished] == [False, True]
+        assert "テンプレートが見つかりません" in (finished[0].error or "")
+        assert job_queue.stats() == {'queued': 0, 'running': 0, 'completed': 1, 'failed': 1}
+
+    def test_callback_error_does_not_stop_worker(self):
+        """完了通知で例外が起きてもワーカーが止まらないことを確認"""
+        def on_done(job):
+            raise RuntimeError("通知失敗")
+
+        job_queue = PlanJobQueue(generate=lambda plan: None)
+        job_queue.submit(SimpleNamespace(id=1), on_done)
+        job_queue.submit(SimpleNamespace(id=2), on_done)
+        job_queue.join()
+
+        assert job_queue.stats()['completed'] == 2
+
+    def test_submit_snapshots_orm_object(self):
+        """ORMオブジェクトはセッションから切り離したコピーで渡されることを確認"""
+        received = []
+        job_queue = PlanJobQueue(generate=received.append)
+        patient_info = PatientInfo(id=7, patient_id=1001, issue_date=date(2025, 1, 10), creation_count=1)
+
+        job_queue.submit(patient_info)
+        job_queue.join()
+
+        assert isinstance(received[0], SimpleNamespace)
+        assert received[0].id == 7
+        assert received[0].patient_id == 1001
+
+    def test_shutdown_waits_for_pending_jobs(self):
+        """shutdownは残りのジョブを処理してから戻ることを確認"""
+        processed = []
+        job_queue = PlanJobQueue(generate=lambda plan: processed.append(plan.id))
+        for plan_id in (1, 2, 3):
+            job_queue.submit(SimpleNamespace(id=plan_id))
+
+        job_queue.shutdown()
+
+        assert processed == [1, 2, 3]
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from models.patient_info import PatientInfo
+from services import plan_timing
+from services.plan_timing import (
+    PlanTimer,
+    PlanTiming,
+    latency_percentiles,
+    read_timing_log,
+    recent_timings,
+    record_timing,
+)
+from services.treatment_plan_service import generate_plan
+
+TEMPLATE_SOURCE = os.path.join(os.path.dirname(__file__), '..', '..', 'template', 'LDTPform.xlsm')
+
+
+class TestPlanTimer:
+    """PlanTimerクラスのテスト"""
+
+    def test_phase_accumulates_elapsed_time(self):
+        """同じフェーズを複数回計測すると合算されることを確認"""
+        timer = PlanTimer()
+        with patch('services.plan_timing.time.perf_counter', side_effect=[1.0, 1.5, 2.0, 2.25]):
+            with timer.phase("save"):
+                pass
+            with timer.phase("save"):
+                pass
+
+        assert timer.phases == {"save": 750.0}
+
+    def test_phase_records_time_on_error(self):
+        """例外が発生してもフェーズの時間が記録されることを確認"""
+        timer = PlanTimer()
+        with pytest.raises(OSError):
+            with timer.phase("save"):
+                raise OSError("書き込みできません")
+
+        assert "save" in timer.phases
+
+
+class TestRecordTiming:
+    """計測結果の記録と読み込みのテスト"""
+
+    def test_record_timing_writes_json_lines(self):
+        """計測結果がJSON Lines形式で追記され、メモリからも取得できることを確認"""
+        timing = PlanTiming(document_code="A", engine="openpyxl", plan_id=1, terminal="PC01",
+                            phases={"save": 12.5}, total_ms=20.0, file_size=1024)
+
+        record_timing(timing)
+        record_timing(PlanTiming(document_code="B", engine="openpyxl", terminal="PC01"))
+
+        with open(plan_timing._timing_settings().log_path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert json.loads(lines[0])["phases"] == {"save": 12.5}
+        assert [t.document_code for t in recent_timings()] == ["A", "B"]
+        assert read_timing_log()[0] == timing
+
+    def test_history_size_follows_settings_reload(self):
+        """設定の再読み込みで保持件数が変わると、直近の記録をその件数に切り詰めることを確認"""
+        for code in ("A", "B", "C"):
+            record_timing(PlanTiming(document_code=code, engine="openpyxl"))
+
+        settings = plan_timing._timing_settings().model_copy(update={'history_size': 2})
+        with patch('services.plan_timing._timing_settings', return_value=settings):
+            record_timing(PlanTiming(document_code="D", engine="openpyxl"))
+
+        assert [t.document_code for t in recent_timings()] == ["C", "D"]
+
+    def test_read_timing_log_includes_rotated_files(self, tmp_path):
+        """ローテーション済みのファイルも古い順に読み込まれることを確認"""
+        log_path = tmp_path / 'timing.jsonl'
+        (tmp_path / 'timing.jsonl.2').write_text(PlanTiming("old", "openpyxl").to_json() + "\n", encoding='utf-8')
+        (tmp_path / 'timing.jsonl.1').write_text(PlanTiming("mid", "openpyxl").to_json() + "\n壊れた行\n",
+                                                 encoding='utf-8')
+        log_path.write_text(PlanTiming("new", "openpyxl").to_json() + "\n", encoding='utf-8')
+
+        timings = read_timing_log(str(log_path))
+
+        assert [t.document_code for t in timings] == ["old", "mid", "new"]
+
+    def test_read_timing_log_disabled(self):
+        """ログのパスが空の場合は空のリストを返すことを確認"""
+        settings = plan_timing._timing_settings().model_copy(update={'log_path': ''})
+        with patch('services.plan_timing._timing_settings', return_value=settings):
+            assert read_timing_log() == []
+
+
+class TestLatencyPercentiles:
+    """latency_percentiles関数のテスト"""
+
+    def test_percentiles_per_terminal(self):
+        """端末ごとにパーセンタイルが計算され、失敗した記録は除外されることを確認"""
+        timings = [PlanTiming(str(i), "openpyxl", terminal="PC01", total_ms=float(i), phases={"save": i / 2})
+                   for i in range(1, 102)]
+        timings.append(PlanTiming("x", "openpyxl", terminal="PC01", total_ms=9999.0, error="NG"))
+        timings.append(PlanTiming("y", "openpyxl", terminal="PC02", total_ms=80.0))
+
+        result = latency_percentiles(timings)
+
+        assert result["PC01"][50] == pytest.approx(51.0)
+        assert result["PC01"][99] == pytest.approx(100.0)
+        assert result["PC02"] == {50: 80.0, 90: 80.0, 99: 80.0}
+        assert latency_percentiles(timings, phase="save", percentiles=(50,))["PC01"][50] == pytest.approx(25.5)
+
+
+class TestGeneratePlanTiming:
+    """generate_planの計測のテスト"""
+
+    @pytest.fixture
+    def sample_plan(self):
+        """テスト用の計画書データ"""
+        return PatientInfo(id=3, patient_id=12345, patient_name="山田太郎", issue_date=date(2025, 1, 10),
+                           birthdate=date(1980, 5, 15), doctor_id=1001, department_id=10, creation_count=1)
+
+    @patch('os.startfile', create=True)
+    def test_generate_plan_records_phases(self, mock_startfile, sample_plan, tmp_path, override_settings):
+        """各フェーズの時間とファイルサイズが記録されることを確認"""
+        template_path = tmp_path / 'LDTPform.xlsm'
+        shutil.copyfile(TEMPLATE_SOURCE, template_path)
+        override_settings(paths={'template_path': str(template_path), 'output_path': str(tmp_path)})
+
+        generate_plan(sample_plan, "LDTPform")
+
+        timing = recent_timings()[-1]
+        assert timing.plan_id == 3
+        assert set(timing.phases) == {"reuse_lookup", "barcode_render", "template_load", "populate", "save",
+                                      "launch"}
+        assert timing.total_ms >= sum(timing.phases.values())
+        assert timing.file_size == os.path.getsize(tmp_path / f"{timing.document_code}.xlsm")
+        assert timing.error is None
+
+    @patch('services.treatment_plan_service.build_plan_file', side_effect=OSError("保存先がありません"))
+    def test_generate_plan_records_failure(self, mock_build, sample_plan):
+        """生成に失敗した場合もエラー付きで記録されることを確認"""
+        with pytest.raises(OSError):
+            generate_plan(sample_plan, "LDTPform")
+
+        timing = recent_timings()[-1]
+        assert timing.error == "保存先がありません"
+        assert timing.file_size is None
@@ -0,0 +1,168 @@
+import os
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from services.patient_service import PatientRecord, PatientRoster
+from services.roster_store import (
+    CompiledRoster,
+    RosterStoreError,
+    build_roster_bytes,
+    compile_roster,
+    open_compiled_roster,
+    versioned_path,
+)
+from tests.services.test_patient_service import write_patient_csv
+
+
+def source_key(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@pytest.fixture
+def patient_csv(tmp_path):
+    """患者IDが昇順でない患者CSV"""
+    csv_path = tmp_path / 'pat.csv'
+    write_patient_csv(csv_path, [(1003, "鈴木一郎", "スズキイチロウ"), (1001, "田中太郎", "タナカタロウ"),
+                                 (1002, "佐藤花子", "サトウハナコ"), (1001, "田中次郎", "タナカジロウ")])
+    return csv_path
+
+
+class TestCompiledRoster:
+    """CompiledRosterクラスのテスト"""
+
+    def test_get_by_binary_search(self, tmp_path, patient_csv):
+        """コンパイル後に患者IDでレコードが引けることを確認"""
+        compiled_path = compile_roster(str(patient_csv), str(tmp_path / 'roster.bin'))
+        roster = CompiledRoster(compiled_path)
+
+        record = roster.get(1002)
+        first_duplicate = roster.get(1001)
+        first_row = roster.record(0)
+
+        assert record is not None and first_duplicate is not None and first_row is not None
+        assert record.name == "佐藤花子"
+        assert record.birthdate == date(1985, 4, 10)
+        assert record.doctor_id == 101
+        assert record.department == "内科"
+        assert first_duplicate.name == "田中太郎"
+        assert roster.get(9999) is None
+        assert first_row.patient_id == 1003
+        assert len(roster) == 3
+        assert roster.matches(source_key(patient_csv))
+        roster.close()
+
+    def test_missing_values_round_trip(self, tmp_path):
+        """欠損値がNoneのまま復元されることを確認"""
+        record = PatientRecord(None, 1001, "田中太郎", None, None, None, None, None, 10, "内科")
+        path = tmp_path / 'roster.bin'
+        path.write_bytes(build_roster_bytes([record], (0, 0)))
+
+        roster = CompiledRoster(str(path))
+
+        assert roster.get(1001) == record
+        roster.close()
+
+    def test_rejects_broken_file(self, tmp_path):
+        """形式の異なるファイルはエラーになることを確認"""
+        path = tmp_path / 'roster.bin'
+        path.write_bytes(b"not a roster" * 10)
+
+        with pytest.raises(RosterStoreError):
+            CompiledRoster(str(path))
+
+
+class TestOpenCompiledRoster:
+    """open_compiled_roster関数のテスト"""
+
+    def test_reuses_up_to_date_file(self, tmp_path, patient_csv):
+        """元CSVが変わっていなければコンパイルしないことを確認"""
+        compiled_path = str(tmp_path / 'roster.bin')
+        open_compiled_roster(str(patient_csv), compiled_path, source_key(patient_csv)).close()
+
+        with patch('services.roster_store.compile_roster') as mock_compile:
+            roster = open_compiled_roster(str(patient_csv), compiled_path, source_key(patient_csv))
+
+        mock_compile.assert_not_called()
+        record = roster.get(1003)
+        assert record is not None
+        assert record.name == "鈴木一郎"
+        roster.close()
+
+    def test_recompiles_broken_file(self, tmp_path, patient_csv):
+        """壊れたファイルはコンパイルし直すことを確認"""
+        compiled_path = str(tmp_path / 'roster.bin')
+        with open(versioned_path(compiled_path, source_key(patient_csv)), "wb"):
+            pass
+
+        roster = open_compiled_roster(str(patient_csv), compiled_path, source_key(patient_csv))
+
+        assert len(roster) == 3
+        roster.close()
+
+    def test_new_version_does_not_replace_open_file(self, tmp_path, patient_csv):
+        """元CSVの更新後は別名のファイルにコンパイルし、開いている古い版は置き換えないことを確認"""
+        compiled_path = str(tmp_path / 'roster.bin')
+        old = open_compiled_roster(str(patient_csv), compiled_path, source_key(patient_csv))
+
+        write_patient_csv(patient_csv, [(2001, "高橋美咲", "タカハシミサキ")])
+        with patch('services.roster_store.os.replace', wraps=os.replace) as mock_replace:
+            new = open_compiled_roster(str(patient_csv), compiled_path, source_key(patient_csv))
+
+        assert new.path != old.path
+        assert mock_replace.call_args.args[1] == new.path
+        record = new.get(2001)
+        assert record is not None
+        assert record.name == "高橋美咲"
+        assert new.get(1003) is None
+        assert len(old) == 3
+        old.close()
+        new.close()
+
+
+class TestPatientRosterCompiled:
+    """コンパイル済み患者ファイルを使うPatientRosterのテスト"""
+
+    def test_second_process_skips_parsing(self, tmp_path, patient_csv):
+        """コンパイル済みファイルがあればCSVを解析しないことを確認"""
+        compiled_path = str(tmp_path / 'roster.bin')
+        PatientRoster(str(patient_csv), compiled_path).refresh()
+
+        roster = PatientRoster(str(patient_csv), compiled_path)
+        with patch('services.roster_store.read_patient_csv_chunks') as mock_read:
+            record = roster.get(1002)
+
+        mock_read.assert_not_called()
+        first = roster.first()
+        assert record is not None and first is not None
+        assert record.name == "佐藤花子"
+        assert first.patient_id == 1003
+        assert len(roster) == 3
+
+    def test_removes_old_versions_after_reload(self, tmp_path, patient_csv):
+        """読み直した後は古い版のファイルを削除し、開いていない版だけが残らないことを確認"""
+        compiled_path = str(tmp_path / 'roster.bin')
+        roster = PatientRoster(str(patient_csv), compiled_path)
+        roster.refresh()
+        old_path = versioned_path(compiled_path, source_key(patient_csv))
+
+        write_patient_csv(patient_csv, [(2001, "高橋美咲", "タカハシミサキ")])
+        roster.refresh()
+
+        new_path = versioned_path(compiled_path, source_key(patient_csv))
+        assert sorted(os.listdir(tmp_path)) == sorted(['pat.csv', os.path.basename(new_path)])
+        assert not os.path.exists(old_path)
+
+    def test_falls_back_to_memory_index(self, tmp_path, patient_csv):
+        """コンパイル済みファイルを書けない場合はメモリ上の索引を使うことを確認"""
+        roster = PatientRoster(str(patient_csv), str(tmp_path / 'roster.bin'))
+
+        with patch('services.roster_store.os.replace', side_effect=PermissionError("使用中")):
+            record = roster.get(1002)
+
+        assert record is not None
+        assert record.name == "佐藤花子"
+
+        assert roster.error_message == ""
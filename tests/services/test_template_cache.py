@@ -0,0 +1,107 @@
+import os
+import shutil
+import zipfile
+from unittest.mock import patch
+
+import pytest
+from openpyxl import load_workbook
+
+from services.template_cache import TemplateCache
+
+TEMPLATE_SOURCE = os.path.join(os.path.dirname(__file__), '..', '..', 'template', 'LDTPform.xlsm')
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    """テスト用にコピーしたテンプレートのパス"""
+    path = tmp_path / 'LDTPform.xlsm'
+    shutil.copyfile(TEMPLATE_SOURCE, path)
+    return str(path)
+
+
+class TestTemplateCache:
+    """TemplateCacheクラスのテスト"""
+
+    def test_get_workbook_returns_template_sheets(self, template_path):
+        """テンプレートのシート構成を持つWorkbookが返されることを確認"""
+        cache = TemplateCache()
+
+        workbook = cache.get_workbook(template_path)
+
+        assert workbook.sheetnames == ['共通情報', '初回用', '継続用']
+        assert workbook.vba_archive is not None
+
+    def test_get_workbook_parses_template_once(self, template_path):
+        """テンプレートの解析が初回のみ行われることを確認"""
+        cache = TemplateCache()
+
+        with patch('services.template_cache.load_workbook', wraps=load_workbook) as mock_load:
+            cache.get_workbook(template_path)
+            cache.get_workbook(template_path)
+            cache.get_workbook(template_path)
+
+        assert mock_load.call_count == 1
+        assert cache.load_count == 1
+
+    def test_get_workbook_returns_independent_clones(self, template_path):
+        """複製への変更が他の複製に影響しないことを確認"""
+        cache = TemplateCache()
+
+        first = cache.get_workbook(template_path)
+        first['共通情報']['B2'] = 12345
+        second = cache.get_workbook(template_path)
+
+        assert first is not second
+        assert second['共通情報']['B2'].value != 12345
+
+    def test_get_workbook_reloads_when_content_changes(self, template_path):
+        """テンプレートの内容が変わったら再解析されることを確認"""
+        cache = TemplateCache()
+        cache.get_workbook(template_path)
+        old_digest = cache.digest
+
+        workbook = load_workbook(template_path, keep_vba=True)
+        workbook['共通情報']['B2'] = "変更後"
+        workbook.save(template_path)
+        stat = os.stat(template_path)
+        os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        reloaded = cache.get_workbook(template_path)
+
+        assert cache.load_count == 2
+        assert cache.digest != old_digest
+        assert reloaded['共通情報']['B2'].value == "変更後"
+
+    def test_get_workbook_skips_reload_when_only_mtime_changes(self, template_path):
+        """更新日時のみ変わった場合は再解析しないことを確認"""
+        cache = TemplateCache()
+        cache.get_workbook(template_path)
+
+        stat = os.stat(template_path)
+        os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        cache.get_workbook(template_path)
+
+        assert cache.load_count == 1
+
+    def test_invalidate_forces_reload(self, template_path):
+        """invalidate後は再解析されることを確認"""
+        cache = TemplateCache()
+        cache.get_workbook(template_path)
+
+        cache.invalidate()
+        cache.get_workbook(template_path)
+
+        assert cache.load_count == 2
+
+    def test_saved_clone_keeps_vba_project(self, template_path, tmp_path):
+        """複製を保存したファイルにVBAプロジェクトが含まれることを確認"""
+        cache = TemplateCache()
+        output_path = str(tmp_path / 'output.xlsm')
+
+        workbook = cache.get_workbook(template_path)
+        workbook['共通情報']['B2'] = 12345
+        workbook.save(output_path)
+
+        with zipfile.ZipFile(output_path) as archive:
+            assert 'xl/vbaProject.bin' in archive.namelist()
+        assert load_workbook(output_path)['共通情報']['B2'].value == 12345
@@ -1,11 +1,23 @@
 import os
+import zipfile
 from datetime import date
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from models.patient_info import PatientInfo
-from services.treatment_plan_service import generate_plan, populate_common_sheet
+from openpyxl import Workbook
+from openpyxl.worksheet.worksheet import Worksheet
+
+from services.treatment_plan_service import (
+    _PngImage,
+    _add_barcode_to_sheet,
+    _build_barcode_options,
+    clear_barcode_cache,
+    generate_plan,
+    populate_common_sheet,
+    render_barcode,
+)
 
 
 @pytest.fixture
@@ -54,35 +66,18 @@ def sample_patient_info():
     return patient
 
 
-@pytest.fixture
-def mock_config():
-    """テスト用の設定をモック"""
-    config_mock = MagicMock()
-    config_mock.get.side_effect = lambda section, key: {
-        ('Paths', 'template_path'): 'C:/test/template.xlsm',
-        ('Paths', 'output_path'): 'C:/test/output',
-    }.get((section, key), '')
-    config_mock.getboolean.return_value = False
-    config_mock.getfloat.side_effect = lambda key, default: default
-    config_mock.getint.side_effect = lambda key, default: default
-    return config_mock
-
-
 class TestTreatmentPlanGenerator:
     """TreatmentPlanGeneratorクラスのテスト"""
 
-    @patch('services.treatment_plan_service.Image')
+    @patch('services.treatment_plan_service._PngImage')
     @patch('services.treatment_plan_service.Code128')
-    @patch('services.treatment_plan_service.load_workbook')
-    @patch('services.treatment_plan_service.config')
+    @patch('services.treatment_plan_service.load_template_workbook')
     @patch('os.startfile')
-    def test_generate_plan_creates_file(self, mock_startfile, mock_config, mock_load_wb, mock_code128, mock_image, sample_patient_info):
+    def test_generate_plan_creates_file(self, mock_startfile, mock_load_wb, mock_code128, mock_image,
+                                        sample_patient_info, override_settings):
         """療養計画書生成テスト"""
         # モックの設定
-        mock_config.get.side_effect = lambda section, key: {
-            ('Paths', 'template_path'): 'C:/test/template.xlsm',
-            ('Paths', 'output_path'): 'C:/test/output',
-        }.get((section, key), '')
+        override_settings(paths={'template_path': 'C:/test/template.xlsm', 'output_path': 'C:/test/output'})
 
         mock_wb = MagicMock()
         mock_sheet = MagicMock()
@@ -90,17 +85,6 @@ class TestTreatmentPlanGenerator:
         mock_wb.worksheets = [mock_sheet]
         mock_load_wb.return_value = mock_wb
 
-        mock_barcode_config = MagicMock()
-        mock_barcode_config.getboolean.return_value = False
-        mock_barcode_config.getfloat.side_effect = lambda key, default: default
-        mock_barcode_config.getint.side_effect = lambda key, default: {
-            'quiet_zone': 1,
-            'image_width': 200,
-            'image_height': 30
-        }.get(key, default)
-        mock_barcode_config.get.return_value = 'B2'
-        mock_config.__getitem__.return_value = mock_barcode_config
-
         # バーコード生成のモック
         mock_barcode_instance = MagicMock()
         mock_code128.return_value = mock_barcode_instance
@@ -281,10 +265,9 @@ class TestTreatmentPlanGenerator:
         assert mock_sheet["B14"] is None
         assert mock_sheet["B38"] is None
 
-    @patch('services.treatment_plan_service.load_workbook')
-    @patch('services.treatment_plan_service.config')
+    @patch('services.treatment_plan_service.load_template_workbook')
     @patch('os.startfile')
-    def test_generate_plan_file_naming(self, mock_startfile, mock_config, mock_load_wb):
+    def test_generate_plan_file_naming(self, mock_startfile, mock_load_wb, override_settings):
         """ファイル名生成テスト"""
         patient = PatientInfo(
             patient_id=123,
@@ -294,10 +277,7 @@ class TestTreatmentPlanGenerator:
             creation_count=1
         )
 
-        mock_config.get.side_effect = lambda section, key: {
-            ('Paths', 'template_path'): 'C:/test/template.xlsm',
-            ('Paths', 'output_path'): 'C:/test/output',
-        }.get((section, key), '')
+        override_settings(paths={'template_path': 'C:/test/template.xlsm', 'output_path': 'C:/test/output'})
 
         mock_wb = MagicMock()
         mock_sheet = MagicMock()
@@ -305,13 +285,6 @@ class TestTreatmentPlanGenerator:
         mock_wb.worksheets = [mock_sheet]
         mock_load_wb.return_value = mock_wb
 
-        mock_barcode_config = MagicMock()
-        mock_barcode_config.getboolean.return_value = False
-        mock_barcode_config.getfloat.side_effect = lambda key, default: default
-        mock_barcode_config.getint.side_effect = lambda key, default: default
-        mock_barcode_config.get.return_value = 'B2'
-        mock_config.__getitem__.return_value = mock_barcode_config
-
         generate_plan(patient, 'test.xlsm')
 
         # ファイル保存が呼ばれたことを確認
@@ -323,3 +296,95 @@ class TestTreatmentPlanGenerator:
         assert filename.startswith("000000123")  # patient_id (9桁ゼロ埋め)
         assert "39221" in filename  # document_number
         assert filename.endswith(".xlsm")
+
+
+class TestBarcodeRendering:
+    """バーコード生成とキャッシュのテスト"""
+
+    def setup_method(self):
+        """各テスト前にバーコードキャッシュをクリア"""
+        clear_barcode_cache()
+
+    def test_render_barcode_returns_png(self):
+        """PNGバイト列が返されることを確認"""
+        png = render_barcode("00001234539221001000102025011012000", _build_barcode_options())
+
+        assert png.startswith(b"\x89PNG\r\n\x1a\n")
+
+    @patch('services.treatment_plan_service.Code128')
+    def test_render_barcode_reuses_cached_png(self, mock_code128):
+        """同じデータとオプションでは再描画されないことを確認"""
+        options = _build_barcode_options()
+
+        render_barcode("123", options)
+        render_barcode("123", dict(options))
+
+        assert mock_code128.call_count == 1
+
+    @patch('services.treatment_plan_service.Code128')
+    def test_render_barcode_separates_options(self, mock_code128):
+        """オプションが異なれば別々に描画されることを確認"""
+        options = _build_barcode_options()
+
+        render_barcode("123", options)
+        render_barcode("123", {**options, 'module_height': 20.0})
+        render_barcode("456", options)
+
+        assert mock_code128.call_count == 3
+
+    @patch('services.treatment_plan_service.Code128')
+    def test_cache_size_follows_settings_reload(self, mock_code128, override_settings):
+        """設定の再読み込みでcache_sizeが変わるとキャッシュを作り直すことを確認"""
+        options = _build_barcode_options()
+        render_barcode("123", options)
+
+        override_settings(barcode={'cache_size': 1})
+        render_barcode("123", options)
+        render_barcode("456", options)
+        render_barcode("123", options)
+
+        assert mock_code128.call_count == 4
+
+    @patch('services.treatment_plan_service.render_barcode')
+    @patch('services.treatment_plan_service.load_template_workbook')
+    @patch('os.startfile')
+    def test_generate_plan_renders_barcode_once(self, mock_startfile, mock_load_wb, mock_render,
+                                                sample_patient_info, override_settings):
+        """1件の計画書でバーコード描画が1回だけ行われ両シートに貼られることを確認"""
+        override_settings(paths={'template_path': 'C:/test/output', 'output_path': 'C:/test/output'})
+        mock_wb = MagicMock()
+        mock_load_wb.return_value = mock_wb
+        mock_render.return_value = render_barcode("123", _build_barcode_options())
+
+        generate_plan(sample_patient_info, 'test.xlsm')
+
+        mock_render.assert_called_once()
+        assert mock_wb.__getitem__.return_value.add_image.call_count == 2
+
+    def test_png_image_uses_cached_bytes(self):
+        """保存時にPILで開き直さず、PNGバイト列がそのまま出力データとして使われることを確認"""
+        png = render_barcode("123", _build_barcode_options())
+        img = _PngImage(png)
+
+        with patch('openpyxl.drawing.image._import_image') as mock_import:
+            data = img._data()
+
+        mock_import.assert_not_called()
+        assert data is png
+        assert img.format == "png"
+        assert img.width > 0 and img.height > 0
+
+    def test_add_barcode_to_sheet_saves_image(self, tmp_path):
+        """貼り付けたバーコードが保存後のファイルに含まれることを確認"""
+        workbook = Workbook()
+        sheet = workbook.active
+        assert isinstance(sheet, Worksheet)
+        png = render_barcode("123", _build_barcode_options())
+
+        _add_barcode_to_sheet(sheet, png)
+        workbook.save(tmp_path / "barcode.xlsx")
+
+        with zipfile.ZipFile(tmp_path / "barcode.xlsx") as saved:
+            media = [name for name in saved.namelist() if name.startswith("xl/media/")]
+            assert len(media) == 1
+            assert saved.read(media[0]) == png
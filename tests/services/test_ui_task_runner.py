@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from services.ui_task_runner import UITaskRunner
+
+
+@pytest.fixture
+def runner():
+    task_runner = UITaskRunner(max_workers=2)
+    yield task_runner
+    task_runner.shutdown()
+
+
+def blocking_work(started, release, result):
+    """startedを立ててからreleaseまで待ち、resultを返す処理"""
+    def work():
+        started.set()
+        release.wait(5)
+        return result
+    return work
+
+
+class TestUITaskRunner:
+    """UITaskRunnerクラスのテスト"""
+
+    def test_runs_work_off_calling_thread_and_applies_result(self, runner):
+        """処理がワーカースレッドで実行され、結果がon_doneに渡ることを確認"""
+        threads = []
+        results = []
+
+        def work():
+            threads.append(threading.current_thread())
+            return 42
+
+        runner.submit(work, results.append)
+        assert runner.wait(5)
+
+        assert threads[0] is not threading.current_thread()
+        assert results == [42]
+        assert runner.stats() == {'pending': 0, 'completed': 1, 'failed': 0, 'discarded': 0}
+
+    def test_busy_change_is_notified_once_per_burst(self):
+        """処理中の間だけbusyになり、開始と終了が1回ずつ通知されることを確認"""
+        changes = []
+        started, release = threading.Event(), threading.Event()
+        runner = UITaskRunner(max_workers=2, on_busy_change=changes.append)
+
+        runner.submit(blocking_work(started, release, 1))
+        runner.submit(lambda: 2)
+        started.wait(5)
+        assert runner.busy
+        release.set()
+        runner.wait(5)
+        runner.shutdown()
+
+        assert changes == [True, False]
+        assert not runner.busy
+
+    def test_newer_task_with_same_key_discards_older_result(self, runner):
+        """同じkeyの新しいタスクを登録すると、実行中の古いタスクの結果は反映しないことを確認"""
+        started, release = threading.Event(), threading.Event()
+        results = []
+        runner.submit(blocking_work(started, release, "患者1001"), results.append, key='form')
+        started.wait(5)
+
+        runner.submit(lambda: "患者1002", results.append, key='form')
+        release.set()
+        runner.wait(5)
+
+        assert results == ["患者1002"]
+        assert runner.stats()['discarded'] == 1
+
+    def test_superseded_queued_task_is_cancelled(self):
+        """未開始の古いタスクは実行せずに取り消すことを確認"""
+        runner = UITaskRunner(max_workers=1)
+        started, release = threading.Event(), threading.Event()
+        ran = []
+        runner.submit(blocking_work(started, release, None))
+        started.wait(5)
+
+        old = runner.submit(lambda: ran.append("old"), key='history')
+        runner.submit(lambda: ran.append("new"), key='history')
+        release.set()
+        runner.wait(5)
+        runner.shutdown()
+
+        assert old.future is not None
+        assert old.future.cancelled()
+        assert ran == ["new"]
+
+    def test_invalidate_discards_reads_but_not_writes(self, runner):
+        """invalidateで表示用の読み込みの結果は捨て、keyのない書き込みの結果は反映することを確認"""
+        started, release = threading.Event(), threading.Event()
+        write_started = threading.Event()
+        results = []
+        runner.submit(blocking_work(started, release, "読み込み"), results.append, key='form')
+        runner.submit(blocking_work(write_started, release, "書き込み"), results.append)
+        started.wait(5)
+        write_started.wait(5)
+
+        runner.invalidate()
+        release.set()
+        runner.wait(5)
+
+        assert results == ["書き込み"]
+
+    def test_error_goes_to_on_error(self, runner):
+        """処理の例外はon_errorに渡り、on_doneは呼ばれないことを確認"""
+        errors = []
+        results = []
+
+        def work():
+            raise RuntimeError("データベースに接続できません")
+
+        runner.submit(work, results.append, errors.append)
+        runner.wait(5)
+
+        assert [str(e) for e in errors] == ["データベースに接続できません"]
+        assert results == []
+        assert runner.stats()['failed'] == 1
@@ -0,0 +1,150 @@
+import os
+import shutil
+import zipfile
+from datetime import date
+
+import pytest
+from openpyxl import load_workbook
+
+from models.patient_info import PatientInfo
+from services import xlsm_patch_writer
+from services.treatment_plan_service import (
+    COMMON_SHEET_CELL_MAP,
+    _build_barcode_options,
+    render_barcode,
+    write_plan_openpyxl,
+    write_plan_xml_patch,
+)
+from services.xlsm_patch_writer import PatchLayout, write_plan
+
+TEMPLATE_SOURCE = os.path.join(os.path.dirname(__file__), '..', '..', 'template', 'LDTPform.xlsm')
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    """テスト用にコピーしたテンプレートのパス"""
+    path = tmp_path / 'LDTPform.xlsm'
+    shutil.copyfile(TEMPLATE_SOURCE, path)
+    return str(path)
+
+
+@pytest.fixture
+def barcode_png():
+    """テスト用のバーコードPNG"""
+    return render_barcode("000012345392210100100120250110120000", _build_barcode_options())
+
+
+@pytest.fixture
+def sample_plan():
+    """テスト用の計画書データ"""
+    return PatientInfo(
+        patient_id=12345,
+        patient_name="山田<太郎> & 花子",
+        kana="ヤマダタロウ",
+        gender="男性",
+        birthdate=date(1980, 5, 15),
+        issue_date=date(2025, 1, 10),
+        issue_date_age=44,
+        doctor_id=1001,
+        doctor_name="田中医師",
+        department="内科",
+        department_id=10,
+        main_diagnosis="糖尿病",
+        creation_count=2,
+        target_weight=65.5,
+        sheet_name="1_HbA1c７％",
+        target_bp="130/80",
+        target_hba1c="7",
+        goal1="目標1",
+        goal2=None,
+        nonsmoker=True,
+        smoking_cessation=False,
+        ophthalmology=True,
+        dental=False,
+        cancer_screening=True,
+    )
+
+
+class TestWritePlanXmlPatch:
+    """XMLパッチ方式の計画書生成テスト"""
+
+    def test_common_sheet_matches_openpyxl_engine(self, template_path, tmp_path, sample_plan, barcode_png):
+        """共通情報シートの値がopenpyxl方式と同じになることを確認"""
+        openpyxl_path = str(tmp_path / 'openpyxl.xlsm')
+        patched_path = str(tmp_path / 'patched.xlsm')
+
+        write_plan_openpyxl(template_path, openpyxl_path, sample_plan, barcode_png)
+        write_plan_xml_patch(template_path, patched_path, sample_plan, barcode_png)
+
+        expected = load_workbook(openpyxl_path)['共通情報']
+        actual = load_workbook(patched_path)['共通情報']
+        for cell, _ in COMMON_SHEET_CELL_MAP:
+            assert (actual[cell].value or None) == (expected[cell].value or None), cell
+
+    @pytest.mark.parametrize("creation_count, expected_sheet", [(1, "初回用"), (2, "継続用")])
+    def test_selects_target_sheet(self, template_path, tmp_path, sample_plan, barcode_png,
+                                  creation_count, expected_sheet):
+        """作成回数に応じたシートが選択状態になることを確認"""
+        sample_plan.creation_count = creation_count
+        output_path = str(tmp_path / 'patched.xlsm')
+
+        write_plan_xml_patch(template_path, output_path, sample_plan, barcode_png)
+
+        workbook = load_workbook(output_path)
+        active = workbook.active
+        assert active is not None
+        assert active.title == expected_sheet
+        assert [bool(ws.sheet_view.tabSelected) for ws in workbook.worksheets] == [
+            ws.title == expected_sheet for ws in workbook.worksheets]
+
+    def test_adds_barcode_to_plan_sheets(self, template_path, tmp_path, sample_plan, barcode_png):
+        """初回用・継続用の両シートにバーコードが貼られることを確認"""
+        output_path = str(tmp_path / 'patched.xlsm')
+
+        write_plan_xml_patch(template_path, output_path, sample_plan, barcode_png)
+
+        workbook = load_workbook(output_path)
+        # openpyxlの型スタブにはWorksheet._imagesがないのでgetattrで参照する
+        assert [len(getattr(ws, '_images')) for ws in workbook.worksheets] == [0, 1, 1]
+        with zipfile.ZipFile(output_path) as archive:
+            media = [name for name in archive.namelist() if name.startswith('xl/media/')]
+            assert len(media) == 1
+            assert archive.read(media[0]) == barcode_png
+
+    def test_copies_unchanged_parts_byte_for_byte(self, template_path, tmp_path, sample_plan, barcode_png):
+        """書き換え対象外のパーツがテンプレートと同一であることを確認"""
+        output_path = str(tmp_path / 'patched.xlsm')
+
+        write_plan_xml_patch(template_path, output_path, sample_plan, barcode_png)
+
+        with zipfile.ZipFile(template_path) as template, zipfile.ZipFile(output_path) as output:
+            for name in ('xl/vbaProject.bin', 'xl/sharedStrings.xml', 'xl/theme/theme1.xml',
+                         'xl/ctrlProps/ctrlProp1.xml', 'xl/drawings/vmlDrawing1.vml'):
+                assert output.read(name) == template.read(name), name
+            assert 'xl/calcChain.xml' not in output.namelist()
+            assert output.testzip() is None
+
+    def test_recompiles_when_template_changes(self, template_path, tmp_path, sample_plan, barcode_png):
+        """テンプレートが更新されたら再コンパイルされることを確認"""
+        output_path = str(tmp_path / 'patched.xlsm')
+        write_plan_xml_patch(template_path, output_path, sample_plan, barcode_png)
+        first = xlsm_patch_writer._compiled
+
+        stat = os.stat(template_path)
+        os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        write_plan_xml_patch(template_path, output_path, sample_plan, barcode_png)
+
+        assert xlsm_patch_writer._compiled is not first
+
+    def test_missing_cell_raises_error(self, template_path, tmp_path, barcode_png):
+        """テンプレートに存在しないセルを指定するとエラーになることを確認"""
+        layout = PatchLayout(
+            common_sheet="共通情報",
+            cells=("B2", "Z99"),
+            plan_sheets=("初回用", "継続用"),
+            image_anchor="B2",
+            image_size=(200, 30),
+        )
+
+        with pytest.raises(ValueError, match="Z99"):
+            write_plan(template_path, str(tmp_path / 'patched.xlsm'), layout, [1, 2], "初回用", barcode_png)
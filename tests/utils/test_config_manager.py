@@ -5,6 +5,7 @@ import tempfile
 from unittest.mock import patch
 
 import pytest
+from pydantic import ValidationError
 
 from utils import config_manager
 
@@ -278,6 +279,109 @@ class TestSaveConfig:
                 config_manager.save_config(config)
 
 
+MINIMAL_CONFIG = """[Database]
+db_url = sqlite:///test.db
+[Paths]
+template_path = C:\\test\\template.xlsm
+output_path = C:\\test\\output
+[FilePaths]
+patient_data = C:\\test\\pat.csv
+[Document]
+document_number = 39221
+"""
+
+
+class TestSettings:
+    """Settingsクラスのテスト"""
+
+    def parse(self, text):
+        config = configparser.ConfigParser()
+        config.read_string(text)
+        return config_manager.Settings.from_config(config)
+
+    def test_sections_are_typed(self):
+        """正常系: 値が型変換され、省略したセクションは既定値になる"""
+        settings = self.parse(MINIMAL_CONFIG + "[Barcode]\nwrite_text = false\nmodule_height = 12.5\n"
+                                               "[UI]\nfont_size = 15\n")
+
+        assert settings.database.db_url == 'sqlite:///test.db'
+        assert settings.paths.output_path == 'C:\\test\\output'
+        assert settings.barcode.write_text is False
+        assert settings.barcode.module_height == 12.5
+        assert settings.barcode.image_position == 'B2'
+        assert settings.ui.font_size == 15
+        assert settings.data_table.width == 1200
+        assert settings.document.plan_engine == 'openpyxl'
+
+    def test_settings_are_immutable(self):
+        """正常系: 読み込んだ設定は変更できない"""
+        settings = self.parse(MINIMAL_CONFIG)
+
+        with pytest.raises(ValidationError):
+            settings.ui.font_size = 20  # type: ignore[misc]
+
+    def test_invalid_value(self):
+        """異常系: 型や範囲が不正な値は検証エラーになる"""
+        with pytest.raises(ValidationError):
+            self.parse(MINIMAL_CONFIG + "[Barcode]\nimage_width = 広い\n")
+        with pytest.raises(ValidationError):
+            self.parse(MINIMAL_CONFIG.replace("document_number = 39221\n", "plan_engine = pdf\n"))
+
+    def test_missing_required_section(self):
+        """異常系: 必須セクションがなければ検証エラーになる"""
+        with pytest.raises(ValidationError):
+            self.parse(MINIMAL_CONFIG.replace("[Database]\ndb_url = sqlite:///test.db\n", ""))
+
+    def test_repository_config_is_valid(self):
+        """正常系: 同梱のconfig.iniが検証を通る"""
+        assert config_manager.get_settings().document.document_number == '39221'
+
+
+class TestGetSettings:
+    """get_settings関数のテスト"""
+
+    @pytest.fixture
+    def config_file(self, tmp_path, monkeypatch):
+        """一時設定ファイルを読み込み対象にし、キャッシュを空にする"""
+        path = tmp_path / 'config.ini'
+        path.write_text(MINIMAL_CONFIG, encoding='utf-8')
+        monkeypatch.setattr(config_manager, 'CONFIG_PATH', str(path))
+        monkeypatch.setattr(config_manager, '_settings', None)
+        monkeypatch.setattr(config_manager, '_settings_stamp', None)
+        return path
+
+    def test_parsed_once(self, config_file):
+        """正常系: ファイルが変わらなければ再解析しない"""
+        with patch.object(config_manager, 'load_config', wraps=config_manager.load_config) as mock_load:
+            settings = [config_manager.get_settings() for _ in range(5)]
+
+        assert mock_load.call_count == 1
+        assert all(item is settings[0] for item in settings)
+
+    def test_reloads_on_file_change(self, config_file):
+        """正常系: ファイルが更新されると読み直す"""
+        assert config_manager.get_settings().ui.font_size == 13
+
+        config_file.write_text(MINIMAL_CONFIG + "[UI]\nfont_size = 18\n", encoding='utf-8')
+
+        assert config_manager.get_settings().ui.font_size == 18
+
+    def test_explicit_reload(self, config_file):
+        """正常系: reload_settingsで変更の有無にかかわらず読み直す"""
+        first = config_manager.get_settings()
+
+        assert config_manager.reload_settings() is not first
+
+    def test_keeps_previous_settings_on_invalid_edit(self, config_file):
+        """異常系: 実行中に不正な内容へ更新されたら以前の設定を使い続ける"""
+        first = config_manager.get_settings()
+        config_file.write_text(MINIMAL_CONFIG + "[UI]\nfont_size = 大\n", encoding='utf-8')
+
+        assert config_manager.get_settings() is first
+        with pytest.raises(ValidationError):
+            config_manager.reload_settings()
+
+
 class TestConfigPathIntegration:
     """CONFIG_PATH定数の統合テスト"""
 
@@ -1,6 +1,10 @@
 import configparser
 import os
 import sys
+import threading
+from typing import Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 
 
 def get_config_path() -> str:
@@ -17,7 +21,6 @@ def get_config_path() -> str:
 CONFIG_PATH = get_config_path()
 
 
-
 def load_config() -> configparser.ConfigParser:
     config = configparser.ConfigParser()
     try:
@@ -45,3 +48,160 @@ def save_config(config: configparser.ConfigParser):
     except IOError as e:
         print(f"設定ファイルの保存中にエラーが発生しました: {e}")
         raise
+
+
+class _Section(BaseModel):
+    """config.iniのセクション（読み込み後は変更不可）"""
+
+    model_config = ConfigDict(frozen=True, extra='ignore')
+
+
+class DatabaseSettings(_Section):
+    db_url: str
+    # MySQLなどサーバー型のデータベースの接続プール
+    pool_size: int = Field(default=5, gt=0)
+    max_overflow: int = Field(default=10, ge=0)
+    pool_timeout: float = Field(default=30.0, gt=0)
+    pool_recycle: int = Field(default=3600, ge=-1)     # 秒（-1は再接続しない）。MySQLのwait_timeoutより短くする
+    pool_pre_ping: bool = False                        # 払い出しのたびに疎通確認する（往復が1回増える）
+    # SQLiteのPRAGMA（接続ごとに設定）。既定はファイルサーバー上のDBを複数端末から開ける設定
+    sqlite_journal_mode: Literal['WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'] = 'DELETE'
+    sqlite_synchronous: Literal['OFF', 'NORMAL', 'FULL', 'EXTRA'] = 'FULL'
+    sqlite_busy_timeout: int = Field(default=5000, ge=0)              # ミリ秒
+    sqlite_cache_size: int = -20000                                   # 負の値はKiB単位
+    sqlite_mmap_size: int = Field(default=0, ge=0)                    # バイト（0は使わない）
+    sqlite_temp_store: Literal['DEFAULT', 'FILE', 'MEMORY'] = 'MEMORY'
+
+
+class WindowSettings(_Section):
+    window_width: int = Field(default=1200, gt=0)
+    window_height: int = Field(default=900, gt=0)
+
+
+class UISettings(_Section):
+    input_height: int = Field(default=60, gt=0)
+    text_height: int = Field(default=60, gt=0)
+    font_size: int = Field(default=13, gt=0)
+    heading_font_size: int = Field(default=16, gt=0)
+    worker_threads: int = Field(default=4, gt=0)  # 画面操作のDB・ファイル処理を実行するスレッド数
+
+
+class DataTableSettings(_Section):
+    width: int = Field(default=1200, gt=0)
+    page_size: int = Field(default=50, gt=0)  # 患者履歴を一度に読み込む件数
+
+
+class PathsSettings(_Section):
+    template_path: str
+    output_path: str
+
+
+class FilePathsSettings(_Section):
+    patient_data: str
+    export_folder: str = ""
+    manual_pdf: str = ""
+
+
+class RosterSettings(_Section):
+    max_rows: int = Field(default=0, ge=0)             # 0は全件
+    chunk_size: int = Field(default=10000, gt=0)
+    compiled_path: str = ""                            # 空はコンパイルしない
+
+
+class FileMonitorSettings(_Section):
+    debounce_seconds: float = Field(default=0.5, ge=0)
+    backend: Literal['watchdog', 'polling'] = 'watchdog'
+    poll_interval: float = Field(default=1.0, gt=0)
+    max_poll_interval: float = Field(default=8.0, gt=0)
+
+
+class BarcodeSettings(_Section):
+    write_text: bool = False
+    module_height: float = Field(default=15, gt=0)
+    module_width: float = Field(default=0.25, gt=0)
+    quiet_zone: int = Field(default=1, ge=0)
+    image_width: int = Field(default=200, gt=0)
+    image_height: int = Field(default=30, gt=0)
+    image_position: str = "B2"
+    cache_size: int = Field(default=64, ge=0)
+
+
+class DocumentSettings(_Section):
+    document_number: str
+    plan_engine: Literal['openpyxl', 'xml_patch'] = 'openpyxl'
+    reuse_generated: bool = True
+
+
+class ExportSettings(_Section):
+    chunk_size: int = Field(default=1000, gt=0)  # データベースから1回に受け取ってCSVへ書き込む行数
+
+
+class ImportSettings(_Section):
+    batch_size: int = Field(default=1000, gt=0)  # 1回のINSERT・コミットで取り込む行数
+
+
+class TimingSettings(_Section):
+    log_path: str = ""
+    max_bytes: int = Field(default=1_048_576, ge=0)
+    backup_count: int = Field(default=5, ge=0)
+    history_size: int = Field(default=200, gt=0)
+
+
+class Settings(_Section):
+    """config.iniを型付きで検証した設定"""
+
+    model_config = ConfigDict(frozen=True, extra='ignore', populate_by_name=True)
+
+    database: DatabaseSettings = Field(alias='Database')
+    window: WindowSettings = Field(default_factory=WindowSettings, alias='settings')
+    ui: UISettings = Field(default_factory=UISettings, alias='UI')
+    data_table: DataTableSettings = Field(default_factory=DataTableSettings, alias='DataTable')
+    paths: PathsSettings = Field(alias='Paths')
+    file_paths: FilePathsSettings = Field(alias='FilePaths')
+    roster: RosterSettings = Field(default_factory=RosterSettings, alias='Roster')
+    file_monitor: FileMonitorSettings = Field(default_factory=FileMonitorSettings, alias='FileMonitor')
+    barcode: BarcodeSettings = Field(default_factory=BarcodeSettings, alias='Barcode')
+    document: DocumentSettings = Field(alias='Document')
+    timing: TimingSettings = Field(default_factory=TimingSettings, alias='Timing')
+    csv_export: ExportSettings = Field(default_factory=ExportSettings, alias='Export')
+    csv_import: ImportSettings = Field(default_factory=ImportSettings, alias='Import')
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser) -> "Settings":
+        """ConfigParserの内容を検証して設定を作成"""
+        return cls.model_validate({section: dict(config[section]) for section in config.sections()})
+
+
+_settings: Optional[Settings] = None
+_settings_stamp: Optional[tuple[int, int]] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings(reload: bool = False) -> Settings:
+    """プロセス共通の設定を取得（config.iniは初回・ファイル更新時・reload指定時のみ解析）"""
+    global _settings, _settings_stamp
+    with _settings_lock:
+        stamp = _config_stamp()
+        if reload or _settings is None or stamp != _settings_stamp:
+            try:
+                _settings = Settings.from_config(load_config())
+            except (OSError, configparser.Error, ValidationError) as e:
+                # 実行中に編集途中のファイルを読んだ場合は、以前の設定で動き続ける
+                if reload or _settings is None:
+                    raise
+                print(f"設定ファイルを再読み込みできません。以前の設定を使用します: {e}")
+            _settings_stamp = stamp
+        return _settings
+
+
+def reload_settings() -> Settings:
+    """config.iniを読み直して設定を更新"""
+    return get_settings(reload=True)
+
+
+def _config_stamp() -> Optional[tuple[int, int]]:
+    try:
+        stat = os.stat(CONFIG_PATH)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size